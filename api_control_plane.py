@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import os
@@ -5,12 +6,27 @@ from typing import List, Optional, Union, Any
 
 import toml
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, Depends
 from starlette.responses import JSONResponse
 
 
 from src.control_plane.main import ControlPlane, CP_Spec
+from src.control_plane.clients.base import client_sessions_lifespan
 from src.config import Config
+from src.generic.damping import DampingSpec
+from src.generic.metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    Gauge,
+    MetricSnapshot,
+    http_metrics_middleware,
+)
+from src.generic.etag import etag_matches, not_modified
+from src.generic.streaming import route_events_response
+from src.generic.paging import VARY, RouteQuery
+from src.generic.batch import router as batch_router
+from src.generic.profiling import router as profiling_router
+from src.generic.tracing import TRACER, SpanSpec, tracing_middleware, breakdown
 from src.fp_interface import ForwardingPlane
 from src.system import generate_id
 from src.generic.rib import Route
@@ -33,6 +49,12 @@ log = logging.getLogger(__name__)
 log.info("starting api_control_plane")
 log.debug(f"CONTROL_PLANE_CONFIG: {CONTROL_PLANE_CONFIG}")
 
+TRACER.configure(
+    "control_plane",
+    buffer_size=CONTROL_PLANE_CONFIG.get("trace_buffer_size", 10000),
+    jsonl_path=CONTROL_PLANE_CONFIG.get("trace_jsonl"),
+)
+
 
 def _render_output(output: object):
     if isinstance(output, dict):
@@ -63,35 +85,101 @@ def get_protocol_instance(instance_id: str) -> ControlPlane:
     return rslt
 
 
-app = FastAPI()
+app = FastAPI(lifespan=client_sessions_lifespan)
+app.middleware("http")(http_metrics_middleware)
+app.middleware("http")(tracing_middleware)
+app.include_router(profiling_router)
+app.include_router(batch_router)
+
+RIB_ROUTES = Gauge(
+    "pyrp_rib_routes", "Routes in each table of each instance", ["instance", "table"]
+)
+RIB_ROUTES.set_function(
+    lambda: {
+        (instance_id, table): size
+        for instance_id, instance in protocol_instances.items()
+        for table, size in instance.table_sizes.items()
+    }
+)
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Service": "ControlPlane"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/metrics/summary")
+async def get_metrics_summary() -> dict[str, MetricSnapshot]:
+    """the metrics as JSON, for the monitor's dashboard"""
+    return REGISTRY.snapshot()
+
+
+@app.get("/traces")
+async def get_traces(
+    trace_id: Optional[str] = None, name: Optional[str] = None, limit: int = 100
+) -> list[SpanSpec]:
+    return TRACER.buffer.query(trace_id=trace_id, name=name, limit=limit)
+
+
+@app.get("/traces/{trace_id}")
+async def get_trace_breakdown(trace_id: str, limit: int = 1000):
+    """collects the spans of a trace from this service and the protocol services of every instance,
+    and returns them as a tree with per-hop timings"""
+    peers = {}
+    for instance in protocol_instances.values():
+        if instance.rp_sla_enabled:
+            peers[instance.rp_sla_client.base_url] = instance.rp_sla_client
+        if instance.rp_rip1_enabled:
+            peers[instance.rp_rip1_client.base_url] = instance.rp_rip1_client
+
+    spans = TRACER.buffer.query(trace_id=trace_id, limit=limit)
+    remote_spans = await asyncio.gather(
+        *(client.get_traces(trace_id=trace_id, limit=limit) for client in peers.values()),
+        return_exceptions=True,
+    )
+    unreachable = []
+    for base_url, rslt in zip(peers, remote_spans):
+        if isinstance(rslt, Exception):
+            log.warning(f"could not fetch trace {trace_id} from {base_url}: {rslt}")
+            unreachable.append(base_url)
+            continue
+        spans.extend(rslt)
+
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"trace {trace_id} not found")
+    return {
+        "trace_id": trace_id,
+        "spans": breakdown(spans),
+        "unreachable": unreachable,
+    }
+
+
 @app.get("/instances")
-def get_instances() -> dict[str, CP_Spec]:
+async def get_instances() -> dict[str, CP_Spec]:
     return {k: v.as_json for k, v in protocol_instances.items()}
 
 
 @app.get("/instances/{instance_id}")
-def get_protocol(instance_id: str) -> CP_Spec:
+async def get_protocol(instance_id: str) -> CP_Spec:
     rslt = get_protocol_instance(instance_id)
     return rslt.as_json
 
 
 @app.post("/instances/new_from_config")
-def create_instance_from_config(filename: str):
+async def create_instance_from_config(filename: str):
     config = Config()
     try:
-        config.load(filename)
+        await asyncio.to_thread(config.load, filename)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="config file not found")
 
     instance_id = generate_id()
-    protocol_instances[instance_id] = ControlPlane.from_config(
+    protocol_instances[instance_id] = await ControlPlane.from_config(
         config, instance_id=instance_id
     )
     global LATEST_INSTANCE_ID
@@ -99,8 +187,26 @@ def create_instance_from_config(filename: str):
     return {instance_id: protocol_instances[instance_id].as_json}
 
 
+@app.post("/instances/{instance_id}/reload")
+async def reload_instance(instance_id: str, filename: Optional[str] = None):
+    """reload applies config changes to the running instance, instead of building a new one like new_from_config"""
+    instance = get_protocol_instance(instance_id)
+    if filename is None:
+        filename = instance.config.filename
+
+    config = Config()
+    try:
+        await asyncio.to_thread(config.load, filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="config file not found")
+
+    if instance_id == "latest":
+        instance_id = LATEST_INSTANCE_ID
+    return await instance.reload(config, instance_id=instance_id)
+
+
 @app.delete("/instances/{instance_id}")
-def delete_instance(instance_id: str):
+async def delete_instance(instance_id: str):
     global LATEST_INSTANCE_ID
     if instance_id == "latest":
         instance_id = LATEST_INSTANCE_ID
@@ -109,35 +215,61 @@ def delete_instance(instance_id: str):
     elif LATEST_INSTANCE_ID == instance_id:
         LATEST_INSTANCE_ID = None
 
-    protocol_instances.pop(instance_id, None)
+    instance = protocol_instances.pop(instance_id, None)
+    if instance is not None:
+        await instance.close()
     return {"instance_id": instance_id}
 
 
 @app.get("/instances/{instance_id}/routes")
-def get_routes(instance_id: str):
+async def get_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+):
     instance = get_protocol_instance(instance_id)
-    rslt = [route.as_json for route in instance.rib_routes]
-    return rslt
+    etag = query.etag(request, instance.rib_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, vary=VARY)
+    return query.respond(request, response, instance.rib, etag)
+
+
+@app.get("/instances/{instance_id}/routes/events")
+async def get_route_events(instance_id: str, request: Request):
+    """follow the RIB as server-sent events: a snapshot, then the changes as they happen"""
+    get_protocol_instance(instance_id)  # a 404 now, rather than an empty stream
+    return route_events_response(lambda: get_protocol_instance(instance_id).rib, request)
 
 
 @app.get("/instances/{instance_id}/routes/static")
-def get_static_routes(instance_id: str):
+async def get_static_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+):
     instance = get_protocol_instance(instance_id)
-    rslt = [route.as_json for route in instance.static_routes]
-    return rslt
+    return query.respond(request, response, instance.static_routes)
+
+
+@app.get("/instances/{instance_id}/damping")
+async def get_damping(instance_id: str) -> list[DampingSpec]:
+    instance = get_protocol_instance(instance_id)
+    return instance.damping
 
 
 @app.post("/instances/{instance_id}/redistribute")
-def redistribute(instance_id: str):
+async def redistribute(instance_id: str):
     instance = get_protocol_instance(instance_id)
-    instance.redistribute()
+    await instance.redistribute()
     return instance.as_json
 
 
 @app.post("/instances/{instance_id}/routes/rib/refresh")
-def refresh_rib(instance_id: str):
+async def refresh_rib(instance_id: str):
     instance = get_protocol_instance(instance_id)
-    instance.refresh_rib()
+    await instance.refresh_rib()
     return [route.as_json for route in instance.rib_routes]
 
 
@@ -149,10 +281,17 @@ async def evaluate_routes(instance_id: str):
 
 
 @app.get("/instances/{instance_id}/best_routes")
-def get_best_routes(instance_id: str):
+async def get_best_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+):
     instance = get_protocol_instance(instance_id)
-    rslt = instance.export_routes()
-    return [route.as_json for route in rslt]
+    etag = query.etag(request, *instance.best_routes_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, vary=VARY)
+    return query.respond(request, response, instance.export_routes(), etag)
 
 
 if __name__ == "__main__":
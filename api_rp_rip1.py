@@ -3,11 +3,26 @@ import os
 from typing import Optional
 
 import toml
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response, Depends
 
 from src.fp_interface import ForwardingPlane
 from src.generic.rib import RedistributeInRouteSpec, RedistributeOutRouteSpec
+from src.generic.damping import DampingSpec
+from src.generic.metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    Gauge,
+    MetricSnapshot,
+    http_metrics_middleware,
+)
+from src.generic.etag import etag_matches, not_modified
+from src.generic.streaming import route_events_response
+from src.generic.paging import VARY, RouteQuery
+from src.generic.batch import router as batch_router
+from src.generic.profiling import router as profiling_router
+from src.generic.tracing import TRACER, SpanSpec, tracing_middleware
 from src.config import Config
+from src.control_plane.clients.base import client_sessions_lifespan
 from src.rp_rip1.main import RP_RIP1_Interface, RIP1_RPSpec, RIP1_FullRPSpec
 from src.system import generate_id
 
@@ -31,6 +46,12 @@ log = logging.getLogger(__name__)
 log.info("starting api_rp_rip1")
 log.debug(f"RP_RIP1_CONFIG: {RP_RIP1_CONFIG}")
 
+TRACER.configure(
+    "rp_rip1",
+    buffer_size=RP_RIP1_CONFIG.get("trace_buffer_size", 10000),
+    jsonl_path=RP_RIP1_CONFIG.get("trace_jsonl"),
+)
+
 
 def get_protocol_instance(instance_id: str) -> RP_RIP1_Interface:
     if instance_id == "latest":
@@ -46,7 +67,22 @@ def get_protocol_instance(instance_id: str) -> RP_RIP1_Interface:
     return rslt
 
 
-app = FastAPI()
+app = FastAPI(lifespan=client_sessions_lifespan)
+app.middleware("http")(http_metrics_middleware)
+app.middleware("http")(tracing_middleware)
+app.include_router(profiling_router)
+app.include_router(batch_router)
+
+RIB_ROUTES = Gauge(
+    "pyrp_rib_routes", "Routes in each table of each instance", ["instance", "table"]
+)
+RIB_ROUTES.set_function(
+    lambda: {
+        (instance_id, table): size
+        for instance_id, instance in protocol_instances.items()
+        for table, size in instance.table_sizes.items()
+    }
+)
 
 
 @app.get("/")
@@ -54,6 +90,24 @@ def read_root():
     return {"Service": "RP_RIP1"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/metrics/summary")
+async def get_metrics_summary() -> dict[str, MetricSnapshot]:
+    """the metrics as JSON, for the monitor's dashboard"""
+    return REGISTRY.snapshot()
+
+
+@app.get("/traces")
+async def get_traces(
+    trace_id: Optional[str] = None, name: Optional[str] = None, limit: int = 100
+) -> list[SpanSpec]:
+    return TRACER.buffer.query(trace_id=trace_id, name=name, limit=limit)
+
+
 @app.get("/instances")
 async def get_instances() -> dict[str, RIP1_RPSpec]:
     return {k: v.as_json for k, v in protocol_instances.items()}
@@ -87,9 +141,23 @@ async def create_instance_from_config(filename: str, cp_id: Optional[str] = None
     return {"instance_id": instance_id}
 
 
+@app.post("/instances/{instance_id}/reload")
+async def reload_instance(instance_id: str, filename: str):
+    instance = get_protocol_instance(instance_id)
+    config = Config()
+    try:
+        config.load(filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="config file not found")
+
+    return instance.reload(config)
+
+
 @app.delete("/instances/{instance_id}")
 async def delete_instance(instance_id: str):
-    protocol_instances.pop(instance_id, None)
+    instance = protocol_instances.pop(instance_id, None)
+    if instance is not None:
+        await instance.close()
     global LATEST_INSTANCE_ID
     if LATEST_INSTANCE_ID == instance_id:
         LATEST_INSTANCE_ID = None
@@ -97,10 +165,44 @@ async def delete_instance(instance_id: str):
 
 
 @app.get("/instances/{instance_id}/routes/rib")
-async def get_rib_routes(instance_id: str):
+async def get_rib_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+):
     instance = get_protocol_instance(instance_id)
-    rslt = [route.as_json for route in instance.rib_routes]
-    return rslt
+    etag = query.etag(request, instance.rib_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, vary=VARY)
+    return query.respond(request, response, instance.rib, etag)
+
+
+@app.get("/instances/{instance_id}/routes/rib/events")
+async def get_route_events(instance_id: str, request: Request):
+    """follow the RIB as server-sent events: a snapshot, then the changes as they happen"""
+    get_protocol_instance(instance_id)  # a 404 now, rather than an empty stream
+    return route_events_response(lambda: get_protocol_instance(instance_id).rib, request)
+
+
+@app.get("/instances/{instance_id}/best_routes")
+async def get_best_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+):
+    instance = get_protocol_instance(instance_id)
+    etag = query.etag(request, *instance.best_routes_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, vary=VARY)
+    return query.respond(request, response, instance.best_routes(), etag)
+
+
+@app.get("/instances/{instance_id}/damping")
+async def get_damping(instance_id: str) -> list[DampingSpec]:
+    instance = get_protocol_instance(instance_id)
+    return instance.damping
 
 
 @app.post("/instances/{instance_id}/redistribute_in")
@@ -5,7 +5,7 @@ from typing import List, Optional, Union, Any
 
 import toml
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, Depends
 from starlette.responses import JSONResponse
 
 from src.rp_sla.main import SLA_RouteSpec
@@ -14,6 +14,20 @@ from src.fp_interface import ForwardingPlane
 from src.rp_sla import RP_SLA
 from src.system import generate_id
 from src.generic.rib import Route, RedistributeOutRouteSpec
+from src.generic.damping import DampingSpec
+from src.generic.metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    Gauge,
+    MetricSnapshot,
+    http_metrics_middleware,
+)
+from src.generic.etag import etag_matches, not_modified
+from src.generic.streaming import route_events_response
+from src.generic.paging import VARY, RouteQuery, RoutePage
+from src.generic.batch import router as batch_router
+from src.generic.profiling import router as profiling_router
+from src.generic.tracing import TRACER, SpanSpec, tracing_middleware
 
 BASE_CONFIG = toml.load("config.toml")
 RP_SLA_CONFIG = BASE_CONFIG["api_rp_sla"]
@@ -34,6 +48,12 @@ log = logging.getLogger(__name__)
 log.info("starting api_rp_sla")
 log.debug(f"RP_SLA_CONFIG: {RP_SLA_CONFIG}")
 
+TRACER.configure(
+    "rp_sla",
+    buffer_size=RP_SLA_CONFIG.get("trace_buffer_size", 10000),
+    jsonl_path=RP_SLA_CONFIG.get("trace_jsonl"),
+)
+
 
 def _render_output(output: object):
     if isinstance(output, dict):
@@ -65,6 +85,21 @@ def get_protocol_instance(instance_id: str) -> RP_SLA:
 
 
 app = FastAPI()
+app.middleware("http")(http_metrics_middleware)
+app.middleware("http")(tracing_middleware)
+app.include_router(profiling_router)
+app.include_router(batch_router)
+
+RIB_ROUTES = Gauge(
+    "pyrp_rib_routes", "Routes in each table of each instance", ["instance", "table"]
+)
+RIB_ROUTES.set_function(
+    lambda: {
+        (instance_id, table): size
+        for instance_id, instance in protocol_instances.items()
+        for table, size in instance.table_sizes.items()
+    }
+)
 
 
 @app.get("/")
@@ -72,6 +107,24 @@ def read_root():
     return {"Service": "RP_SLA"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/metrics/summary")
+async def get_metrics_summary() -> dict[str, MetricSnapshot]:
+    """the metrics as JSON, for the monitor's dashboard"""
+    return REGISTRY.snapshot()
+
+
+@app.get("/traces")
+async def get_traces(
+    trace_id: Optional[str] = None, name: Optional[str] = None, limit: int = 100
+) -> list[SpanSpec]:
+    return TRACER.buffer.query(trace_id=trace_id, name=name, limit=limit)
+
+
 @app.get("/instances")
 def get_instances():
     return {k: v.as_json for k, v in protocol_instances.items()}
@@ -112,6 +165,18 @@ def create_instance_from_config(filename: str, cp_id: Optional[str] = None):
     return {"instance_id": instance_id}
 
 
+@app.post("/instances/{instance_id}/reload")
+def reload_instance(instance_id: str, filename: str):
+    instance = get_protocol_instance(instance_id)
+    config = Config()
+    try:
+        config.load(filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="config file not found")
+
+    return instance.reload(config)
+
+
 @app.delete("/instances/{instance_id}")
 def delete_instance(instance_id: str):
     global LATEST_INSTANCE_ID
@@ -121,22 +186,62 @@ def delete_instance(instance_id: str):
     elif LATEST_INSTANCE_ID == instance_id:
         LATEST_INSTANCE_ID = None
 
-    protocol_instances.pop(instance_id, None)
+    instance = protocol_instances.pop(instance_id, None)
+    if instance is not None:
+        instance.fp.close()
     return {"instance_id": instance_id}
 
 
 @app.get("/instances/{instance_id}/routes/rib")
-def get_rib_routes(instance_id: str) -> List[SLA_RouteSpec]:
+def get_rib_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+) -> List[SLA_RouteSpec] | RoutePage:
     instance = get_protocol_instance(instance_id)
-    rslt = [route.as_json for route in instance.rib_routes]
-    return rslt
+    etag = query.etag(request, instance.rib_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, vary=VARY)
+    return query.respond(request, response, instance.rib, etag)
+
+
+@app.get("/instances/{instance_id}/routes/rib/events")
+async def get_route_events(instance_id: str, request: Request):
+    """follow the RIB as server-sent events: a snapshot, then the changes as they happen"""
+    get_protocol_instance(instance_id)  # a 404 now, rather than an empty stream
+    return route_events_response(lambda: get_protocol_instance(instance_id).rib, request)
+
+
+@app.get("/instances/{instance_id}/best_routes")
+def get_best_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+) -> List[SLA_RouteSpec] | RoutePage:
+    instance = get_protocol_instance(instance_id)
+    etag = query.etag(request, *instance.best_routes_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, vary=VARY)
+    return query.respond(request, response, instance.best_routes(), etag)
+
+
+@app.get("/instances/{instance_id}/damping")
+def get_damping(instance_id: str) -> List[DampingSpec]:
+    instance = get_protocol_instance(instance_id)
+    return instance.damping
 
 
 @app.get("/instances/{instance_id}/routes/configured")
-def get_configured_routes(instance_id: str) -> List[SLA_RouteSpec]:
+def get_configured_routes(
+    instance_id: str,
+    request: Request,
+    response: Response,
+    query: RouteQuery = Depends(),
+) -> List[SLA_RouteSpec] | RoutePage:
     instance = get_protocol_instance(instance_id)
-    rslt = [route.as_json for route in instance.configured_routes]
-    return rslt
+    return query.respond(request, response, instance.configured_routes)
 
 
 @app.post("/instances/{instance_id}/routes/new")
@@ -167,9 +272,9 @@ def delete_route(
 
 
 @app.post("/instances/{instance_id}/evaluate_routes")
-def evaluate_routes(instance_id: str):
+async def evaluate_routes(instance_id: str):
     instance = get_protocol_instance(instance_id)
-    instance.evaluate_routes()
+    await instance.evaluate_routes()
     return instance.as_json
 
 
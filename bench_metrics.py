@@ -0,0 +1,76 @@
+"""
+Benchmark for the overhead of the metrics in src/generic/metrics.py.
+
+Times each kind of metric update on its own, and compares it with a real unit of hot-path work: parsing a full
+25-route RIP response.  Run with:
+
+    python bench_metrics.py
+"""
+import timeit
+
+import dpkt
+
+from src.generic.metrics import Counter, Histogram, Registry
+from src.rp_rip1.codec import decode
+from src.rp_rip1.main import RP_RIP1
+
+NUMBER = 200_000
+
+
+def rip_response(route_count: int = 25) -> bytes:
+    rip = dpkt.rip.RIP()
+    rip.cmd = dpkt.rip.RESPONSE
+    rip.v = 1
+    rip.auth = None
+    rtes = []
+    for i in range(route_count):
+        rte = dpkt.rip.RTE()
+        rte.family = 2
+        rte.addr = (10 << 24) + (i << 16)
+        rte.next_hop = 0
+        rte.metric = 1
+        rtes.append(rte)
+    rip.rtes = rtes
+    return bytes(rip)
+
+
+def bench(label: str, stmt, number: int = NUMBER) -> float:
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5)) / number
+    print(f"{label:<40} {seconds * 1e9:>10.0f} ns/op")
+    return seconds
+
+
+def main():
+    registry = Registry()
+    counter = Counter("bench_total", "bench", registry=registry)
+    labelled = Counter("bench_labelled_total", "bench", ["a", "b"], registry=registry)
+    child = labelled.labels("x", "y")
+    histogram = Histogram("bench_seconds", "bench", registry=registry)
+
+    def timed_block():
+        with histogram.time():
+            pass
+
+    baseline = bench("empty call", lambda: None)
+    bench("Counter.inc", counter.inc)
+    bench("Counter.labels(...).inc", lambda: labelled.labels("x", "y").inc())
+    bench("pre-bound labelled child .inc", child.inc)
+    observe = bench("Histogram.observe", lambda: histogram.observe(0.003))
+    timer = bench("Histogram.time() block", timed_block)
+
+    rtes = decode(rip_response()).rtes
+    src = ("10.0.0.1", 520)
+    parse = bench(
+        "RP_RIP1.handle_response (25 RTEs)",
+        lambda: RP_RIP1.handle_response(rtes, src),
+        number=2_000,
+    )
+    print()
+    print(
+        f"a timed block plus a histogram observation costs {(timer + observe - 2 * baseline) / parse:.2%} "
+        f"of parsing one 25-route RIP response"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark for the RIPv1 codec in src/rp_rip1/codec.py, against the dpkt code it replaced.
+
+Reports full 25-route response packets per second for each direction:
+* receiving: parsing a packet into classful RIP1_Routes (RP_RIP1.handle_response), and dpkt.rip.RIP plus building an
+  ipaddress network per entry and truncating it with RIP1_Route.classful, as RP_RIP1 used to
+* sending: RIP1_ResponsePacker, and building the same packet out of dpkt objects
+* a whole 10k-route table, as RP_RIP1 sends it on each advertisement interval: exporting and packing it, and
+  handing over the cached packets of its RIP1_Advertisement
+
+Run with:
+
+    python bench_rip_codec.py
+"""
+import ipaddress
+import socket
+import timeit
+
+import dpkt
+
+from src.rp_rip1.codec import RIP1_ResponsePacker, RIP_MAX_METRIC, RIP_MAX_RTES, decode
+from src.rp_rip1.main import RIP1_Route, RP_RIP1, RP_RIP1_Interface
+from src.system import RouteStatus
+
+NUMBER = 2_000
+SRC = ("10.0.0.1", 520)
+SRC_HOP = ipaddress.ip_address(SRC[0])
+
+
+def routes(route_count: int = RIP_MAX_RTES) -> list[RIP1_Route]:
+    return [
+        RIP1_Route(ipaddress.ip_network(f"{10 + i}.0.0.0/8"), ipaddress.ip_address("1.1.1.1"), 1)
+        for i in range(route_count)
+    ]
+
+
+def dpkt_response(routes: list[RIP1_Route]) -> bytes:
+    rip = dpkt.rip.RIP()
+    rip.cmd = dpkt.rip.RESPONSE
+    rip.v = 1
+    rip.rsvd = 0
+    rip.auth = None
+    rtes = []
+    for route in routes:
+        rte = dpkt.rip.RTE()
+        rte.family = socket.AF_INET
+        rte.addr = int(route.prefix.network_address)
+        rte.next_hop = int(ipaddress.ip_address("0.0.0.0"))
+        rte.metric = min(route.metric + 1, RIP_MAX_METRIC)
+        rtes.append(rte)
+    rip.rtes = rtes
+    return bytes(rip)
+
+
+def dpkt_parse(data: bytes) -> list[RIP1_Route]:
+    src_ip, _ = SRC
+    rslt = []
+    for rte in dpkt.rip.RIP(data).rtes:
+        route = RIP1_Route(
+            prefix=ipaddress.ip_network(ipaddress.ip_address(rte.addr)),
+            next_hop=ipaddress.ip_address(rte.next_hop),
+            metric=rte.metric,
+        ).classful
+        route.status = RouteStatus.DOWN if route.metric >= RIP_MAX_METRIC else RouteStatus.UP
+        if route.next_hop == ipaddress.ip_address("0.0.0.0"):
+            route.next_hop = ipaddress.ip_address(src_ip)
+        rslt.append(route)
+    return rslt
+
+
+def pps(label: str, stmt) -> float:
+    seconds = min(timeit.repeat(stmt, number=NUMBER, repeat=5)) / NUMBER
+    print(f"{label:<40} {1 / seconds:>12,.0f} packets/s")
+    return seconds
+
+
+def main():
+    table = routes()
+    data = dpkt_response(table)
+    packer = RIP1_ResponsePacker()
+    assert bytes(next(packer.packets(table))) == data
+
+    print("receiving a 25-route response")
+    old = pps("  dpkt + ipaddress + classful", lambda: dpkt_parse(data))
+    new = pps("  codec.decode + handle_response", lambda: RP_RIP1.handle_response(decode(data).rtes, SRC))
+    print(f"  {old / new:.1f}x")
+    pps("  codec.decode alone", lambda: decode(data))
+
+    print("sending a 25-route response")
+    old = pps("  dpkt", lambda: dpkt_response(table))
+    new = pps("  RIP1_ResponsePacker", lambda: next(packer.packets(table)))
+    print(f"  {old / new:.1f}x")
+
+    print("sending a 10k-route table (400 packets)")
+    rp = RP_RIP1_Interface(fp=None)
+    for i in range(10_000):
+        route = RIP1_Route(ipaddress.ip_network(f"172.{16 + i // 256 % 16}.{i % 256}.0/24"), SRC_HOP, 1 + i % 3)
+        route.status = RouteStatus.UP
+        rp.rib.add(route)
+    old = tables("  export_routes + RIP1_ResponsePacker", lambda: list(packer_copies(packer, rp.export_routes())))
+    rp.advertisement()
+    new = tables("  RIP1_Advertisement.packets (cached)", lambda: rp.advertisement().packets())
+    print(f"  {old / new:.1f}x")
+
+
+def packer_copies(packer: RIP1_ResponsePacker, routes: list[RIP1_Route]):
+    # the packer's packets are views of one buffer, so they're copied here as a send would use them
+    return (bytes(packet) for packet in packer.packets(routes))
+
+
+def tables(label: str, stmt) -> float:
+    seconds = min(timeit.repeat(stmt, number=20, repeat=5)) / 20
+    print(f"{label:<40} {seconds * 1e3:>12,.2f} ms/table")
+    return seconds
+
+
+if __name__ == "__main__":
+    main()
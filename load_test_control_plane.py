@@ -0,0 +1,105 @@
+"""
+Load test for a running control plane.
+
+Runs a number of concurrent clients against the CP API for a fixed duration, each one issuing requests back to back,
+and reports throughput and latency percentiles.  Start the CP (and whatever protocols the config enables), create an
+instance, then:
+
+    python load_test_control_plane.py --clients 128 --duration 30
+
+By default only read endpoints are used.  Pass --redistribute to mix in POSTs to /redistribute, which fan out to the
+protocol services.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from itertools import cycle
+
+import aiohttp
+import toml
+
+BASE_CONFIG = toml.load("config.toml")
+CONTROL_PLANE_CONFIG = BASE_CONFIG["control_plane"]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_client(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    requests: list[tuple[str, str]],
+    deadline: float,
+    latencies: list[float],
+    errors: list[str],
+):
+    for method, path in cycle(requests):
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            async with session.request(method, base_url + path) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors.append(f"{method} {path}: {response.status}")
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(f"{method} {path}: {e}")
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def main(args):
+    requests = [
+        ("GET", f"/instances/{args.instance}"),
+        ("GET", f"/instances/{args.instance}/routes"),
+        ("GET", f"/instances/{args.instance}/best_routes"),
+    ]
+    if args.redistribute:
+        requests.append(("POST", f"/instances/{args.instance}/redistribute"))
+
+    latencies: list[float] = []
+    errors: list[str] = []
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(
+                run_client(session, args.base_url, requests, deadline, latencies, errors)
+                for _ in range(args.clients)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"clients:     {args.clients}")
+    print(f"duration:    {elapsed:.1f}s")
+    print(f"requests:    {len(latencies)} ok, {len(errors)} errors")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"latency p50: {percentile(latencies, 50) * 1000:.1f} ms")
+        print(f"latency p90: {percentile(latencies, 90) * 1000:.1f} ms")
+        print(f"latency p99: {percentile(latencies, 99) * 1000:.1f} ms")
+        print(f"latency max: {latencies[-1] * 1000:.1f} ms")
+        print(f"latency avg: {statistics.fmean(latencies) * 1000:.1f} ms")
+    for error in sorted(set(errors))[:10]:
+        print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--base-url",
+        default=f"http://{CONTROL_PLANE_CONFIG['listen_address']}:{CONTROL_PLANE_CONFIG['listen_port']}",
+    )
+    parser.add_argument("--instance", default="latest")
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--redistribute", action="store_true")
+    asyncio.run(main(parser.parse_args()))
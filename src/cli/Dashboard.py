@@ -0,0 +1,179 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import aiohttp
+from textual.app import ComposeResult
+from textual.containers import Horizontal, Vertical
+from textual.widgets import Static, Label, Sparkline
+
+from src.control_plane.clients.base import BaseClient
+
+# how often the services' metrics are read
+DASHBOARD_INTERVAL = 2.0
+# how many readings each sparkline shows
+HISTORY = 60
+
+HTTP_SECONDS = "pyrp_http_request_duration_seconds"
+
+Summary = dict[str, dict]
+Where = Callable[[dict], bool]
+
+
+def _samples(summary: Summary, name: str, where: Optional[Where] = None) -> list[dict]:
+    samples = summary.get(name, {}).get("samples", [])
+    if where is None:
+        return samples
+    return [sample for sample in samples if where(sample["labels"])]
+
+
+def _total(summary: Summary, name: str, field: str, where: Optional[Where] = None) -> float:
+    return sum(sample[field] for sample in _samples(summary, name, where))
+
+
+def _not_polling(labels: dict) -> bool:
+    # the dashboard's own requests would otherwise make an idle service look busy
+    return not labels.get("route", "").startswith("/metrics")
+
+
+def gauge(name: str, where: Optional[Where] = None):
+    """gauge will read the current value of a gauge, summed over its labels"""
+
+    def compute(previous: Summary, current: Summary, seconds: float) -> Optional[float]:
+        return _total(current, name, "value", where)
+
+    return compute
+
+
+def rate(name: str, where: Optional[Where] = None, field: str = "value"):
+    """rate will read how fast a counter (or a histogram's count, with field="count") went up, per second"""
+
+    def compute(previous: Summary, current: Summary, seconds: float) -> Optional[float]:
+        delta = _total(current, name, field, where) - _total(previous, name, field, where)
+        # a service that restarted starts its counters over
+        return max(delta, 0) / seconds
+
+    return compute
+
+
+def mean_ms(name: str, where: Optional[Where] = None):
+    """mean_ms will read the mean of a histogram's observations since the last reading, in milliseconds.  It is None
+    if there weren't any."""
+
+    def compute(previous: Summary, current: Summary, seconds: float) -> Optional[float]:
+        count = _total(current, name, "count", where) - _total(previous, name, "count", where)
+        if count <= 0:
+            return None
+        return 1000 * (_total(current, name, "sum", where) - _total(previous, name, "sum", where)) / count
+
+    return compute
+
+
+@dataclass
+class Series:
+    title: str
+    compute: Callable[[Summary, Summary, float], Optional[float]]
+    format: str = "{:.1f}"
+
+
+SERVICE_SERIES = {
+    "Control Plane": [
+        Series("requests/s", rate(HTTP_SECONDS, _not_polling, "count")),
+        Series("latency ms", mean_ms(HTTP_SECONDS, _not_polling), "{:.2f}"),
+        Series("RIB routes", gauge("pyrp_rib_routes", lambda labels: labels["table"] == "rib"), "{:.0f}"),
+        Series("churn routes/s", rate("pyrp_cp_route_changes_total")),
+        Series("redistribute ms", mean_ms("pyrp_cp_redistribute_seconds"), "{:.2f}"),
+    ],
+    "SLA": [
+        Series("requests/s", rate(HTTP_SECONDS, _not_polling, "count")),
+        Series("latency ms", mean_ms(HTTP_SECONDS, _not_polling), "{:.2f}"),
+        Series("RIB routes", gauge("pyrp_rib_routes", lambda labels: labels["table"] == "rib"), "{:.0f}"),
+        Series("churn routes/s", rate("pyrp_sla_route_changes_total")),
+        Series("probe RTT ms", mean_ms("pyrp_sla_probe_rtt_seconds"), "{:.2f}"),
+    ],
+    "RIP": [
+        Series("requests/s", rate(HTTP_SECONDS, _not_polling, "count")),
+        Series("latency ms", mean_ms(HTTP_SECONDS, _not_polling), "{:.2f}"),
+        Series("RIB routes", gauge("pyrp_rib_routes", lambda labels: labels["table"] == "rib"), "{:.0f}"),
+        Series("churn routes/s", rate("pyrp_rip_route_changes_total")),
+        Series("packets/s", rate("pyrp_rip_packets_total")),
+    ],
+}
+
+
+class ServicePanel(Vertical):
+    """ServicePanel shows one service's series, each as its latest value and a sparkline of its history"""
+
+    def __init__(self, service: str, series: list[Series], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.service = service
+        self.series = series
+        self.history = [deque([0.0] * HISTORY, maxlen=HISTORY) for _ in series]
+        self._previous: Optional[tuple[float, Summary]] = None
+
+    def compose(self) -> ComposeResult:
+        yield Label(self.service, classes="service")
+        for i, series in enumerate(self.series):
+            with Horizontal(classes="series"):
+                yield Label(f"{series.title}: -", id=f"value-{i}", classes="value")
+                yield Sparkline(list(self.history[i]), id=f"spark-{i}", summary_function=max)
+
+    def update_summary(self, summary: Optional[Summary], now: float):
+        """update_summary will add a reading: the service's metrics summary, or None if it couldn't be read"""
+        header: Label = self.query_one(".service")
+        if summary is None:
+            header.update(f"{self.service} (unreachable)")
+            self._previous = None
+            return
+        header.update(self.service)
+        if self._previous is None:
+            # rates need two readings
+            self._previous = now, summary
+            return
+
+        then, previous = self._previous
+        self._previous = now, summary
+        for i, series in enumerate(self.series):
+            value = series.compute(previous, summary, now - then)
+            text = "-" if value is None else series.format.format(value)
+            self.query_one(f"#value-{i}", Label).update(f"{series.title}: {text}")
+            self.history[i].append(value or 0.0)
+            self.query_one(f"#spark-{i}", Sparkline).data = list(self.history[i])
+
+
+class Dashboard(Static):
+    """Dashboard shows how each service is doing, from their /metrics/summary: a few numbers per service, read every
+    DASHBOARD_INTERVAL seconds, rather than anything that grows with the tables."""
+
+    def __init__(self, clients: dict[str, BaseClient], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clients = clients
+
+    def compose(self) -> ComposeResult:
+        with Horizontal():
+            for service in self.clients:
+                yield ServicePanel(service, SERVICE_SERIES[service], classes="panel")
+
+    def on_mount(self):
+        self.border_title = "Performance"
+        self._timer = self.set_interval(DASHBOARD_INTERVAL, self.update_data, pause=True)
+
+    def start(self):
+        self.run_worker(self.update_data(), group="dashboard")
+        self._timer.resume()
+
+    def stop(self):
+        self._timer.pause()
+
+    async def _read(self, client: BaseClient) -> Optional[Summary]:
+        try:
+            return await client.get_metrics_summary(timeout=DASHBOARD_INTERVAL)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def update_data(self):
+        summaries = await asyncio.gather(*(self._read(client) for client in self.clients.values()))
+        now = asyncio.get_running_loop().time()
+        for panel, summary in zip(self.query(ServicePanel), summaries):
+            panel.update_summary(summary, now)
@@ -0,0 +1,190 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from textual.app import ComposeResult
+from textual.reactive import Reactive
+from textual.widgets import Static, DataTable
+
+from .state import http_errors
+from .TitledTable import format_cell
+
+# routes fetched per request
+PAGE_SIZE = 200
+# pages held at once: the one in view and one either side of it, so memory doesn't grow with the table
+WINDOW_PAGES = 3
+# how close the view gets to either end of the loaded rows before the next page is fetched
+PREFETCH_ROWS = 50
+
+
+@dataclass
+class Page:
+    cursor: Optional[str]  # where the page starts, None for the start of the listing
+    routes: list[dict]
+    next_cursor: Optional[str]
+
+
+class PagedTable(Static):
+    """PagedTable shows a window of a large RIB, a few pages of it at a time.
+
+    Pages come from a paginated route listing (see src/generic/paging.py), fetched as the cursor or the scroll
+    position nears either end of what is loaded.  Pages that fall out of the window are dropped, keeping only their
+    cursor so they can be fetched again when scrolling back.  The listing can start at a prefix (jump) and be filtered
+    on the server.
+    """
+
+    title = Reactive("NO TITLE")
+    # a route listing, called with the paging and filter parameters, e.g. RpCpClient.get_rib_routes
+    fetch: Reactive[Optional[Callable[..., Awaitable[dict]]]] = Reactive(None)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.filters: dict = {}
+        # the prefix the listing starts at, if it was jumped to
+        self.start: Optional[str] = None
+        self._pages: list[Page] = []
+        # the cursors of the pages dropped off the top of the window, most recent last
+        self._above: list[Optional[str]] = []
+        self._columns: tuple[str, ...] = ()
+        self._loading = False
+
+    def compose(self) -> ComposeResult:
+        yield DataTable(id=f"{self.id}_table", classes="richtable", cursor_type="row")
+
+    def on_mount(self):
+        table = self.query_one(f"#{self.id}_table")
+        self.watch(table, "scroll_y", self._on_scroll, init=False)
+
+    def watch_title(self, title: str):
+        self.border_title = title
+
+    async def _fetch_page(self, cursor: Optional[str]) -> Page:
+        params = dict(self.filters)
+        if cursor is not None:
+            params["cursor"] = cursor
+        elif self.start is not None:
+            params["start"] = self.start
+        body = await self.fetch(limit=PAGE_SIZE, **params)
+        return Page(cursor, body["routes"], body["next_cursor"])
+
+    async def reload(self):
+        """reload will fetch the first page of the listing, dropping whatever was loaded"""
+        if self.fetch is None:
+            return
+        try:
+            page = await self._fetch_page(None)
+        except http_errors as e:
+            self.app.user_log(f"HTTP Error updating {self.title} data: {e}", "ERROR")
+            return
+        self._pages = [page]
+        self._above = []
+        self._draw(0, reset=True)
+
+    async def update_data(self):
+        """update_data will fetch the pages in the window again, keeping the view where it is"""
+        if not self._pages:
+            await self.reload()
+            return
+        try:
+            pages = [await self._fetch_page(page.cursor) for page in self._pages]
+        except http_errors as e:
+            self.app.user_log(f"HTTP Error updating {self.title} data: {e}", "ERROR")
+            return
+        self._pages = pages
+        self._draw(0)
+
+    async def jump(self, prefix: Optional[str]):
+        """jump will start the listing at prefix (or the next prefix after it in the table), or at the top"""
+        self.start = prefix
+        await self.reload()
+
+    async def set_filters(self, **filters):
+        """set_filters will list only the routes matching filters (the filters of RouteQuery), from the top"""
+        self.filters = {name: value for name, value in filters.items() if value is not None}
+        self.start = None
+        await self.reload()
+
+    def clear(self):
+        self._pages = []
+        self._above = []
+        self.query_one(f"#{self.id}_table").clear()
+
+    async def _load_next(self):
+        page = await self._fetch_page(self._pages[-1].next_cursor)
+        self._pages.append(page)
+        shift = 0
+        if len(self._pages) > WINDOW_PAGES:
+            dropped = self._pages.pop(0)
+            self._above.append(dropped.cursor)
+            shift = -len(dropped.routes)
+        self._draw(shift)
+
+    async def _load_previous(self):
+        page = await self._fetch_page(self._above.pop())
+        self._pages.insert(0, page)
+        if len(self._pages) > WINDOW_PAGES:
+            self._pages.pop()
+        self._draw(len(page.routes))
+
+    async def _load(self, load):
+        try:
+            await load()
+        except http_errors as e:
+            self.app.user_log(f"HTTP Error updating {self.title} data: {e}", "ERROR")
+        finally:
+            # once the view has been scrolled back into place, so that doesn't count as reaching an edge
+            self.call_after_refresh(self._loaded)
+
+    def _loaded(self):
+        self._loading = False
+
+    def _check_edges(self, first_row: int, last_row: int):
+        """_check_edges will fetch the next or previous page when rows first_row to last_row are close to either
+        end of the loaded rows"""
+        if self._loading or not self._pages:
+            return
+        loaded = sum(len(page.routes) for page in self._pages)
+        if last_row >= loaded - PREFETCH_ROWS and self._pages[-1].next_cursor is not None:
+            load = self._load_next
+        elif first_row < PREFETCH_ROWS and self._above:
+            load = self._load_previous
+        else:
+            return
+        self._loading = True
+        self.run_worker(self._load(load), group="page")
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted):
+        self._check_edges(event.cursor_row, event.cursor_row)
+
+    def _on_scroll(self, scroll_y: float):
+        table = self.query_one(f"#{self.id}_table")
+        self._check_edges(int(scroll_y), int(scroll_y) + table.size.height)
+
+    def _draw(self, shift: int, reset: bool = False):
+        """_draw will draw the loaded pages, moving the cursor and the scroll position by shift rows, the rows
+        added (or, negative, removed) above them.  With reset, they go back to the top."""
+        table = self.query_one(f"#{self.id}_table")
+        cursor_row = 0 if reset else table.cursor_row + shift
+        scroll_y = 0 if reset else max(0, table.scroll_y + shift)
+
+        routes = [route for page in self._pages for route in page.routes]
+        columns = tuple(routes[0].keys()) if routes else self._columns
+        if columns != self._columns:
+            table.clear(columns=True)
+            self._columns = columns
+            for column in columns:
+                table.add_column(column, key=column)
+        else:
+            table.clear()
+        table.add_rows(
+            [format_cell(column, route.get(column)) for column in self._columns] for route in routes
+        )
+        table.move_cursor(row=max(0, min(cursor_row, len(routes) - 1)), scroll=False)
+        # the table only knows how far it can scroll once it's been laid out with the new rows
+        self.call_after_refresh(table.scroll_to, y=scroll_y, animate=False, immediate=True)
+
+        subtitle = []
+        if routes:
+            subtitle.append(f"{routes[0]['prefix']} - {routes[-1]['prefix']}")
+        if self.filters:
+            subtitle.append(" ".join(f"{name}={value}" for name, value in self.filters.items()))
+        self.border_subtitle = ", ".join(subtitle)
@@ -1,11 +1,22 @@
 from datetime import datetime
-from typing import Callable, Optional
+from typing import AsyncIterator, Callable, Optional
 
 from textual.app import ComposeResult
 from textual.reactive import Reactive
 from textual.widgets import Static, Label, DataTable
 
-from .state import http_errors
+from .state import http_errors, route_key
+
+
+def _row_key(key: tuple) -> str:
+    return "|".join(str(part) for part in key)
+
+
+def format_cell(column: str, value):
+    """format_cell will format a value for display: timestamps (floats) become the time of day"""
+    if column == "last_updated" and isinstance(value, float):
+        return datetime.fromtimestamp(value).strftime("%H:%M:%S")
+    return value
 
 
 class LiveTable(Static):
@@ -14,10 +25,17 @@ class LiveTable(Static):
     callback: Reactive[Optional[Callable[[], list[dict]]]] = Reactive(
         None
     )  # default do-nothing callback
+    # follows the table's route events (a snapshot, then deltas), see BaseClient.aiter_events
+    subscribe: Reactive[
+        Optional[Callable[[], AsyncIterator[tuple[str, dict]]]]
+    ] = Reactive(None)
     paused = Reactive(True)
 
-    def on_mount(self):
-        self.update_timer = self.set_interval(1, self.update_data, pause=True)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._columns: tuple[str, ...] = ()
+        # the values shown in each row, by route_key
+        self._rows: dict[tuple, tuple] = {}
 
     async def update_data(self):
         self.app.user_log(f"Updating {self.title} data", "DEBUG")
@@ -28,35 +46,99 @@ class LiveTable(Static):
         except http_errors as e:
             self.app.user_log(f"HTTP Error updating {self.title} data: {e}", "ERROR")
 
+    async def follow(self):
+        """follow will keep the table up to date from the subscription, until it is paused.  A delta only touches the
+        rows it changes: the routes are kept in a dict by route_key, and data is only replaced by a snapshot."""
+        routes: dict[tuple, dict] = {}
+        try:
+            async for event, payload in self.subscribe():
+                if event == "snapshot":
+                    routes = {route_key(route): route for route in payload["routes"]}
+                    # drawn against the rows shown, which deltas have moved on from data since the last snapshot
+                    data = list(routes.values())
+                    self.set_reactive(LiveTable.data, data)
+                    self.watch_data(data)
+                elif event == "delta":
+                    changed, removed = [], []
+                    for change in payload["changes"]:
+                        route = change["route"]
+                        key = route_key(route)
+                        if change["op"] == "remove":
+                            routes.pop(key, None)
+                            removed.append(key)
+                        else:
+                            routes[key] = route
+                            changed.append(route)
+                    if self._columns:
+                        self.render_rows(changed, removed)
+                    else:
+                        # the table was empty, so it has no columns yet
+                        self.watch_data(list(routes.values()))
+                else:
+                    continue
+                self.app.user_log(f"{self.title}: {event}", "DEBUG")
+        except http_errors as e:
+            self.app.user_log(f"HTTP Error following {self.title} data: {e}", "ERROR")
+
+    def _restart_follow(self):
+        if not self.is_mounted:
+            return
+        self.workers.cancel_group(self, "follow")
+        if not self.paused and self.subscribe is not None:
+            self.run_worker(self.follow(), group="follow", exclusive=True)
+
+    def watch_subscribe(self, subscribe):
+        self._restart_follow()
+
     def watch_data(self, data):
+        """watch_data will bring the table in line with data, touching only the rows and cells that differ"""
         table = self.query_one(f"#{self.id}_table")
-        table.clear(True)
         if len(data) == 0:
+            table.clear()
+            self._rows.clear()
             return
 
-        def fix_timestamps(item):
-            """Converts timestamps (floats) to human-readable strings"""
-            ts = item["last_updated"]
-            if isinstance(ts, float):
-                item["last_updated"] = datetime.fromtimestamp(ts).strftime(
-                    "%H:%M:%S"
-                )
-            return item
+        columns = tuple(data[0].keys())
+        if columns != self._columns:
+            # another kind of route (e.g. the protocol table switched from SLA to RIP)
+            table.clear(columns=True)
+            self._rows.clear()
+            self._columns = columns
+            for column in columns:
+                table.add_column(column, key=column)
 
-        for item in data:
-            fix_timestamps(item)
+        keys = {route_key(item) for item in data}
+        self.render_rows(data, [key for key in self._rows if key not in keys])
 
-        header = data[0].keys()
-        table.add_columns(*header)
-        table.add_rows(item.values() for item in data)
+    def render_rows(self, changed: list[dict], removed: list[tuple]):
+        """render_rows will add or update the rows for the changed routes, and remove the rows keyed by removed"""
+        table = self.query_one(f"#{self.id}_table")
+        for key in removed:
+            if self._rows.pop(key, None) is not None:
+                table.remove_row(_row_key(key))
+
+        for item in changed:
+            key = route_key(item)
+            values = tuple(item.get(column) for column in self._columns)
+            shown = self._rows.get(key)
+            if shown == values:
+                continue
+            self._rows[key] = values
+            if shown is None:
+                table.add_row(
+                    *(format_cell(c, v) for c, v in zip(self._columns, values)), key=_row_key(key)
+                )
+                continue
+            for column, old, new in zip(self._columns, shown, values):
+                if old != new:
+                    table.update_cell(_row_key(key), column, format_cell(column, new))
 
     def watch_paused(self, paused):
         if paused:
             self.app.user_log(f"Pausing {self.title} data", "DEBUG")
-            self.update_timer.pause()
         else:
             self.app.user_log(f"Resuming {self.title} data", "DEBUG")
-            self.update_timer.resume()
+        self._restart_follow()
 
     def compose(self) -> ComposeResult:
         yield DataTable(id=f"{self.id}_table", classes="richtable")
@@ -1,10 +1,14 @@
+import asyncio
 from functools import partial
+from ipaddress import ip_address, ip_network
 
 from textual.app import App, ComposeResult
 from textual.command import Provider, Hits, Hit
 from textual.containers import Container
 from textual.widgets import Header, Footer, RichLog, DataTable
 
+from src.control_plane.clients.base import close_client_sessions
+from src.system import SourceCode
 from .state import (
     state,
     sla_rib_table_fields,
@@ -13,6 +17,8 @@ from .state import (
     cp_rib_table_fields,
 )
 from .TitledTable import LiveTable
+from .PagedTable import PagedTable
+from .Dashboard import Dashboard
 
 commands = {}
 
@@ -36,13 +42,62 @@ commands["RIP: Watch Tables"] = watch_tables
 commands["RIP: Stop Watching Tables"] = stop_watch_tables
 
 
+async def cp_rib_paged(app: "PyrpMonitor"):
+    await app.run_action("toggle_paged")
+
+
+async def cp_rib_clear_filter(app: "PyrpMonitor"):
+    await app.filter_cp_rib()
+
+
+def _cp_rib_source_filter(source: SourceCode):
+    async def cp_rib_filter_source(app: "PyrpMonitor"):
+        await app.filter_cp_rib(source=source.value)
+
+    return cp_rib_filter_source
+
+
+async def toggle_dashboard(app: "PyrpMonitor"):
+    await app.run_action("toggle_dashboard")
+
+
+commands["CP RIB: Toggle Paged View"] = cp_rib_paged
+commands["Toggle Performance Dashboard"] = toggle_dashboard
+commands["CP RIB: Clear Filter"] = cp_rib_clear_filter
+for source in SourceCode:
+    commands[f"CP RIB: Show Only {source.value} Routes"] = _cp_rib_source_filter(source)
+
+
+def prefix_commands(query: str) -> dict:
+    """prefix_commands will offer to jump to or filter the CP RIB by the prefix or address being typed"""
+    try:
+        prefix = ip_network(query.strip(), strict=False)
+    except ValueError:
+        return {}
+    rslt = {
+        f"CP RIB: Jump to {prefix}": lambda app: app.jump_cp_rib(str(prefix)),
+        f"CP RIB: Filter to {prefix} and longer": lambda app: app.filter_cp_rib(
+            prefix=str(prefix), match="longer"
+        ),
+    }
+    if prefix.num_addresses == 1:
+        address = str(ip_address(prefix.network_address))
+        rslt[f"CP RIB: Filter to best match for {address}"] = lambda app: app.filter_cp_rib(
+            prefix=address, match="lpm"
+        )
+        rslt[f"CP RIB: Filter to next hop {address}"] = lambda app: app.filter_cp_rib(
+            next_hop=address
+        )
+    return rslt
+
+
 class CPCommandPalette(Provider):
     async def search(self, query: str) -> Hits:
         matcher = self.matcher(query)
 
         app = self.app
 
-        for command, func in commands.items():
+        for command, func in (commands | prefix_commands(query)).items():
             score = matcher.match(command)
             if score > 0:
                 yield Hit(score, matcher.highlight(command), partial(func, app))
@@ -60,6 +115,8 @@ class PyrpMonitor(App):
         ("e", "sla_evaluate", "Evaluate SLA Routes"),
         ("p", "next_proto", "Next Protocol"),
         ("n", "new_instance", "New Instance"),
+        ("v", "toggle_paged", "Paged/Live CP RIB"),
+        ("m", "toggle_dashboard", "Performance Dashboard"),
         ("ctrl+d", "set_log_debug", "Set log level to DEBUG"),
         ("ctrl+n", "set_log_info", "Set log level to INFO"),
         ("ctrl+w", "set_log_warning", "Set log level to WARNING"),
@@ -77,16 +134,33 @@ class PyrpMonitor(App):
             t = LiveTable(id="CP_RIB", classes="box")
             t.title = "Control Plane RIB"
             t.callback = partial(state.cp_client.get_rib_routes, "latest")
+            t.subscribe = partial(state.cp_client.watch_rib_routes, "latest")
+            yield t
+            # for RIBs too large to hold in full: only a window of pages is fetched, as it scrolls
+            t = PagedTable(id="CP_RIB_PAGED", classes="box")
+            t.title = "Control Plane RIB (paged)"
+            t.fetch = partial(state.cp_client.get_rib_routes, "latest")
+            t.display = False
             yield t
             t = LiveTable(id="PROTO_RIB", classes="box")
             t.title = "Protocol RIB"
             yield t
+            t = Dashboard(
+                {"Control Plane": state.cp_client, "SLA": state.sla_client, "RIP": state.rip_client},
+                id="Dashboard",
+                classes="box box-2",
+            )
+            t.display = False
+            yield t
             yield RichLog(id="UserLog", classes="box box-2")
 
     async def on_mount(self) -> None:
+        # the tables follow the services' route events, which start with the whole table
+        self.start_watch_tables()
         await self.run_action("next_proto")
-        cp_table = self.query_one("#CP_RIB")
-        await cp_table.update_data()
+
+    async def on_unmount(self) -> None:
+        await close_client_sessions()
 
     def on_key(self, event):
         self.user_log(f"Key pressed: {event.key}")
@@ -94,8 +168,20 @@ class PyrpMonitor(App):
     def action_toggle_dark(self) -> None:
         self.dark = not self.dark
 
+    def _live_tables(self) -> list[LiveTable]:
+        # the CP table is hidden, and left paused, while the paged view is up
+        return [table for table in self.query(LiveTable) if table.display]
+
+    def start_watch_tables(self):
+        for table in self._live_tables():
+            table.paused = False
+
+    def stop_watch_tables(self):
+        for table in self.query(LiveTable):
+            table.paused = True
+
     def action_toggle_watch(self) -> None:
-        live_tables = self.query("LiveTable")
+        live_tables = self._live_tables()
         on = "ON" if any(table.paused for table in live_tables) else "OFF"  # opposite of what you expect
         self.user_log(f"Toggling Watch {on}")
         for table in live_tables:
@@ -103,18 +189,50 @@ class PyrpMonitor(App):
 
     async def action_redistribute(self):
         self.user_log("Triggering Redistribution")
-        try:
-            await state.cp_client.redistribute("latest")
-        except http_errors as e:
-            self.user_log(f"Error redistributing: {e}")
-        await self.run_action("refresh_tables")
+        paged: PagedTable = self.query_one("#CP_RIB_PAGED")
+        if paged.display:
+            # just the window being paged through is read back, not the whole RIB
+            try:
+                await state.cp_client.redistribute("latest")
+            except http_errors as e:
+                self.user_log(f"Error redistributing: {e}")
+            await paged.update_data()
+            return
+        # redistribute and read back the RIB in one round trip
+        batch = state.cp_client.batch()
+        redistributed, routes = await batch.run(
+            batch.redistribute("latest"),
+            batch.get_rib_routes("latest"),
+            return_exceptions=True,
+        )
+        if self._batch_error(redistributed):
+            self.user_log(f"Error redistributing: {redistributed}")
+        if self._batch_error(routes):
+            self.user_log(f"HTTP Error updating CP RIB data: {routes}", "ERROR")
+        else:
+            self.query_one("#CP_RIB").data = routes
 
     async def action_sla_evaluate(self):
         self.user_log("Evaluating SLA Routes")
-        try:
-            await state.sla_client.evaluate_routes("latest")
-        except http_errors as e:
-            self.user_log(f"Error evaluating routes: {e}")
+        batch = state.sla_client.batch()
+        evaluated, routes = await batch.run(
+            batch.evaluate_routes("latest"),
+            batch.get_rib_routes("latest"),
+            return_exceptions=True,
+        )
+        if self._batch_error(evaluated):
+            self.user_log(f"Error evaluating routes: {evaluated}")
+        if state.proto_table == "sla_rib" and not self._batch_error(routes):
+            self.query_one("#PROTO_RIB").data = routes
+
+    @staticmethod
+    def _batch_error(result) -> bool:
+        """_batch_error will tell whether a batched call failed with an HTTP error, re-raising any other exception"""
+        if isinstance(result, http_errors):
+            return True
+        if isinstance(result, BaseException):
+            raise result
+        return False
 
     async def action_new_instance(self):
         try:
@@ -126,8 +244,54 @@ class PyrpMonitor(App):
 
     async def action_refresh_tables(self):
         self.user_log("Refreshing Tables")
-        for live_table in self.query("LiveTable"):
-            await live_table.update_data()
+        # each table reads from a different service, so refresh them concurrently
+        await asyncio.gather(
+            *(live_table.update_data() for live_table in self._live_tables()),
+            *(paged.update_data() for paged in self.query(PagedTable) if paged.display),
+        )
+
+    async def action_toggle_paged(self):
+        live: LiveTable = self.query_one("#CP_RIB")
+        paged: PagedTable = self.query_one("#CP_RIB_PAGED")
+        if paged.display:
+            self.user_log("Showing the whole CP RIB")
+            paged.display = False
+            paged.clear()
+            live.display = True
+            live.paused = False
+        else:
+            self.user_log("Paging through the CP RIB")
+            live.paused = True
+            live.data = []
+            live.display = False
+            paged.display = True
+            await paged.reload()
+
+    def action_toggle_dashboard(self):
+        dashboard: Dashboard = self.query_one("#Dashboard")
+        dashboard.display = not dashboard.display
+        if dashboard.display:
+            self.user_log("Showing the performance dashboard")
+            dashboard.start()
+        else:
+            self.user_log("Hiding the performance dashboard")
+            dashboard.stop()
+
+    async def _paged_cp_rib(self) -> PagedTable:
+        paged: PagedTable = self.query_one("#CP_RIB_PAGED")
+        if not paged.display:
+            await self.run_action("toggle_paged")
+        return paged
+
+    async def jump_cp_rib(self, prefix: str):
+        self.user_log(f"Jumping to {prefix} in the CP RIB")
+        paged = await self._paged_cp_rib()
+        await paged.jump(prefix)
+
+    async def filter_cp_rib(self, **filters):
+        self.user_log(f"Filtering the CP RIB: {filters or 'none'}")
+        paged = await self._paged_cp_rib()
+        await paged.set_filters(**filters)
 
 
     async def action_next_proto(self):
@@ -136,12 +300,15 @@ class PyrpMonitor(App):
         if proto == "sla_rib":
             live_table.title = "SLA RIB"
             live_table.callback = partial(state.sla_client.get_rib_routes, "latest")
+            live_table.subscribe = partial(state.sla_client.watch_rib_routes, "latest")
 
         elif proto == "rip_rib":
             live_table.title = "RIP RIB"
             live_table.callback = partial(state.rip_client.get_rib_routes, "latest")
+            live_table.subscribe = partial(state.rip_client.watch_rib_routes, "latest")
 
-        await live_table.update_data()
+        if live_table.paused:
+            await live_table.update_data()
 
     async def action_new_instance(self):
         self.user_log("Creating new instance")
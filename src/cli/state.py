@@ -10,6 +10,11 @@ from src.control_plane.clients.client_control_plane import RpCpClient
 http_errors = (ClientResponseError, HTTPError)
 
 
+def route_key(route: dict) -> tuple:
+    """route_key is what tells the rows of a RIB apart"""
+    return route["prefix"], route["next_hop"], route.get("route_source")
+
+
 @dataclass
 class State:
     cp_client: RpCpClient
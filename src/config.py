@@ -1,5 +1,7 @@
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
+from typing import Any, Iterable
 
 import toml
 
@@ -12,8 +14,24 @@ class ServicePorts(Enum):
     SLA = 5023
 
 
+def damping_defaults() -> dict[str, int | bool]:
+    damping_config = {
+        "damping_enabled": False,
+        "damping_penalty": 1000,
+        "damping_suppress_threshold": 2000,
+        "damping_reuse_threshold": 750,
+        "damping_half_life": 900,
+        "damping_max_suppress_time": 3600,
+    }
+
+    return damping_config
+
+
 def control_plane_defaults() -> dict[str, int | list | str]:
-    control_plane_config = {}
+    control_plane_config = {
+        "max_paths": 4,
+        **damping_defaults(),
+    }
 
     return control_plane_config
 
@@ -25,6 +43,8 @@ def rp_sla_defaults() -> dict[str, int | list | str]:
         "routes": [],
         "enabled": False,
         "trigger_redistribution": False,
+        "max_paths": 4,
+        **damping_defaults(),
     }
 
     return rp_sla_config
@@ -41,9 +61,15 @@ def rp_rip1_defaults() -> dict[str, int | list | str]:
         "redistribute_sla_metric": 1,
         "advertisement_interval": 5,
         "request_interval": 60,
+        "response_pacing_ms": 10,
         "reject_own_messages": False,
         "trigger_redistribution": False,
         "cp_base_url": "http://localhost:5010",
+        "max_paths": 4,
+        "interfaces": [],
+        "split_horizon": True,
+        "poison_reverse": False,
+        **damping_defaults(),
     }
     return rp_rip1_config
 
@@ -69,3 +95,67 @@ class Config:
         self.rp_sla.update(data.get("rp_sla", {}))
         self.control_plane.update(data.get("control_plane", {}))
         self.rp_rip1.update(data.get("rp_rip1", {}))
+
+
+def route_key(route: dict) -> tuple[str, str]:
+    """configured routes are identified by (prefix, next_hop), compared as strings"""
+    return str(route["prefix"]), str(route["next_hop"])
+
+
+@dataclass
+class RoutesDiff:
+    added: list[dict] = field(default_factory=list)
+    removed: list[dict] = field(default_factory=list)
+    changed: list[dict] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    @property
+    def as_json(self) -> dict[str, list[list[str]]]:
+        return {
+            "added": [list(route_key(route)) for route in self.added],
+            "removed": [list(route_key(route)) for route in self.removed],
+            "changed": [list(route_key(route)) for route in self.changed],
+        }
+
+
+def diff_routes(old_routes: Iterable[dict], new_routes: Iterable[dict]) -> RoutesDiff:
+    """diff_routes will compare two lists of configured routes.
+    A route is changed if it's in both, but any field given in the new route has a different value in the old one."""
+    old_by_key = {route_key(route): route for route in old_routes}
+    rslt = RoutesDiff()
+    new_keys = set()
+    for route in new_routes:
+        key = route_key(route)
+        new_keys.add(key)
+        old_route = old_by_key.get(key)
+        if old_route is None:
+            rslt.added.append(route)
+            continue
+
+        for field_name, value in route.items():
+            if field_name in ("prefix", "next_hop"):
+                continue
+            if _normalize(old_route.get(field_name)) != _normalize(value):
+                rslt.changed.append(route)
+                break
+
+    rslt.removed = [route for key, route in old_by_key.items() if key not in new_keys]
+    return rslt
+
+
+def diff_settings(old_settings: dict, new_settings: dict) -> dict[str, Any]:
+    """diff_settings will return the settings from new_settings whose values differ from old_settings.
+    Only keys in old_settings are compared, so new_settings can be a whole config section."""
+    return {
+        key: new_settings[key]
+        for key, value in old_settings.items()
+        if key in new_settings and _normalize(value) != _normalize(new_settings[key])
+    }
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    return value
@@ -1,50 +1,567 @@
+import asyncio
+import json
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+from enum import Enum
+from functools import partial
+from typing import Literal, Optional
+
 import requests
 import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from src.generic.streaming import EVENT_STREAM_MEDIA_TYPE, KEEPALIVE_SECONDS, NDJSON_MEDIA_TYPE
+from src.generic.tracing import span, trace_headers
+
+# methods that are safe to send twice; anything else is only retried if the connection was never made
+IDEMPOTENT_METHODS = frozenset(["GET", "PUT", "DELETE"])
+RETRY_STATUSES = frozenset([502, 503, 504])
+# how many GET responses each client keeps for revalidation with If-None-Match
+ETAG_CACHE_SIZE = 128
+# an event stream with nothing on it for this long has gone, the server sends keepalives more often than that
+EVENT_STREAM_READ_TIMEOUT = 3 * KEEPALIVE_SECONDS
+
+
+class CircuitOpenError(aiohttp.ClientConnectionError):
+    """raised instead of sending a request while the circuit breaker for its peer is open"""
+
+
+class CircuitBreaker:
+    """CircuitBreaker stops requests to a peer after failure_threshold consecutive failures (connection errors,
+    timeouts and 5xx responses).  After reset_timeout seconds one trial request is let through: if it succeeds
+    the breaker closes again, otherwise it stays open for another reset_timeout."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # the token of the trial request that's out, if any
+        self._trial: Optional[object] = None
+
+    @property
+    def state(self) -> Literal["closed", "open", "half-open"]:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self, peer: str) -> Optional[object]:
+        """before_request will raise CircuitOpenError if the request can't go out.  If it is the half-open trial, it
+        returns a token to hand to end_trial once the request is over, whatever its outcome."""
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial is not None):
+            raise CircuitOpenError(f"circuit breaker for {peer} is open")
+        if state == "half-open":
+            self._trial = object()
+            return self._trial
+        return None
+
+    def end_trial(self, trial: Optional[object]):
+        """end_trial will let the next trial through after one that ended (cancelled, or failed some other way)
+        without a success or failure being recorded"""
+        if trial is not None and self._trial is trial:
+            self._trial = None
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+# one breaker per peer, shared by every client talking to it
+_breakers: dict[str, CircuitBreaker] = {}
+_clients: "weakref.WeakSet[BaseClient]" = weakref.WeakSet()
+
+
+def breaker_for(base_url: str) -> CircuitBreaker:
+    breaker = _breakers.get(base_url)
+    if breaker is None:
+        breaker = _breakers[base_url] = CircuitBreaker()
+    return breaker
+
+
+async def close_client_sessions():
+    """close_client_sessions will close the pooled sessions of every client in this process"""
+    await asyncio.gather(*(client.close() for client in list(_clients)))
+
+
+def query_params(params: Optional[dict]) -> Optional[dict]:
+    """query_params will drop the parameters that are None, and send enums by value"""
+    if params is None:
+        return None
+    return {
+        k: v.value if isinstance(v, Enum) else v for k, v in params.items() if v is not None
+    }
+
+
+@asynccontextmanager
+async def client_sessions_lifespan(app):
+    """a FastAPI lifespan that closes the clients' pooled sessions on shutdown"""
+    yield
+    await close_client_sessions()
 
 
 class BaseClient:
-    def __init__(self, base_url):
+    """BaseClient wraps a peer's HTTP API.
+
+    The async methods share one pooled aiohttp session per client, created on first use, so connections are kept
+    alive between calls.  Idempotent requests that fail on the connection, time out or get a 502/503/504 are retried
+    up to retries times with jittered exponential backoff.  Every client of a peer shares that peer's circuit breaker.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        timeout: float = 5.0,
+        connection_limit: int = 32,
+        # below uvicorn's default 5s keep-alive, so the server doesn't close a connection we're about to reuse
+        keepalive_timeout: float = 4.0,
+        retries: int = 2,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+    ):
         self.base_url = base_url
         self.requests_session = requests.Session()
+        self.timeout = timeout
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker_for(base_url)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        # (url, params) -> (etag, raw body) of the last GET that came back with an ETag
+        self._etag_cache: dict[tuple, tuple[str, bytes]] = {}
+        _clients.add(self)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            # a session is bound to the loop it was made on.  One left over from a loop that has since gone away
+            # can't be closed any more, so it is just dropped
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            if self._session_loop is asyncio.get_running_loop():
+                await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    def close_soon(self):
+        """close_soon will schedule close on the running loop, for code that can't await it"""
+        if self._session is not None:
+            asyncio.get_running_loop().create_task(self.close())
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * 2**attempt) * random.uniform(0.5, 1)
+
+    async def _arequest(self, method: str, url: str, timeout: Optional[float] = None, **kwargs):
+        idempotent = method in IDEMPOTENT_METHODS
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        if "params" in kwargs:
+            kwargs["params"] = query_params(kwargs["params"])
+
+        headers = trace_headers()
+        cache_key = cached = None
+        if method == "GET":
+            cache_key = (url, tuple(sorted((kwargs.get("params") or {}).items())))
+            cached = self._etag_cache.get(cache_key)
+            if cached is not None:
+                headers["If-None-Match"] = cached[0]
+
+        async with span(f"client {method} {url}", peer=self.base_url) as client_span:
+            attempt = 0
+            while True:
+                trial = self.breaker.before_request(self.base_url)
+                try:
+                    async with self._get_session().request(
+                        method, self.base_url + url, headers=headers, **kwargs
+                    ) as response:
+                        if response.status >= 500:
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+
+                        if response.status == 304 and cached is not None:
+                            client_span.attributes["not_modified"] = True
+                            # parsed fresh every time, callers are free to modify what they get back
+                            return json.loads(cached[1])
+
+                        if not (
+                            idempotent
+                            and response.status in RETRY_STATUSES
+                            and attempt < self.retries
+                        ):
+                            response.raise_for_status()
+                            etag = response.headers.get("ETag")
+                            if cache_key is None or etag is None:
+                                return await response.json()
+
+                            body = await response.read()
+                            self._cache_response(cache_key, etag, body)
+                            return json.loads(body)
+                except aiohttp.ClientResponseError:
+                    raise
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    self.breaker.record_failure()
+                    retryable = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+                    if not retryable or attempt >= self.retries:
+                        raise
+                finally:
+                    self.breaker.end_trial(trial)
+
+                attempt += 1
+                client_span.attributes["retries"] = attempt
+                await asyncio.sleep(self._backoff_delay(attempt - 1))
+
+    def _cache_response(self, cache_key: tuple, etag: str, body: bytes):
+        self._etag_cache.pop(cache_key, None)
+        if len(self._etag_cache) >= ETAG_CACHE_SIZE:
+            # dicts keep insertion order, so this drops the least recently stored entry
+            del self._etag_cache[next(iter(self._etag_cache))]
+        self._etag_cache[cache_key] = etag, body
+
+    async def aiter_ndjson(self, url, params=None):
+        """aiter_ndjson will GET url as NDJSON and yield its objects one at a time, as they arrive.
+
+        The whole response is never held in memory, so it isn't ETag cached.  Only opening the request is retried:
+        once objects have been yielded, a failure is raised to the caller rather than starting over.
+        """
+        headers = trace_headers()
+        headers["Accept"] = NDJSON_MEDIA_TYPE
+        # a long listing can take longer than timeout overall, so only bound the wait for each read
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.timeout, sock_read=self.timeout
+        )
+        # the span only covers opening the request: held across the yields below, it would become the current span
+        # of whatever the caller does between objects
+        async with span(f"client GET {url} (stream)", peer=self.base_url) as client_span:
+            attempt = 0
+            while True:
+                trial = self.breaker.before_request(self.base_url)
+                try:
+                    response = await self._get_session().get(
+                        self.base_url + url,
+                        params=query_params(params),
+                        headers=headers,
+                        timeout=timeout,
+                    )
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    self.breaker.record_failure()
+                    if attempt >= self.retries:
+                        raise
+                else:
+                    if response.status >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    if not (response.status in RETRY_STATUSES and attempt < self.retries):
+                        break
+                    response.release()
+                finally:
+                    self.breaker.end_trial(trial)
+
+                attempt += 1
+                client_span.attributes["retries"] = attempt
+                await asyncio.sleep(self._backoff_delay(attempt - 1))
+
+        async with response:
+            response.raise_for_status()
+            async for line in response.content:
+                if line.strip():
+                    yield json.loads(line)
+
+    async def aiter_events(self, url, params=None, reconnect: bool = True):
+        """aiter_events will follow url as a server-sent event stream, yielding (event, data) with data decoded from
+        JSON.  A stream that drops, or that the server closes, is reconnected with backoff: the Last-Event-ID header
+        lets the server carry on from the last event seen.  Without reconnect, it ends with the stream instead.
+
+        An error response raises, except a 502/503/504, which is treated like a dropped stream.
+        """
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.timeout, sock_read=EVENT_STREAM_READ_TIMEOUT
+        )
+        last_event_id = None
+        attempt = 0
+        while True:
+            headers = trace_headers()
+            headers["Accept"] = EVENT_STREAM_MEDIA_TYPE
+            if last_event_id is not None:
+                headers["Last-Event-ID"] = last_event_id
+            trial = None
+            try:
+                trial = self.breaker.before_request(self.base_url)
+                async with self._get_session().get(
+                    self.base_url + url,
+                    params=query_params(params),
+                    headers=headers,
+                    timeout=timeout,
+                ) as response:
+                    if response.status >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    response.raise_for_status()
+                    attempt = 0
+
+                    event, event_id, data = "message", None, []
+                    async for raw_line in response.content:
+                        line = raw_line.decode().rstrip("\r\n")
+                        if not line:
+                            if data:
+                                if event_id is not None:
+                                    last_event_id = event_id
+                                yield event, json.loads("\n".join(data))
+                            event, event_id, data = "message", None, []
+                        elif not line.startswith(":"):
+                            field, _, value = line.partition(":")
+                            value = value[1:] if value.startswith(" ") else value
+                            if field == "event":
+                                event = value
+                            elif field == "data":
+                                data.append(value)
+                            elif field == "id":
+                                event_id = value
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRY_STATUSES or not reconnect:
+                    raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not isinstance(e, CircuitOpenError):
+                    self.breaker.record_failure()
+                if not reconnect:
+                    raise
+            finally:
+                self.breaker.end_trial(trial)
+            if not reconnect:
+                return
+
+            await asyncio.sleep(self._backoff_delay(attempt))
+            attempt += 1
 
     def get(self, url, params=None) -> requests.Response:
-        return self.requests_session.get(self.base_url + url, params=params)
+        return self.requests_session.get(
+            self.base_url + url,
+            params=params,
+            headers=trace_headers(),
+            timeout=self.timeout,
+        )
 
-    async def aget(self, url, params=None):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.base_url + url, params=params) as response:
-                response.raise_for_status()
-                return await response.json()
+    async def aget(self, url, params=None, timeout: Optional[float] = None):
+        return await self._arequest("GET", url, timeout=timeout, params=params)
 
     def post(self, url, params=None, data=None, json=None) -> requests.Response:
         return self.requests_session.post(
-            self.base_url + url, params=params, data=data, json=json
+            self.base_url + url,
+            params=params,
+            data=data,
+            json=json,
+            headers=trace_headers(),
+            timeout=self.timeout,
         )
 
-    async def apost(self, url, params=None, data=None, json=None):
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.base_url + url, params=params, data=data, json=json
-            ) as response:
-                response.raise_for_status()
-                return await response.json()
+    async def apost(
+        self, url, params=None, data=None, json=None, timeout: Optional[float] = None
+    ):
+        return await self._arequest(
+            "POST", url, timeout=timeout, params=params, data=data, json=json
+        )
 
     def put(self, url, params=None, data=None) -> requests.Response:
-        return self.requests_session.put(self.base_url + url, params=params, data=data)
+        return self.requests_session.put(
+            self.base_url + url,
+            params=params,
+            data=data,
+            headers=trace_headers(),
+            timeout=self.timeout,
+        )
 
-    async def aput(self, url, params=None, data=None):
-        async with aiohttp.ClientSession() as session:
-            async with session.put(
-                self.base_url + url, params=params, data=data
-            ) as response:
-                response.raise_for_status()
-                return await response.json()
+    async def aput(self, url, params=None, data=None, timeout: Optional[float] = None):
+        return await self._arequest("PUT", url, timeout=timeout, params=params, data=data)
 
     def delete(self, url, params=None) -> requests.Response:
-        return self.requests_session.delete(self.base_url + url, params=params)
+        return self.requests_session.delete(
+            self.base_url + url,
+            params=params,
+            headers=trace_headers(),
+            timeout=self.timeout,
+        )
+
+    async def adelete(self, url, params=None, timeout: Optional[float] = None):
+        return await self._arequest("DELETE", url, timeout=timeout, params=params)
+
+    def batch(self, stop_on_error: bool = False) -> "Batch":
+        """batch will return a Batch, which runs this client's methods in one round trip"""
+        return Batch(self, stop_on_error=stop_on_error)
+
+    async def get_traces(self, trace_id=None, name=None, limit: int = 100):
+        params = {"limit": limit}
+        if trace_id is not None:
+            params["trace_id"] = trace_id
+        if name is not None:
+            params["name"] = name
+        response = await self.aget("/traces", params=params)
+        return response
+
+    async def get_metrics_summary(self, timeout: Optional[float] = None):
+        response = await self.aget("/metrics/summary", timeout=timeout)
+        return response
+
+
+class BatchOperationError(aiohttp.ClientResponseError):
+    """raised by a batched call whose operation failed, or was skipped after an earlier failure"""
+
+    def __init__(self, base_url: str, operation: dict, status: int, message: str):
+        url = URL(base_url + operation["path"])
+        super().__init__(
+            aiohttp.RequestInfo(
+                url, operation["method"], CIMultiDictProxy(CIMultiDict()), url
+            ),
+            (),
+            status=status,
+            message=message,
+        )
+
+
+class Batch:
+    """Batch stands in for a client, recording the requests its methods make instead of sending them, and sends
+    them all in one POST /batch.  Any method of the client can be used, so the subclasses need nothing extra:
+
+        batch = cp_client.batch()
+        _, routes = await batch.run(batch.redistribute("latest"), batch.get_rib_routes("latest"))
+
+    The service runs the operations in the order the calls are passed to run.  A method that makes more than one
+    request costs one round trip per request it makes in sequence."""
+
+    def __init__(self, client: BaseClient, stop_on_error: bool = False):
+        self._client = client
+        self.stop_on_error = stop_on_error
+        self._operations: list[dict] = []
+        self._futures: list[asyncio.Future] = []
+        # the call (task) waiting on each recorded operation
+        self._callers: list[Optional[asyncio.Task]] = []
+        # resolved when a call records an operation, for run to notice
+        self._recorded: Optional[asyncio.Future] = None
+
+    def __getattr__(self, name):
+        # run the client's own methods with this batch as self, so their requests land in _record
+        attr = getattr(type(self._client), name, None)
+        if callable(attr):
+            return partial(attr, self)
+        return getattr(self._client, name)
+
+    def _record(self, method: str, url: str, params=None, json=None) -> asyncio.Future:
+        operation = {"method": method, "path": url}
+        if params is not None:
+            operation["params"] = query_params(params)
+        if json is not None:
+            operation["json"] = json
+        future = asyncio.get_running_loop().create_future()
+        self._operations.append(operation)
+        self._futures.append(future)
+        self._callers.append(asyncio.current_task())
+        if self._recorded is not None and not self._recorded.done():
+            self._recorded.set_result(None)
+        return future
+
+    async def aget(self, url, params=None, timeout: Optional[float] = None):
+        return await self._record("GET", url, params=params)
+
+    async def apost(
+        self, url, params=None, data=None, json=None, timeout: Optional[float] = None
+    ):
+        if data is not None:
+            raise ValueError("batched requests only carry json bodies")
+        return await self._record("POST", url, params=params, json=json)
+
+    async def aput(self, url, params=None, data=None, timeout: Optional[float] = None):
+        if data is not None:
+            raise ValueError("batched requests only carry json bodies")
+        return await self._record("PUT", url, params=params)
+
+    async def adelete(self, url, params=None, timeout: Optional[float] = None):
+        return await self._record("DELETE", url, params=params)
+
+    async def _flush(self):
+        operations, futures = self._operations, self._futures
+        self._operations, self._futures, self._callers = [], [], []
+        try:
+            results = await self._client.apost(
+                "/batch",
+                params={"stop_on_error": str(self.stop_on_error).lower()},
+                json=operations,
+            )
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        for i, (operation, future) in enumerate(zip(operations, futures)):
+            if i >= len(results):
+                future.set_exception(
+                    BatchOperationError(
+                        self._client.base_url, operation, 424, "not run, an earlier operation failed"
+                    )
+                )
+            elif results[i]["status"] >= 400:
+                future.set_exception(
+                    BatchOperationError(
+                        self._client.base_url,
+                        operation,
+                        results[i]["status"],
+                        str(results[i]["body"]),
+                    )
+                )
+            else:
+                future.set_result(results[i]["body"])
+
+    async def run(self, *calls, return_exceptions: bool = False) -> list:
+        """run will run the calls (coroutines from this batch's methods) and return their results in order.
+        With return_exceptions, a failed call's exception is returned in its place instead of being raised."""
+        tasks = [asyncio.ensure_future(call) for call in calls]
+        order = {task: i for i, task in enumerate(tasks)}
+        while True:
+            # let every call run up to the request it is waiting on
+            await asyncio.sleep(0)
+            pending = {task for task in tasks if not task.done()}
+            if not pending:
+                break
+
+            on_their_way = pending - set(self._callers)
+            if not on_their_way:
+                # every call left is waiting on a request: send them together, in the order the calls were passed
+                ranked = sorted(
+                    zip(self._operations, self._futures, self._callers),
+                    key=lambda recorded: order.get(recorded[2], len(order)),
+                )
+                self._operations = [operation for operation, _, _ in ranked]
+                self._futures = [future for _, future, _ in ranked]
+                await self._flush()
+                continue
 
-    async def adelete(self, url, params=None):
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(self.base_url + url, params=params) as response:
-                response.raise_for_status()
-                return await response.json()
+            # the others are awaiting something else first: wait for one of them to record a request, or finish
+            self._recorded = asyncio.get_running_loop().create_future()
+            await asyncio.wait(on_their_way | {self._recorded}, return_when=asyncio.FIRST_COMPLETED)
+            self._recorded = None
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
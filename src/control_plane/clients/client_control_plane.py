@@ -1,5 +1,7 @@
 from typing import TypedDict
 
+import aiohttp
+
 from .base import BaseClient
 
 
@@ -9,10 +11,11 @@ class InstanceResponse(TypedDict):
 
 class RpCpClient(BaseClient):
     async def health_check(self):
-        response = self.get("/")
-        return response.status_code == 200 and response.json() == {
-            "Service": "ControlPlane"
-        }
+        try:
+            response = await self.aget("/")
+        except aiohttp.ClientError:
+            return False
+        return response == {"Service": "ControlPlane"}
 
     async def get_instances(self):
         response = await self.aget("/instances")
@@ -24,10 +27,33 @@ class RpCpClient(BaseClient):
         )
         return response
 
-    async def get_rib_routes(self, instance_id):
-        response = await self.aget(f"/instances/{instance_id}/routes")
+    async def reload(self, instance_id, config_file: str):
+        response = await self.apost(
+            f"/instances/{instance_id}/reload", params={"filename": config_file}
+        )
+        return response
+
+    async def get_rib_routes(self, instance_id, **query):
+        response = await self.aget(f"/instances/{instance_id}/routes", params=query)
+        return response
+
+    async def get_static_routes(self, instance_id, **query):
+        response = await self.aget(f"/instances/{instance_id}/routes/static", params=query)
+        return response
+
+    async def get_best_routes(self, instance_id, **query):
+        response = await self.aget(f"/instances/{instance_id}/best_routes", params=query)
         return response
 
+    def iter_rib_routes(self, instance_id, **query):
+        return self.aiter_ndjson(f"/instances/{instance_id}/routes", params=query)
+
+    def iter_best_routes(self, instance_id, **query):
+        return self.aiter_ndjson(f"/instances/{instance_id}/best_routes", params=query)
+
+    def watch_rib_routes(self, instance_id):
+        return self.aiter_events(f"/instances/{instance_id}/routes/events")
+
     async def redistribute(self, instance_id):
         response_json = await self.apost(f"/instances/{instance_id}/redistribute")
         return response_json
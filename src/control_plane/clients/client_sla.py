@@ -1,61 +1,77 @@
 from typing import Optional
 
+import aiohttp
 from typing_extensions import TypedDict
 
 from .base import BaseClient
 
 
 class RpSlaClient(BaseClient):
-    def health_check(self):
-        response = self.get("/")
-        return response.status_code == 200 and response.json() == {"Service": "RP_SLA"}
+    async def health_check(self):
+        try:
+            response = await self.aget("/")
+        except aiohttp.ClientError:
+            return False
+        return response == {"Service": "RP_SLA"}
 
-    def get_instances(self):
-        response = self.get("/instances")
-        response.raise_for_status()
-        return response.json()
+    async def get_instances(self):
+        response = await self.aget("/instances")
+        return response
 
-    def get_instance(self, instance_id):
-        response = self.get(f"/instances/{instance_id}")
-        response.raise_for_status()
-        return response.json()
+    async def get_instance(self, instance_id):
+        response = await self.aget(f"/instances/{instance_id}")
+        return response
 
     class InstanceResponse(TypedDict):
         instance_id: str
 
-    def create_instance(self) -> InstanceResponse:
-        response = self.post("/instances/new")
-        response.raise_for_status()
-        return response.json()
+    async def create_instance(self) -> InstanceResponse:
+        response = await self.apost("/instances/new")
+        return response
 
-    def create_instance_from_config(
+    async def create_instance_from_config(
         self, filename, cp_id: Optional[str] = None
     ) -> InstanceResponse:
-        response = self.post(
-            "/instances/new_from_config", params={"filename": filename, "cp_id": cp_id}
+        params = {"filename": filename}
+        if cp_id is not None:
+            params["cp_id"] = cp_id
+        response = await self.apost("/instances/new_from_config", params=params)
+        return response
+
+    async def reload(self, instance_id, filename):
+        response = await self.apost(
+            f"/instances/{instance_id}/reload", params={"filename": filename}
         )
-        response.raise_for_status()
-        return response.json()
-
-    def delete_instance(self, instance_id) -> InstanceResponse:
-        response = self.delete(f"/instances/{instance_id}")
-        response.raise_for_status()
-        return response.json()
-
-    async def get_rib_routes(self, instance_id):
-        response = self.get(f"/instances/{instance_id}/routes/rib")
-        response.raise_for_status()
-        return response.json()
-
-    def get_configured_routes(self, instance_id):
-        response = self.get(f"/instances/{instance_id}/routes/configured")
-        response.raise_for_status()
-        return response.json()
-
-    def redistribute_out(self, instance_id):
-        response = self.post(f"/instances/{instance_id}/redistribute_out")
-        response.raise_for_status()
-        return response.json()
+        return response
+
+    async def delete_instance(self, instance_id) -> InstanceResponse:
+        response = await self.adelete(f"/instances/{instance_id}")
+        return response
+
+    async def get_rib_routes(self, instance_id, **query):
+        response = await self.aget(f"/instances/{instance_id}/routes/rib", params=query)
+        return response
+
+    def iter_rib_routes(self, instance_id, **query):
+        return self.aiter_ndjson(f"/instances/{instance_id}/routes/rib", params=query)
+
+    def iter_best_routes(self, instance_id, **query):
+        return self.aiter_ndjson(f"/instances/{instance_id}/best_routes", params=query)
+
+    def watch_rib_routes(self, instance_id):
+        return self.aiter_events(f"/instances/{instance_id}/routes/rib/events")
+
+    async def get_best_routes(self, instance_id, **query):
+        response = await self.aget(f"/instances/{instance_id}/best_routes", params=query)
+        return response
+
+    async def get_configured_routes(self, instance_id, **query):
+        response = await self.aget(f"/instances/{instance_id}/routes/configured", params=query)
+        return response
+
+    async def redistribute_out(self, instance_id):
+        response = await self.apost(f"/instances/{instance_id}/redistribute_out")
+        return response
 
     async def evaluate_routes(self, instance_id):
         response = await self.apost(f"/instances/{instance_id}/evaluate_routes")
@@ -1,13 +1,39 @@
+import asyncio
+import logging
+import time
 from typing import Optional
 from typing_extensions import TypedDict
 
-from src.config import Config
-from src.generic.rib import RouteSpec
+from src.config import Config, diff_routes, diff_settings
+from src.generic.metrics import Histogram, Counter
+from src.generic.damping import FlapDamper, DampingSpec, damping_key
+from src.generic.tracing import span
+from src.generic.rib import RouteSpec, RouteFilter, select_best_paths, flatten_best_paths
 from src.system import SourceCode, RouteStatus, IPNetwork
 from .clients import RpSlaClient, RpRip1Client
 from .route import CP_RIB, CP_Route
 from .static import CP_StaticTable, CP_StaticRouteSpec
 
+log = logging.getLogger(__name__)
+
+# a redistribution for routes becoming reusable runs this long after the first of them is due, so its penalty has
+# decayed past the reuse threshold by the time it's looked at
+REUSE_DELAY = 1
+
+REDISTRIBUTE_SECONDS = Histogram(
+    "pyrp_cp_redistribute_seconds", "Time spent in ControlPlane.redistribute"
+)
+REFRESH_RIB_SECONDS = Histogram(
+    "pyrp_cp_refresh_rib_seconds", "Time spent in ControlPlane.refresh_rib"
+)
+ROUTE_CHANGES = Counter(
+    "pyrp_cp_route_changes_total",
+    "Routes added to or removed from the CP RIB by a rebuild",
+    ["change"],
+)
+ROUTES_ADDED = ROUTE_CHANGES.labels("added")
+ROUTES_REMOVED = ROUTE_CHANGES.labels("removed")
+
 
 class CP_Spec(TypedDict):
     hostname: str
@@ -15,6 +41,7 @@ class CP_Spec(TypedDict):
     rp_sla_instance: Optional[str]
     rp_rip1_enabled: bool
     rp_rip1_instance: Optional[str]
+    max_paths: int
     static_routes: list[RouteSpec]
 
 
@@ -24,8 +51,14 @@ class ControlPlane:
         hostname: str,
         rp_sla_client: Optional[RpSlaClient],
         rp_rip1_client: Optional[RpRip1Client],
+        max_paths: int = 4,
+        damper: Optional[FlapDamper] = None,
     ):
         self.hostname = hostname
+        self.max_paths = max_paths
+        if damper is None:
+            damper = FlapDamper()
+        self.damper = damper
         self.rp_sla_client = rp_sla_client
         self.rp_sla_enabled = rp_sla_client is not None
         self.rp_sla_instance_id: Optional[str] = None
@@ -37,25 +70,30 @@ class ControlPlane:
         self._static_routes = CP_StaticTable()
         self._rib = CP_RIB()
         self.config: Optional[Config] = None
+        # serializes operations that talk to the protocols, so they can't interleave at their await points
+        self._lock = asyncio.Lock()
+        # redistributes when the next suppressed route becomes reusable (see _schedule_reuse)
+        self._reuse_timer: Optional[asyncio.TimerHandle] = None
+        self._reuse_task: Optional[asyncio.Task] = None
 
-    def initialize_rp_sla(self, instance_id):
+    async def initialize_rp_sla(self, instance_id):
         if self.rp_sla_enabled:
-            result = self.rp_sla_client.create_instance_from_config(
+            result = await self.rp_sla_client.create_instance_from_config(
                 filename=self.config.filename,
                 cp_id=instance_id,
             )
             self.rp_sla_instance_id = result["instance_id"]
 
-    def initialize_rp_rip1(self, instance_id):
+    async def initialize_rp_rip1(self, instance_id):
         if self.rp_rip1_enabled:
-            result = self.rp_rip1_client.create_instance_from_config(
+            result = await self.rp_rip1_client.create_instance_from_config(
                 filename=self.config.filename, cp_id=instance_id
             )
             self.rp_rip1_instance_id = result["instance_id"]
-            self.rp_rip1_client.run_protocol(self.rp_rip1_instance_id)
+            await self.rp_rip1_client.run_protocol(self.rp_rip1_instance_id)
 
     @classmethod
-    def from_config(cls, config: Config, instance_id: Optional[str] = None):
+    async def from_config(cls, config: Config, instance_id: Optional[str] = None):
         if config.rp_sla["enabled"]:
             rp_sla_client = RpSlaClient(config.control_plane["rp_sla_base_url"])
         else:
@@ -66,20 +104,148 @@ class ControlPlane:
         else:
             rp_rip1_client = None
 
-        rslt = cls(config.control_plane["hostname"], rp_sla_client, rp_rip1_client)
+        rslt = cls(
+            config.control_plane["hostname"],
+            rp_sla_client,
+            rp_rip1_client,
+            max_paths=config.control_plane["max_paths"],
+            damper=FlapDamper.from_config(config.control_plane),
+        )
         rslt.config = config
 
-        for route in config.control_plane["static_routes"]:
+        for route in cls._static_route_specs(config):
+            rslt.add_static_route(route)
+
+        try:
+            await asyncio.gather(
+                rslt.initialize_rp_sla(instance_id=instance_id),
+                rslt.initialize_rp_rip1(instance_id=instance_id),
+            )
+        except Exception:
+            await rslt.close()
+            raise
+
+        return rslt
+
+    @staticmethod
+    def _static_route_specs(config: Config) -> list[CP_StaticRouteSpec]:
+        routes = []
+        for route in config.control_plane.get("static_routes", []):
             route: CP_StaticRouteSpec
             route["route_source"] = SourceCode.STATIC
             route.setdefault("admin_distance", 1)
-            rslt.add_static_route(route)
+            routes.append(route)
+        return routes
+
+    async def reload(
+        self, config: Config, instance_id: Optional[str] = None
+    ) -> dict:
+        """reload will apply only what changed between the running state and config, without rebuilding anything.
+        Protocol instances reload themselves from the same file, and nothing is re-redistributed here."""
+        async with self._lock:
+            return await self._reload(config, instance_id)
 
-        rslt.initialize_rp_sla(instance_id=instance_id)
-        rslt.initialize_rp_rip1(instance_id=instance_id)
+    async def _reload(self, config: Config, instance_id: Optional[str]) -> dict:
+        static_diff = diff_routes(
+            (route.as_json for route in self._static_routes.items),
+            self._static_route_specs(config),
+        )
+        for route in static_diff.removed:
+            self.remove_static_route(route)
+        for route in static_diff.changed:
+            # the tables key static routes on (prefix, next_hop), so a changed route has to be swapped out
+            self.remove_static_route(route)
+            self.add_static_route(route)
+        for route in static_diff.added:
+            self.add_static_route(route)
+
+        settings = diff_settings(self.settings, config.control_plane)
+        if "hostname" in settings:
+            self.hostname = settings["hostname"]
+        if "max_paths" in settings:
+            self.max_paths = settings["max_paths"]
+        self.damper.reconfigure(config.control_plane)
 
+        old_config = self.config or Config()
+        self.config = config
+
+        rp_sla_result, rp_rip1_result = await asyncio.gather(
+            self._reload_rp_sla(old_config, instance_id),
+            self._reload_rp_rip1(old_config, instance_id),
+        )
+        rslt = {
+            "static_routes": static_diff.as_json,
+            "settings": settings,
+            "rp_sla": rp_sla_result,
+            "rp_rip1": rp_rip1_result,
+        }
         return rslt
 
+    async def _reload_rp_sla(self, old_config: Config, instance_id: Optional[str]):
+        enabled = self.config.rp_sla["enabled"]
+        base_url = self.config.control_plane.get("rp_sla_base_url")
+        if enabled and self.rp_sla_enabled and (
+            base_url == old_config.control_plane.get("rp_sla_base_url")
+        ):
+            return await self.rp_sla_client.reload(
+                self.rp_sla_instance_id, filename=self.config.filename
+            )
+
+        if self.rp_sla_client is not None:
+            await self.rp_sla_client.close()
+
+        if enabled:
+            self.rp_sla_client = RpSlaClient(base_url)
+            self.rp_sla_enabled = True
+            await self.initialize_rp_sla(instance_id=instance_id)
+            return {"instance_id": self.rp_sla_instance_id}
+
+        self.rp_sla_client = None
+        self.rp_sla_enabled = False
+        self.rp_sla_instance_id = None
+        return {}
+
+    async def _reload_rp_rip1(self, old_config: Config, instance_id: Optional[str]):
+        enabled = self.config.rp_rip1["enabled"]
+        base_url = self.config.control_plane.get("rp_rip1_base_url")
+        if enabled and self.rp_rip1_enabled and (
+            base_url == old_config.control_plane.get("rp_rip1_base_url")
+        ):
+            return await self.rp_rip1_client.reload(
+                self.rp_rip1_instance_id, filename=self.config.filename
+            )
+
+        if self.rp_rip1_client is not None:
+            await self.rp_rip1_client.close()
+
+        if enabled:
+            self.rp_rip1_client = RpRip1Client(base_url)
+            self.rp_rip1_enabled = True
+            await self.initialize_rp_rip1(instance_id=instance_id)
+            return {"instance_id": self.rp_rip1_instance_id}
+
+        self.rp_rip1_client = None
+        self.rp_rip1_enabled = False
+        self.rp_rip1_instance_id = None
+        return {}
+
+    async def close(self):
+        """close will release the connections held by the protocol clients"""
+        if self._reuse_timer is not None:
+            self._reuse_timer.cancel()
+            self._reuse_timer = None
+        for client in (self.rp_sla_client, self.rp_rip1_client):
+            if client is not None:
+                await client.close()
+
+    @property
+    def settings(self) -> dict:
+        return {
+            "hostname": self.hostname,
+            "max_paths": self.max_paths,
+            **self.damper.settings,
+        }
+
     @property
     def up_routes(self):
         return [
@@ -98,68 +264,135 @@ class ControlPlane:
         if rib_sync:
             self._rib.discard(route)
 
-    def refresh_rib(self) -> list[RouteSpec]:
-        static_routes = self._static_routes.export_routes()
-        self._rib = CP_RIB()
+    def _damp_changes(self, previous_routes: set[CP_Route]):
+        """_damp_changes will record protocol routes that came or went since the RIB was last rebuilt"""
+        current_routes = self._rib.items
+        removed_routes = previous_routes - current_routes
+        added_routes = current_routes - previous_routes
+        ROUTES_REMOVED.inc(len(removed_routes))
+        ROUTES_ADDED.inc(len(added_routes))
+        for route in removed_routes:
+            if route.route_source != SourceCode.STATIC:
+                # a withdrawal is a flap, and the route's state is dropped once its penalty has decayed
+                self.damper.update(damping_key(route), RouteStatus.DOWN)
+                self.damper.discard(damping_key(route))
+        for route in added_routes:
+            if route.route_source != SourceCode.STATIC:
+                self.damper.update(damping_key(route), route.status)
 
-        self._rib.import_routes(static_routes)
-        if self.rp_sla_enabled:
-            # sla_routes = self.rp_sla_client.get_rib_routes(self.rp_sla_instance)
-            sla_routes = self.rp_sla_client.get_best_routes(self.rp_sla_instance_id)
-            sla_routes = [
-                route
-                for route in sla_routes
-                if route["status"] in (RouteStatus.UP, RouteStatus.UP.value)
-            ]
-            for route in sla_routes:
-                route["route_source"] = SourceCode.SLA
-                route.setdefault("admin_distance", self.config.rp_sla["admin_distance"])
-
-            self._rib.import_routes(sla_routes)
+    def _rebuild_rib(self, *protocol_routes: list[RouteSpec]):
+        """_rebuild_rib will swap in a new RIB built from the static routes plus protocol_routes.
+        Nothing is awaited in here, so readers never see a half-built RIB."""
+        self.damper.release_reusable()
+        previous_routes = self._rib.items
+        rib = CP_RIB()
+        rib.import_routes(self._static_routes.export_routes())
+        for routes in protocol_routes:
+            rib.import_routes(routes)
+        rib.continue_from(self._rib)
+        self._rib = rib
+        self._damp_changes(previous_routes)
+        self._schedule_reuse()
 
-        if self.rp_rip1_enabled:
-            rip1_routes = self.rp_rip1_client.get_best_routes(self.rp_rip1_instance_id)
-            for route in rip1_routes:
-                route["route_source"] = SourceCode.RIP1
-                route.setdefault(
-                    "admin_distance", self.config.rp_rip1["admin_distance"]
-                )
-            self._rib.import_routes(rip1_routes)
+    def _schedule_reuse(self):
+        """_schedule_reuse will set a redistribution for when the next suppressed route becomes reusable, so that it is
+        exported and sent on to the protocols then rather than whenever something else next redistributes"""
+        if self._reuse_timer is not None:
+            self._reuse_timer.cancel()
+            self._reuse_timer = None
+        reuse = self.damper.next_reuse()
+        if reuse is None or not self.damper.enabled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # nothing to run it on; the next rebuild releases it instead
+        delay = max(reuse - time.time(), 0) + REUSE_DELAY
+        self._reuse_timer = loop.call_later(delay, self._redistribute_reusable)
 
-        return [route.as_json for route in self._rib.items]
+    def _redistribute_reusable(self):
+        self._reuse_timer = None
+        self._reuse_task = asyncio.create_task(self._redistribute_logged())
 
-    def redistribute(self):
-        self._rib = CP_RIB()
-        static_routes = self._static_routes.export_routes()
-        self._rib.import_routes(static_routes)
-        sla_routes = (
-            self.rp_sla_client.redistribute_out(self.rp_sla_instance_id)
-            if self.rp_sla_enabled
-            else []
-        )
-        self._rib.import_routes(sla_routes)
+    async def _redistribute_logged(self):
+        try:
+            await self.redistribute()
+        except Exception:
+            log.exception("redistribution for reusable routes failed")
 
-        rip1_routes = (
-            self.rp_rip1_client.redistribute_out(self.rp_rip1_instance_id)
-            if self.rp_rip1_enabled
-            else []
+    async def _rp_sla_best_routes(self) -> list[RouteSpec]:
+        if not self.rp_sla_enabled:
+            return []
+
+        sla_routes = await self.rp_sla_client.get_best_routes(self.rp_sla_instance_id)
+        sla_routes = [
+            route
+            for route in sla_routes
+            if route["status"] in (RouteStatus.UP, RouteStatus.UP.value)
+        ]
+        for route in sla_routes:
+            route["route_source"] = SourceCode.SLA
+            route.setdefault("admin_distance", self.config.rp_sla["admin_distance"])
+        return sla_routes
+
+    async def _rp_rip1_best_routes(self) -> list[RouteSpec]:
+        if not self.rp_rip1_enabled:
+            return []
+
+        rip1_routes = await self.rp_rip1_client.get_best_routes(
+            self.rp_rip1_instance_id
         )
-        self._rib.import_routes(rip1_routes)
+        for route in rip1_routes:
+            route["route_source"] = SourceCode.RIP1
+            route.setdefault("admin_distance", self.config.rp_rip1["admin_distance"])
+        return rip1_routes
 
-        if self.rp_rip1_enabled:
-            self.rp_rip1_client.redistribute_in(
-                self.rp_rip1_instance_id, self._rib.export_routes()
+    async def refresh_rib(self) -> list[RouteSpec]:
+        async with span("cp.refresh_rib"), self._lock, REFRESH_RIB_SECONDS.time():
+            sla_routes, rip1_routes = await asyncio.gather(
+                self._rp_sla_best_routes(), self._rp_rip1_best_routes()
             )
+            self._rebuild_rib(sla_routes, rip1_routes)
+            return [route.as_json for route in self._rib.items]
 
-    def export_routes(self) -> set[CP_Route]:
-        up_routes = self.up_routes
-        best_routes: dict[IPNetwork, CP_Route] = dict()
-        for route in up_routes:
-            if route.prefix not in best_routes:
-                best_routes[route.prefix] = route
-            elif route.admin_distance < best_routes[route.prefix].admin_distance:
-                best_routes[route.prefix] = route
-        return set(best_routes.values())
+    async def _rp_sla_redistribute_out(self) -> list[RouteSpec]:
+        if not self.rp_sla_enabled:
+            return []
+        return await self.rp_sla_client.redistribute_out(self.rp_sla_instance_id)
+
+    async def _rp_rip1_redistribute_out(self) -> list[RouteSpec]:
+        if not self.rp_rip1_enabled:
+            return []
+        return await self.rp_rip1_client.redistribute_out(self.rp_rip1_instance_id)
+
+    async def redistribute(self):
+        async with span("cp.redistribute"), self._lock, REDISTRIBUTE_SECONDS.time():
+            sla_routes, rip1_routes = await asyncio.gather(
+                self._rp_sla_redistribute_out(), self._rp_rip1_redistribute_out()
+            )
+            with span("cp.rebuild_rib"):
+                self._rebuild_rib(sla_routes, rip1_routes)
+
+            if self.rp_rip1_enabled:
+                await self.rp_rip1_client.redistribute_in(
+                    self.rp_rip1_instance_id,
+                    [
+                        route.as_json
+                        for route in self.damper.unsuppressed(self._rib.items)
+                    ],
+                )
+
+    def export_routes(self) -> list[CP_Route]:
+        """export_routes will return the ECMP set of best routes (up, lowest admin distance) for each prefix.
+        Routes suppressed by flap damping are left out."""
+        # in prefix order from the RIB's index, so there's nothing to sort afterwards
+        up_routes = self._rib.select(RouteFilter(status=RouteStatus.UP))
+        best_paths = select_best_paths(
+            self.damper.unsuppressed(up_routes),
+            key=lambda route: route.admin_distance,
+            max_paths=self.max_paths,
+        )
+        return flatten_best_paths(best_paths, in_order=True)
 
     async def rp_sla_evaluate_routes(self):
         if self.rp_sla_enabled:
@@ -174,13 +407,36 @@ class ControlPlane:
             "rp_sla_instance": self.rp_sla_instance_id,
             "rp_rip1_enabled": self.rp_rip1_enabled,
             "rp_rip1_instance": self.rp_rip1_instance_id,
+            "max_paths": self.max_paths,
             "static_routes": [route.as_json for route in self._static_routes.items],
         }
 
+    @property
+    def damping(self) -> list[DampingSpec]:
+        return self.damper.as_json
+
+    @property
+    def table_sizes(self) -> dict[str, int]:
+        return {"rib": len(self._rib), "static": len(self._static_routes)}
+
+    @property
+    def rib_version(self) -> int:
+        return self._rib.version
+
+    @property
+    def best_routes_version(self) -> tuple:
+        """best_routes_version changes whenever export_routes might return something different, including when a
+        suppressed route becomes reusable.  It leaves the damper alone (see FlapDamper.current_version)."""
+        return self._rib.version, self.damper.current_version(), self.max_paths
+
     @property
     def rib_routes(self):
         return self._rib.items
 
+    @property
+    def rib(self) -> CP_RIB:
+        return self._rib
+
     @property
     def static_routes(self):
         return self._static_routes.items
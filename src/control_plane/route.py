@@ -70,7 +70,8 @@ class CP_RIB(RIB_Base):
     route_type = CP_Route
 
     def __init__(self):
-        self._table: set[CP_Route] = set()
+        super().__init__()
+        self._table: set[CP_Route]
 
     @property
     def items(self) -> set[CP_Route]:
@@ -80,13 +81,15 @@ class CP_RIB(RIB_Base):
         if isinstance(route, dict):
             self._validate_fields(**route)
             route = self.route_type(**route)
-        self._table.add(route)
+        self._table_add(route)
+        self.touch()
 
     def remove(self, route: CP_Route | RouteSpec):
         if isinstance(route, dict):
             self._validate_fields(**route)
             route = self.route_type(**route)
 
-        self._table.discard(route)
+        self._table_discard(route)
+        self.touch()
 
     discard = remove
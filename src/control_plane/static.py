@@ -62,7 +62,8 @@ class CP_StaticTable(RIB_Base):
     route_type = CP_StaticRoute
 
     def __init__(self):
-        self._table: set[CP_StaticRoute] = set()
+        super().__init__()
+        self._table: set[CP_StaticRoute]
 
     @property
     def items(self) -> set[CP_StaticRoute]:
@@ -72,13 +73,15 @@ class CP_StaticTable(RIB_Base):
         if isinstance(route, dict):
             self._validate_fields(**route)
             route = self.route_type(**route)
-        self._table.add(route)
+        self._table_add(route)
+        self.touch()
 
     def remove(self, route: CP_StaticRoute | CP_StaticRouteSpec):
         if isinstance(route, dict):
             self._validate_fields(**route)
             route = self.route_type(**route)
 
-        self._table.discard(route)
+        self._table_discard(route)
+        self.touch()
 
     discard = remove
@@ -1 +1,2 @@
 from .main import *
+from .interfaces import *
@@ -0,0 +1,261 @@
+"""
+The local interfaces and their IPv4 addresses, read once and kept, so that asking whether an address is our own (or
+which interface reaches a neighbor) is a lookup rather than a system call.
+
+On Linux the addresses are read over rtnetlink, and a netlink socket subscribed to address and link changes keeps
+them up to date once start is called on a running event loop.  Elsewhere, or if netlink can't be opened, they fall
+back to the one address the routing table picks for reaching the internet, and are read again every
+REFRESH_INTERVAL seconds.
+"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+# how often addresses are read again when there's no netlink to say they've changed, in seconds
+REFRESH_INTERVAL = 30
+
+NLMSG_HEADER = struct.Struct("=IHHII")  # length, type, flags, sequence, port id
+IFADDRMSG = struct.Struct("=BBBBI")  # family, prefix length, flags, scope, interface index
+RTATTR = struct.Struct("=HH")  # length, type
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+
+@dataclass(frozen=True)
+class InterfaceAddress:
+    interface: str
+    index: int
+    address: ipaddress.IPv4Address
+    network: ipaddress.IPv4Network
+    broadcast: Optional[ipaddress.IPv4Address] = None
+
+    @property
+    def as_json(self) -> dict:
+        return {
+            "interface": self.interface,
+            "address": str(self.address),
+            "network": str(self.network),
+            "broadcast": str(self.broadcast) if self.broadcast is not None else None,
+        }
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def parse_addresses(data: bytes) -> tuple[list[InterfaceAddress], bool]:
+    """parse_addresses will read the RTM_NEWADDR messages in a netlink dump, and return the addresses along with
+    whether the dump is done"""
+    rslt = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+        if msg_type == NLMSG_DONE:
+            return rslt, True
+        if msg_type == NLMSG_ERROR:
+            (error,) = struct.unpack_from("=i", data, offset + NLMSG_HEADER.size)
+            raise OSError(-error, "netlink address dump failed")
+        if msg_type == RTM_NEWADDR:
+            address = _parse_address(data[offset + NLMSG_HEADER.size : offset + length])
+            if address is not None:
+                rslt.append(address)
+        offset += _align(length)
+    return rslt, False
+
+
+def _parse_address(body: bytes) -> Optional[InterfaceAddress]:
+    family, prefixlen, _, _, index = IFADDRMSG.unpack_from(body)
+    if family != socket.AF_INET:
+        return None
+    attrs = {}
+    offset = IFADDRMSG.size
+    while offset + RTATTR.size <= len(body):
+        length, attr_type = RTATTR.unpack_from(body, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type] = body[offset + RTATTR.size : offset + length]
+        offset += _align(length)
+    # IFA_LOCAL is the address itself; IFA_ADDRESS is the peer's on point-to-point links, and the same otherwise
+    local = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+    if local is None:
+        return None
+    address = ipaddress.IPv4Address(local)
+    try:
+        interface = socket.if_indextoname(index)
+    except OSError:
+        interface = attrs.get(IFA_LABEL, b"").rstrip(b"\0").decode()
+    broadcast = attrs.get(IFA_BROADCAST)
+    return InterfaceAddress(
+        interface,
+        index,
+        address,
+        ipaddress.IPv4Network((int(address), prefixlen), strict=False),
+        ipaddress.IPv4Address(broadcast) if broadcast is not None else None,
+    )
+
+
+def _netlink_addresses() -> list[InterfaceAddress]:
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as sock:
+        request = IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        sock.send(
+            NLMSG_HEADER.pack(NLMSG_HEADER.size + len(request), RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, 1, 0)
+            + request
+        )
+        rslt = []
+        done = False
+        while not done:
+            addresses, done = parse_addresses(sock.recv(65536))
+            rslt.extend(addresses)
+        return rslt
+
+
+def _routed_address() -> list[InterfaceAddress]:
+    # without netlink, the address the routing table picks for reaching the internet is the best there is
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            # connecting a UDP socket doesn't send anything
+            sock.connect(("8.8.8.8", 80))
+            address = ipaddress.IPv4Address(sock.getsockname()[0])
+    except OSError:
+        address = ipaddress.IPv4Address("127.0.0.1")
+    return [InterfaceAddress("", 0, address, ipaddress.IPv4Network(address))]
+
+
+def read_addresses() -> list[InterfaceAddress]:
+    """read_addresses will return the IPv4 addresses of every local interface"""
+    if hasattr(socket, "AF_NETLINK"):
+        try:
+            return _netlink_addresses()
+        except OSError as e:
+            log.warning(f"couldn't read interface addresses over netlink: {e}")
+    return _routed_address()
+
+
+class InterfaceManager:
+    """InterfaceManager keeps the local interface addresses: a set of them, for checking whether a packet is our own,
+    and the connected networks, for picking the interface (and our address on it) that reaches a neighbor."""
+
+    def __init__(self, addresses: Optional[list[InterfaceAddress]] = None):
+        # given addresses are kept as they are, rather than read from the system
+        self._static = addresses is not None
+        self._events: Optional[socket.socket] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._set(addresses if addresses is not None else read_addresses())
+
+    def _set(self, addresses: list[InterfaceAddress]):
+        self._addresses = addresses
+        self._local = frozenset(str(address.address) for address in addresses)
+        # most specific network first, so the first that holds an address is its longest match
+        self._networks = sorted(addresses, key=lambda address: -address.network.prefixlen)
+        self._read_at = time.monotonic()
+
+    def refresh(self):
+        """refresh will read the interface addresses again"""
+        if self._static:
+            return
+        addresses = read_addresses()
+        if set(addresses) != set(self._addresses):
+            log.info(f"interface addresses changed: {[address.as_json for address in addresses]}")
+        self._set(addresses)
+
+    def _check_stale(self):
+        # nothing tells us about changes until start is called, so fall back to reading them every so often
+        if self._events is None and self._timer is None and time.monotonic() - self._read_at > REFRESH_INTERVAL:
+            self.refresh()
+
+    @property
+    def addresses(self) -> list[InterfaceAddress]:
+        self._check_stale()
+        return list(self._addresses)
+
+    @property
+    def local_ips(self) -> frozenset[str]:
+        self._check_stale()
+        return self._local
+
+    def is_local(self, ip: str | ipaddress.IPv4Address) -> bool:
+        """is_local will return whether ip is one of our own addresses"""
+        return str(ip) in self.local_ips
+
+    def address_for(self, ip: str | ipaddress.IPv4Address) -> Optional[InterfaceAddress]:
+        """address_for will return our address on the connected network that holds ip (or whose broadcast address it
+        is), or None if ip isn't on a connected network"""
+        self._check_stale()
+        ip = ipaddress.IPv4Address(str(ip))
+        for address in self._networks:
+            if ip in address.network or ip == address.broadcast:
+                return address
+        return None
+
+    def interface_for(self, ip: str | ipaddress.IPv4Address) -> Optional[str]:
+        """interface_for will return the name of the interface that reaches ip directly, if there is one"""
+        address = self.address_for(ip)
+        if address is None or not address.interface:
+            return None
+        return address.interface
+
+    def start(self):
+        """start will keep the addresses up to date from a running event loop: on netlink notifications where
+        there are any, otherwise every REFRESH_INTERVAL seconds"""
+        if self._static or self._events is not None or self._timer is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if hasattr(socket, "AF_NETLINK"):
+            try:
+                events = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+                events.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+                events.setblocking(False)
+            except OSError as e:
+                log.warning(f"couldn't subscribe to interface changes over netlink: {e}")
+            else:
+                self._events = events
+                self._loop = loop
+                loop.add_reader(events.fileno(), self._on_event)
+                # anything that changed before the subscription
+                self.refresh()
+                return
+        self._timer = loop.call_later(REFRESH_INTERVAL, self._on_timer)
+
+    def _on_event(self):
+        # the notifications only say that something changed: drain them, and read the addresses once
+        try:
+            while self._events.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+        self.refresh()
+
+    def _on_timer(self):
+        self.refresh()
+        self._timer = asyncio.get_running_loop().call_later(REFRESH_INTERVAL, self._on_timer)
+
+    def stop(self):
+        """stop will stop keeping the addresses up to date"""
+        if self._events is not None:
+            if not self._loop.is_closed():
+                self._loop.remove_reader(self._events.fileno())
+            self._events.close()
+            self._events = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -1,90 +1,309 @@
 # This module will be the initial forwarding plane implementation for our software router
 import asyncio
+import ctypes
+import ctypes.util
 import ipaddress
 import logging
 import random
+import struct
+import sys
+import threading
 import time
-from typing import Type, Optional
+from typing import Iterable, Type, Optional
 
-import anyio
 import dpkt
 import socket
 
+from .interfaces import InterfaceManager
+
 log = logging.getLogger(__name__)
 
+UDP_HEADER = struct.Struct("!HHHH")  # source port, destination port, length, checksum (0: none)
+# the most messages the kernel takes in one sendmmsg (UIO_MAXIOV)
+SENDMMSG_MAX = 1024
+# pings that come back with no timeout of their own wait this long, in seconds
+PING_TIMEOUT = 1
+SOL_RAW = 255
+ICMP_FILTER = 1  # a mask of the ICMP types a raw socket won't be given
+
+Datagram = tuple[bytes | memoryview, tuple[str, int]]
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_sendmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+def _sockaddr_in(address: tuple[str, int]) -> bytes:
+    ip, port = address
+    return struct.pack("=HH4s8x", socket.AF_INET, socket.htons(port), socket.inet_aton(ip))
+
+
+def _c_buffer(data: bytes | bytearray | memoryview) -> ctypes.Array:
+    # a bytearray, or a writable view of one, is used where it is; anything read-only is copied, since ctypes can
+    # only share writable buffers
+    if isinstance(data, memoryview) and not data.readonly:
+        data = data.cast("B")
+    elif not isinstance(data, bytearray):
+        data = bytearray(data)
+    return (ctypes.c_char * len(data)).from_buffer(data)
+
+
+def send_datagrams(sock: socket.socket, datagrams: list[Datagram]) -> int:
+    """send_datagrams will send each (data, address) on sock: with sendmmsg, SENDMMSG_MAX to a system call, where
+    the platform has it, otherwise one sendto each.  It returns the number sent."""
+    if _sendmmsg is None or not isinstance(sock, socket.socket):
+        for data, address in datagrams:
+            sock.sendto(data, address)
+        return len(datagrams)
+
+    sent = 0
+    while sent < len(datagrams):
+        chunk = datagrams[sent : sent + SENDMMSG_MAX]
+        # the buffers and addresses are kept referenced here until the call returns
+        payloads = [_c_buffer(data) for data, _ in chunk]
+        names = [ctypes.create_string_buffer(_sockaddr_in(address), 16) for _, address in chunk]
+        iovecs = (_iovec * len(chunk))()
+        messages = (_mmsghdr * len(chunk))()
+        for i, payload in enumerate(payloads):
+            iovecs[i].iov_base = ctypes.addressof(payload)
+            iovecs[i].iov_len = len(payload)
+            header = messages[i].msg_hdr
+            header.msg_name = ctypes.cast(names[i], ctypes.c_void_p)
+            header.msg_namelen = 16
+            header.msg_iov = ctypes.pointer(iovecs[i])
+            header.msg_iovlen = 1
+        count = _sendmmsg(sock.fileno(), messages, len(chunk), 0)
+        if count <= 0:
+            # sending none of them isn't progress either, and trying again would only do the same
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"sendmmsg: {errno}")
+        sent += count
+    return sent
+
 
 class ForwardingPlane:
-    def __init__(self, *, sock: Type[socket.socket] = socket.socket):
+    """ForwardingPlane sends and receives on behalf of the protocols.  Sends go out on raw sockets that are kept open,
+    one per (IP protocol, interface), rather than one opened and closed per packet; close releases them.  Packets
+    for a directly connected neighbor (or a connected network's broadcast address) leave by that network's interface,
+    as the interface manager knows them."""
+
+    def __init__(
+        self, *, sock: Type[socket.socket] = socket.socket, interfaces: Optional[InterfaceManager] = None
+    ):
         self._sock = sock
+        self._sockets: dict[tuple[int, Optional[str]], socket.socket] = {}
+        # pings wait for their replies on a shared socket, so only one batch of them is out at a time
+        self._ping_lock = threading.Lock()
+        if interfaces is None:
+            interfaces = InterfaceManager()
+        self.interfaces = interfaces
+
+    def get_local_ip(self) -> str:
+        """get_local_ip will return our first address that isn't a loopback one"""
+        for address in self.interfaces.addresses:
+            if not address.address.is_loopback:
+                return str(address.address)
+        return "127.0.0.1"
+
+    def _socket(self, protocol: int, interface: Optional[str] = None) -> socket.socket:
+        """_socket will return the raw socket for protocol, bound to interface if one is given, opening it the first
+        time it's asked for.  Raw sockets are handed a copy of every packet of their protocol that arrives, so the
+        ones that are only sent on (all but the unbound ICMP socket, which pings read replies from) are given as little
+        as possible."""
+        key = protocol, interface
+        sock = self._sockets.get(key)
+        if sock is None:
+            sock = self._sock(socket.AF_INET, socket.SOCK_RAW, protocol)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            if interface is not None:
+                sock.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_BINDTODEVICE", 25), interface.encode())
+            if protocol != dpkt.ip.IP_PROTO_ICMP or interface is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1)
+                if protocol == dpkt.ip.IP_PROTO_ICMP:
+                    sock.setsockopt(SOL_RAW, ICMP_FILTER, struct.pack("=I", 0xFFFFFFFF))
+            self._sockets[key] = sock
+        return sock
+
+    def close(self):
+        """close will close the sockets held open for sending, and stop following interface changes"""
+        sockets, self._sockets = self._sockets, {}
+        for sock in sockets.values():
+            sock.close()
+        self.interfaces.stop()
 
     @staticmethod
-    def get_local_ip() -> str:
-        try:
-            # Create a new socket using the Internet address family
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            # Try to connect to an IP outside the local network (doesn't actually establish a connection)
-            s.connect(("8.8.8.8", 80))
-            ip_address = s.getsockname()[0]
-            s.close()
-            return ip_address
-        except Exception:
-            return "127.0.0.1"
-
-    def _send_ping(self, dest_ip: str, timeout_seconds: int) -> float:
+    def _echo_request(ident: int, seq: int) -> bytes:
         icmp_echo = dpkt.icmp.ICMP.Echo()
-        icmp_echo.id = random.randint(0, 65535)
-        icmp_echo.seq = random.randint(0, 65535)
+        icmp_echo.id = ident
+        icmp_echo.seq = seq
         icmp_echo.data = b""
 
         icmp = dpkt.icmp.ICMP()
         icmp.type = dpkt.icmp.ICMP_ECHO
         icmp.data = icmp_echo
+        return bytes(icmp)
 
-        sock = self._sock(socket.AF_INET, socket.SOCK_RAW, dpkt.ip.IP_PROTO_ICMP)
-        sock.connect((dest_ip, 1))
-        sock.settimeout(1)
-        # sock.sendto(bytes(icmp), (dest_ip, 1))
-        start = time.time()
-        sock.send(bytes(icmp))
-        buf = sock.recv(1024)
-        rtt = time.time() - start
-        sock.close()
-        return rtt
+    @staticmethod
+    def _echo_reply(packet: bytes) -> Optional[tuple[int, int]]:
+        """_echo_reply will return the (id, seq) of an echo reply, as received on a raw socket (with its IP header),
+        or None for any other packet"""
+        header_length = (packet[0] & 0x0F) * 4
+        if len(packet) < header_length + 8:
+            return None
+        icmp_type, _, _, ident, seq = struct.unpack_from("!BBHHH", packet, header_length)
+        if icmp_type != dpkt.icmp.ICMP_ECHOREPLY:
+            return None
+        return ident, seq
+
+    def ping_many(
+        self, dest_ips: Iterable[str], timeout_seconds: float = PING_TIMEOUT, interface: Optional[str] = None
+    ) -> dict[str, Optional[float]]:
+        """ping_many will send an echo request to each of dest_ips at once, and wait up to timeout_seconds (or
+        PING_TIMEOUT, if that's 0) for the replies.  It returns each one's round trip time in seconds, or None for
+        those that didn't reply.  It blocks while it waits, so from the event loop, run it in a thread."""
+        if timeout_seconds <= 0:
+            timeout_seconds = PING_TIMEOUT
+        dest_ips = list(dict.fromkeys(str(dest_ip) for dest_ip in dest_ips))
+        ident = random.randint(0, 65535)
+        first_seq = random.randint(0, 65535)
+        pending = {(first_seq + i) % 65536: dest_ip for i, dest_ip in enumerate(dest_ips)}
+        rslt: dict[str, Optional[float]] = dict.fromkeys(dest_ips)
+
+        requests: dict[Optional[str], list[Datagram]] = {}
+        for seq, dest_ip in pending.items():
+            dest_interface = interface if interface is not None else self.interfaces.interface_for(dest_ip)
+            requests.setdefault(dest_interface, []).append((self._echo_request(ident, seq), (dest_ip, 1)))
 
-    def ping(self, dest_ip: str, timeout_seconds: int = 1) -> float:
-        return self._send_ping(dest_ip, timeout_seconds)
+        with self._ping_lock:
+            # replies are read from the socket that isn't bound to an interface, which sees them all
+            sock = self._socket(dpkt.ip.IP_PROTO_ICMP)
+            start = time.time()
+            for dest_interface, datagrams in requests.items():
+                send_datagrams(self._socket(dpkt.ip.IP_PROTO_ICMP, dest_interface), datagrams)
+            deadline = start + timeout_seconds
+            while pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    packet, (host, _) = sock.recvfrom(1024)
+                except TimeoutError:
+                    break
+                reply = self._echo_reply(packet)
+                if reply is None or reply[0] != ident or pending.get(reply[1]) != host:
+                    continue  # somebody else's
+                rslt[pending.pop(reply[1])] = time.time() - start
+        return rslt
+
+    def ping(self, dest_ip: str, timeout_seconds: float = PING_TIMEOUT) -> float:
+        """ping will return the round trip time to dest_ip in seconds, raising TimeoutError if it doesn't reply"""
+        rtt = self.ping_many([dest_ip], timeout_seconds)[str(dest_ip)]
+        if rtt is None:
+            raise TimeoutError(f"no reply from {dest_ip}")
+        return rtt
 
     def send_udp(
-        self, data: bytes, dest_ip: str, dest_port: int, src_port: Optional[int] = None
+        self,
+        data: bytes | memoryview,
+        dest_ip: str,
+        dest_port: int,
+        src_port: Optional[int] = None,
+        interface: Optional[str] = None,
     ) -> int:
-        udp = dpkt.udp.UDP()
+        return self.send_udp_batch([data], dest_ip, dest_port, src_port, interface)
+
+    def send_udp_batch(
+        self,
+        datagrams: Iterable[bytes | memoryview],
+        dest_ip: str,
+        dest_port: int,
+        src_port: Optional[int] = None,
+        interface: Optional[str] = None,
+    ) -> int:
+        """send_udp_batch will send each of datagrams from src_port (a random one if None) to dest_ip:dest_port,
+        together (see send_datagrams), by interface or else the interface of dest_ip's connected network.  Each of
+        datagrams is copied in behind its UDP header before the next is taken, so they can be views of a buffer that is
+        reused from one to the next.  It returns the source port."""
         if src_port is None:
             src_port = random.randint(1024, 65535)
+        if interface is None:
+            interface = self.interfaces.interface_for(dest_ip)
 
-        udp.sport = src_port
-        udp.dport = dest_port
-        udp.data = data
-        udp.ulen = len(udp)
-
-        with self._sock(socket.AF_INET, socket.SOCK_RAW, dpkt.ip.IP_PROTO_UDP) as sock:
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            sock.sendto(bytes(udp), (dest_ip, dest_port))
+        packets = []
+        for data in datagrams:
+            packet = bytearray(UDP_HEADER.size + len(data))
+            UDP_HEADER.pack_into(packet, 0, src_port, dest_port, len(packet), 0)
+            packet[UDP_HEADER.size :] = data
+            packets.append((packet, (dest_ip, dest_port)))
 
+        send_datagrams(self._socket(dpkt.ip.IP_PROTO_UDP, interface), packets)
         return src_port
 
-    async def listen_udp(self, src_port: int, callback: callable):
-        log.info(f"listen_udp: src_port={src_port}")
-        async with await anyio.create_udp_socket(
-            local_port=src_port, local_host="0.0.0.0", reuse_port=True
-        ) as sock:
-            async for packet, (host, port) in sock:
-                log.info(f"received {packet} from {host}:{port}, calling callback")
+    @staticmethod
+    def _udp_listen_socket(src_port: int, interface: Optional[str] = None) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            if interface is not None:
+                sock.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_BINDTODEVICE", 25), interface.encode())
+            sock.bind(("0.0.0.0", src_port))
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    async def listen_udp(self, src_port: int, callback: callable, interface: Optional[str] = None):
+        """listen_udp will call callback with each datagram that arrives on src_port (on interface, if one is
+        given), and the address it came from"""
+        log.info(f"listen_udp: src_port={src_port}, interface={interface}")
+        loop = asyncio.get_running_loop()
+        with self._udp_listen_socket(src_port, interface) as sock:
+            while True:
+                packet, (host, port) = await loop.sock_recvfrom(sock, 65535)
+                log.debug(f"received {len(packet)} bytes from {host}:{port}, calling callback")
                 await callback(packet, (host, port))
 
     async def listen_udp_timed(
-        self, src_port: int, callback: callable, timeout_seconds: int
+        self, src_port: int, callback: callable, timeout_seconds: int, interface: Optional[str] = None
     ):
         try:
-            await asyncio.wait_for(self.listen_udp(src_port, callback), timeout_seconds)
+            await asyncio.wait_for(self.listen_udp(src_port, callback, interface), timeout_seconds)
         except asyncio.TimeoutError:
             log.info(f"listen_udp_timed: timeout_seconds={timeout_seconds}")
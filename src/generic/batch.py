@@ -0,0 +1,161 @@
+"""
+Batched requests: POST /batch runs an ordered list of operations against the service's own API in one round trip.
+
+Each operation is dispatched in-process through the app's ASGI stack, exactly as if it had arrived on its own, so
+validation, middleware (metrics, tracing) and error handling all apply per operation.  Operations run one after another
+in the order given, so a batch can mix writes and the reads that depend on them.
+
+A batch waits for each operation's whole response, so event streams, which never end, are refused (400) as soon as
+they start, and any other operation is given up on (504) after BATCH_OPERATION_TIMEOUT seconds.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Request
+from typing_extensions import NotRequired, TypedDict
+
+from src.generic.tracing import trace_headers
+
+log = logging.getLogger(__name__)
+
+BATCH_PATH = "/batch"
+BATCH_OPERATION_TIMEOUT = 30
+EVENT_STREAM_MEDIA_TYPE = b"text/event-stream"
+
+
+class BatchOperation(TypedDict):
+    method: str
+    path: str
+    params: NotRequired[Optional[dict[str, Any]]]
+    json: NotRequired[Any]
+
+
+class BatchResult(TypedDict):
+    status: int
+    body: Any
+
+
+async def call_app(
+    app, operation: BatchOperation, timeout: float = BATCH_OPERATION_TIMEOUT
+) -> BatchResult:
+    """call_app will run a single operation against app, and return its status and (decoded) body.  An event stream
+    is cut off as soon as it starts, and anything else once it has run for timeout seconds."""
+    headers = [(k.lower().encode(), v.encode()) for k, v in trace_headers().items()]
+    body = b""
+    if operation.get("json") is not None:
+        body = json.dumps(operation["json"]).encode()
+        headers.append((b"content-type", b"application/json"))
+
+    path, _, query_string = operation["path"].partition("?")
+    params = {k: v for k, v in (operation.get("params") or {}).items() if v is not None}
+    if params:
+        query_string = "&".join(filter(None, [query_string, urlencode(params, doseq=True)]))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": operation["method"].upper(),
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": headers,
+        "client": None,
+        "server": None,
+    }
+
+    request_sent = False
+    response_complete = asyncio.Event()
+    streaming = asyncio.Event()
+    status = 500
+    response_headers: dict[bytes, bytes] = {}
+    chunks: list[bytes] = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # only report a disconnect once the response is done, or the middleware would take it as the client going away
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers.update(message.get("headers", []))
+            if response_headers.get(b"content-type", b"").startswith(EVENT_STREAM_MEDIA_TYPE):
+                streaming.set()
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    app_call = asyncio.ensure_future(app(scope, receive, send))
+    stream_started = asyncio.ensure_future(streaming.wait())
+    try:
+        await asyncio.wait({app_call, stream_started}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        app_call.cancel()
+        raise
+    finally:
+        stream_started.cancel()
+    if not app_call.done():
+        # the app sees the client go away, and is cancelled in case it doesn't notice
+        response_complete.set()
+        app_call.cancel()
+        await asyncio.gather(app_call, return_exceptions=True)
+        if streaming.is_set():
+            return {"status": 400, "body": {"detail": "event streams can't be batched"}}
+        return {"status": 504, "body": {"detail": f"not finished within {timeout} seconds"}}
+
+    try:
+        app_call.result()
+    except Exception as e:
+        # starlette sends its 500 response and then re-raises, for the server to log
+        log.exception(f"batch operation {operation['method']} {operation['path']} failed")
+        if not response_complete.is_set():
+            status, chunks = 500, [str(e).encode()]
+    response_complete.set()
+
+    raw = b"".join(chunks)
+    content_type = response_headers.get(b"content-type", b"")
+    if not raw:
+        rslt_body = None
+    elif content_type.startswith(b"application/json"):
+        rslt_body = json.loads(raw)
+    else:
+        rslt_body = raw.decode(errors="replace")
+    return {"status": status, "body": rslt_body}
+
+
+async def run_batch(
+    app, operations: list[BatchOperation], stop_on_error: bool = False
+) -> list[BatchResult]:
+    """run_batch will run operations in order.  With stop_on_error, the operations after the first failure
+    (status >= 400) are not run, and are left out of the results."""
+    rslt = []
+    for operation in operations:
+        if operation["path"].split("?", 1)[0].rstrip("/") == BATCH_PATH:
+            result = {"status": 400, "body": {"detail": "batches can't be nested"}}
+        else:
+            result = await call_app(app, operation)
+        rslt.append(result)
+        if stop_on_error and result["status"] >= 400:
+            break
+    return rslt
+
+
+router = APIRouter()
+
+
+@router.post(BATCH_PATH)
+async def batch(
+    request: Request, operations: list[BatchOperation], stop_on_error: bool = False
+) -> list[BatchResult]:
+    return await run_batch(request.app, operations, stop_on_error)
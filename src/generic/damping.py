@@ -0,0 +1,288 @@
+"""
+Route flap damping, loosely following RFC 2439 (https://datatracker.ietf.org/doc/html/rfc2439).
+
+Every time a route is withdrawn (goes down) it picks up a fixed penalty.  The penalty decays exponentially with the
+configured half-life.  Once the penalty crosses the suppress threshold the route is suppressed, and it stays
+suppressed until the penalty decays below the reuse threshold.
+
+Decay is computed lazily: each entry only stores its penalty and the time that penalty was last brought up to date,
+so there are no per-route timers to run.  A penalty is only recalculated when somebody looks at it.
+
+As in RFC 2439 4.8.7, a route's history is dropped once its penalty has decayed below half the reuse threshold: the
+penalty and flap count of a route that is still there are cleared, and a route that has gone away (see discard) is
+forgotten altogether.  Penalized routes are checked for this every FORGET_INTERVAL seconds, by release_reusable.
+"""
+import math
+import time
+from typing import Optional, Iterable, TypeVar
+
+from typing_extensions import TypedDict
+
+from src.system import RouteStatus
+
+
+DampingKey = tuple[str, str]
+R = TypeVar("R")
+
+# how often release_reusable looks for penalties that have decayed far enough to forget, in seconds
+FORGET_INTERVAL = 60
+
+
+class DampingSpec(TypedDict):
+    prefix: str
+    next_hop: str
+    penalty: float
+    suppressed: bool
+    flaps: int
+    status: str
+    last_updated: float
+
+
+def damping_key(route) -> DampingKey:
+    """routes are damped per (prefix, next_hop), normalized to strings since routes built from config or json carry strings"""
+    return str(route.prefix), str(route.next_hop)
+
+
+class DampingState:
+    __slots__ = ("penalty", "updated", "suppressed", "flaps", "status")
+
+    def __init__(self, status: RouteStatus, now: float):
+        self.penalty = 0.0
+        self.updated = now
+        self.suppressed = False
+        self.flaps = 0
+        self.status = status
+
+
+class FlapDamper:
+    def __init__(
+        self,
+        enabled: bool = False,
+        penalty: int = 1000,
+        suppress_threshold: int = 2000,
+        reuse_threshold: int = 750,
+        half_life: int = 900,
+        max_suppress_time: int = 3600,
+    ):
+        if not 0 < reuse_threshold < suppress_threshold:
+            raise ValueError(
+                f"reuse_threshold ({reuse_threshold}) must be positive and below suppress_threshold ({suppress_threshold})"
+            )
+        self.enabled = enabled
+        self.flap_penalty = penalty
+        self.suppress_threshold = suppress_threshold
+        self.reuse_threshold = reuse_threshold
+        self.half_life = half_life
+        self.max_suppress_time = max_suppress_time
+        # RFC 2439 4.2: the penalty ceiling that keeps a route from being suppressed longer than max_suppress_time
+        self.max_penalty = reuse_threshold * math.pow(2, max_suppress_time / half_life)
+
+        self._states: dict[DampingKey, DampingState] = {}
+        self._suppressed: set[DampingKey] = set()
+        # the routes carrying a penalty, which are forgotten (or cleared) once it has decayed
+        self._penalized: set[DampingKey] = set()
+        self._next_forget = -math.inf
+        # bumped whenever the set of suppressed routes (or whether it applies) changes
+        self.version = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "FlapDamper":
+        return cls(
+            enabled=config["damping_enabled"],
+            penalty=config["damping_penalty"],
+            suppress_threshold=config["damping_suppress_threshold"],
+            reuse_threshold=config["damping_reuse_threshold"],
+            half_life=config["damping_half_life"],
+            max_suppress_time=config["damping_max_suppress_time"],
+        )
+
+    @property
+    def settings(self) -> dict[str, int | bool]:
+        return {
+            "damping_enabled": self.enabled,
+            "damping_penalty": self.flap_penalty,
+            "damping_suppress_threshold": self.suppress_threshold,
+            "damping_reuse_threshold": self.reuse_threshold,
+            "damping_half_life": self.half_life,
+            "damping_max_suppress_time": self.max_suppress_time,
+        }
+
+    def reconfigure(self, config: dict):
+        """reconfigure will apply new damping settings, keeping the penalties already accrued"""
+        settings = self.settings | {k: v for k, v in config.items() if k in self.settings}
+        # validate by building a throwaway damper before touching our own state
+        new = FlapDamper.from_config(settings)
+        self.enabled = new.enabled
+        self.flap_penalty = new.flap_penalty
+        self.suppress_threshold = new.suppress_threshold
+        self.reuse_threshold = new.reuse_threshold
+        self.half_life = new.half_life
+        self.max_suppress_time = new.max_suppress_time
+        self.max_penalty = new.max_penalty
+        self.version += 1
+
+    def _decay(self, key: DampingKey, state: DampingState, now: float):
+        elapsed = now - state.updated
+        if elapsed > 0:
+            state.penalty *= math.pow(0.5, elapsed / self.half_life)
+            state.updated = now
+
+        if state.suppressed and state.penalty < self.reuse_threshold:
+            state.suppressed = False
+            self._suppressed.discard(key)
+            self.version += 1
+
+    def _reuse_time(self, state: DampingState) -> float:
+        # when the penalty will have decayed to the reuse threshold
+        return state.updated + self.half_life * math.log2(state.penalty / self.reuse_threshold)
+
+    def current_version(self, now: Optional[float] = None) -> int:
+        """current_version will return what version would be if release_reusable ran at now, without releasing
+        anything.  Each release bumps version by one, so the two agree before and after the release actually happens,
+        and a version read before a listing is built still holds once building it has released routes."""
+        if now is None:
+            now = time.time()
+        return self.version + sum(
+            self._reuse_time(self._states[key]) < now for key in self._suppressed
+        )
+
+    def next_reuse(self) -> Optional[float]:
+        """next_reuse will return the time the next suppressed route becomes reusable, or None if none are suppressed"""
+        return min(
+            (self._reuse_time(self._states[key]) for key in self._suppressed),
+            default=None,
+        )
+
+    def update(
+        self, key: DampingKey, status: RouteStatus, now: Optional[float] = None
+    ) -> bool:
+        """update will record the current status of a route, and return whether it changed.
+        A change to DOWN is a flap, and is penalized."""
+        if now is None:
+            now = time.time()
+
+        status = RouteStatus(status)
+        state = self._states.get(key)
+        if state is None:
+            self._states[key] = DampingState(status, now)
+            return True
+
+        self._decay(key, state, now)
+        if state.status == status:
+            return False
+
+        state.status = status
+        if status != RouteStatus.UP:
+            state.flaps += 1
+            state.penalty = min(state.penalty + self.flap_penalty, self.max_penalty)
+            self._penalized.add(key)
+            if state.penalty >= self.suppress_threshold and not state.suppressed:
+                state.suppressed = True
+                self._suppressed.add(key)
+                self.version += 1
+
+        return True
+
+    def is_suppressed(self, key: DampingKey, now: Optional[float] = None) -> bool:
+        if not self.enabled or key not in self._suppressed:
+            return False
+
+        if now is None:
+            now = time.time()
+        self._decay(key, self._states[key], now)
+        return key in self._suppressed
+
+    def unsuppressed(self, routes: Iterable[R]) -> Iterable[R]:
+        """unsuppressed will filter suppressed routes out of routes.  When nothing is suppressed, routes is returned as-is."""
+        if not self.enabled or not self._suppressed:
+            return routes
+        return (
+            route for route in routes if not self.is_suppressed(damping_key(route))
+        )
+
+    def release_reusable(self, now: Optional[float] = None) -> list[DampingKey]:
+        """release_reusable will un-suppress any routes that have decayed below the reuse threshold, and return their keys.
+        Only suppressed routes are looked at, so this is cheap to call often."""
+        if now is None:
+            now = time.time()
+
+        released = []
+        for key in list(self._suppressed):
+            self._decay(key, self._states[key], now)
+            if key not in self._suppressed:
+                released.append(key)
+
+        if now >= self._next_forget:
+            self._next_forget = now + FORGET_INTERVAL
+            for key in list(self._penalized):
+                self._forget_decayed(key, self._states[key], now)
+        return released
+
+    def _forget_decayed(self, key: DampingKey, state: DampingState, now: float) -> bool:
+        self._decay(key, state, now)
+        if state.suppressed or state.penalty >= self.reuse_threshold / 2:
+            return False
+        if state.status == RouteStatus.UP:
+            # the route is still there: keep its status, but its flaps are history
+            state.penalty = 0.0
+            state.flaps = 0
+            self._penalized.discard(key)
+        else:
+            self.forget(key)
+        return True
+
+    def discard(self, key: DampingKey, now: Optional[float] = None):
+        """discard will drop the state of a route that has gone away: straight away if its penalty has decayed below
+        half the reuse threshold, otherwise once it has, so that a route that comes straight back is still damped"""
+        state = self._states.get(key)
+        if state is None:
+            return
+        if now is None:
+            now = time.time()
+        state.status = RouteStatus.DOWN
+        if not self._forget_decayed(key, state, now):
+            self._penalized.add(key)
+
+    def forget(self, key: DampingKey):
+        self._states.pop(key, None)
+        self._penalized.discard(key)
+        if key in self._suppressed:
+            self._suppressed.discard(key)
+            self.version += 1
+
+    def penalty(self, key: DampingKey, now: Optional[float] = None) -> float:
+        state = self._states.get(key)
+        if state is None:
+            return 0.0
+
+        if now is None:
+            now = time.time()
+        self._decay(key, state, now)
+        return state.penalty
+
+    @property
+    def suppressed(self) -> set[DampingKey]:
+        self.release_reusable()
+        return set(self._suppressed)
+
+    @property
+    def as_json(self) -> list[DampingSpec]:
+        """as_json will return the damping state of every route that has flapped"""
+        now = time.time()
+        rslt = []
+        for key, state in self._states.items():
+            if not state.flaps:
+                continue
+            self._decay(key, state, now)
+            rslt.append(
+                {
+                    "prefix": key[0],
+                    "next_hop": key[1],
+                    "penalty": round(state.penalty, 1),
+                    "suppressed": state.suppressed,
+                    "flaps": state.flaps,
+                    "status": state.status.value,
+                    "last_updated": state.updated,
+                }
+            )
+        return rslt
@@ -0,0 +1,39 @@
+"""
+ETags for the route-listing endpoints, so pollers can revalidate instead of downloading an unchanged table.
+
+An ETag is built from version counters (RIB_Base.version, FlapDamper.version, ...) rather than from the content, so
+checking it costs nothing and a 304 is returned without serializing a single route.  The versions start over when a
+service restarts, so every ETag also carries an id for this run of the process.
+"""
+import os
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+BOOT_ID = os.urandom(4).hex()
+
+
+def make_etag(*versions) -> str:
+    return '"' + "-".join([BOOT_ID, *(str(version) for version in versions)]) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """etag_matches will tell whether the request's If-None-Match already names etag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in header.split(",")
+    )
+
+
+def not_modified(etag: str, vary: Optional[str] = None) -> Response:
+    """not_modified will return a 304 for etag.  vary names the request headers the representation depends on, which
+    a 304 has to repeat."""
+    headers = {"ETag": etag}
+    if vary is not None:
+        headers["Vary"] = vary
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,309 @@
+"""
+Minimal Prometheus-style metrics: counters, gauges and histograms, rendered in the Prometheus text exposition format
+(https://prometheus.io/docs/instrumenting/exposition_formats/).
+
+These are meant to be left on in production, so the hot path is kept to a dict lookup and an add.  Gauges for things
+like table sizes are usually given a function instead, which is only called when /metrics is scraped.
+
+Registry.snapshot gives the same values as plain data (served as JSON on /metrics/summary), for consumers that would
+rather not parse the text format, like PyRP Monitor's dashboard.
+
+Updates aren't locked.  The async services update metrics from a single event loop, and in the threadpool endpoints
+the worst case is a lost increment, which is an acceptable trade for keeping observe() cheap.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+from typing_extensions import TypedDict
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = tuple[str, ...]
+
+
+class MetricSnapshot(TypedDict):
+    type: str
+    # one per label set: {"labels": {...}, "value": ...}, or for a histogram {"labels", "count", "sum", "buckets"}
+    # with buckets the (not cumulative) count per upper bound in bounds, then +Inf
+    samples: list[dict]
+    bounds: Optional[list[float]]
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric"):
+        # a module imported under two names (src.rp_sla and rp_sla in the tests) defines its metrics twice, the
+        # newest definition wins
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["_Metric"]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        lines.append("")
+        return "\n".join(lines)
+
+    def snapshot(self) -> dict[str, MetricSnapshot]:
+        return {
+            metric.name: {
+                "type": metric.type,
+                "samples": metric.snapshot_samples(),
+                "bounds": list(getattr(metric, "buckets", ())) or None,
+            }
+            for metric in self._metrics.values()
+        }
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[LabelValues, object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values) -> "_Metric":
+        """labels will return the child metric for the given label values, creating it on first use"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}, got {values}"
+                )
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        return type(self)(self.name, self.documentation, registry=None)
+
+    def _items(self) -> Iterable[tuple[LabelValues, "_Metric"]]:
+        if self.labelnames:
+            return self._children.items()
+        return [((), self)]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def snapshot_samples(self) -> list[dict]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        self.value = 0.0
+        super().__init__(*args, **kwargs)
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in self._items()
+        ]
+
+    def snapshot_samples(self) -> list[dict]:
+        return [
+            {"labels": dict(zip(self.labelnames, values)), "value": child.value}
+            for values, child in self._items()
+        ]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        self.value = 0.0
+        self._function: Optional[Callable[[], float | dict[LabelValues, float]]] = None
+        super().__init__(*args, **kwargs)
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float | dict[LabelValues, float]]):
+        """set_function will have the gauge call function whenever it is rendered, instead of holding a value.
+        For a gauge with labels, function returns a dict mapping label values to values."""
+        self._function = function
+
+    def _values(self) -> Iterable[tuple[LabelValues, float]]:
+        if self._function is None:
+            return ((values, child.value) for values, child in self._items())
+        if self.labelnames:
+            return self._function().items()
+        return [((), self._function())]
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+            for values, value in self._values()
+        ]
+
+    def snapshot_samples(self) -> list[dict]:
+        return [
+            {"labels": dict(zip(self.labelnames, values)), "value": value}
+            for values, value in self._values()
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket plus +Inf, not cumulative until rendered
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        super().__init__(*args, **kwargs)
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets, registry=None)
+
+    def observe(self, value: float):
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        """time will return a context manager that observes how long its block took, in seconds"""
+        return _Timer(self)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for values, child in self._items():
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float("inf"),), child._counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+    def snapshot_samples(self) -> list[dict]:
+        return [
+            {
+                "labels": dict(zip(self.labelnames, values)),
+                "count": child.count,
+                "sum": child.sum,
+                "buckets": list(child._counts),
+            }
+            for values, child in self._items()
+        ]
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "pyrp_http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["method", "route", "status"],
+)
+
+
+async def http_metrics_middleware(request, call_next):
+    """http_metrics_middleware times every request against the route template it matched, not the raw path,
+    so instance ids don't blow up the number of label values.  Register it with app.middleware("http")."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUEST_SECONDS.labels(request.method, path, status).observe(
+            time.perf_counter() - start
+        )
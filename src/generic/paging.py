@@ -0,0 +1,143 @@
+"""
+Cursor pagination and server-side filtering for route listings.
+
+Every route listing takes the query parameters of RouteQuery:
+* prefix (with match exact, longer or lpm), next_hop, source and status filter the listing on the server
+* limit splits it into pages.  The body becomes {"routes": [...], "next_cursor": ...}, and sending next_cursor back
+  as cursor gets the next page.  next_cursor is null on the last page.
+* start begins the listing at a prefix (or address) rather than at the top, e.g. to jump to a part of a large table
+
+Routes are listed in a stable order (by prefix, then next hop, then source).  A cursor is the position of the last
+route on its page, not an offset, so routes added or removed between requests don't make the next page skip or repeat
+any.  Listings of a RIB are served from its index (see RIB_Base.select), so one page of a large table costs about the
+size of the page.
+"""
+import base64
+import binascii
+import itertools
+import json
+from ipaddress import ip_network
+from typing import Iterable, Optional
+
+from fastapi import HTTPException, Query, Request, Response
+from typing_extensions import TypedDict
+
+from src.generic.etag import make_etag
+from src.generic.rib import PrefixMatch, RIB_Base, Route, RouteFilter, prefix_key, route_order
+from src.generic.streaming import ndjson_response, wants_ndjson
+from src.system import RouteStatus, SourceCode
+
+MAX_PAGE_SIZE = 10000
+# NDJSON bodies are just routes, so a streamed page's cursor is sent as a header (JSON pages get it too)
+NEXT_CURSOR_HEADER = "X-PyRP-Next-Cursor"
+# a listing is JSON or NDJSON depending on the Accept header
+VARY = "Accept"
+
+
+class RoutePage(TypedDict):
+    routes: list[dict]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(route: Route) -> str:
+    return base64.urlsafe_b64encode(json.dumps(route_order(route)).encode()).decode()
+
+
+def start_at(prefix: str) -> tuple:
+    """start_at will return the position just before the routes for prefix, to use as a cursor.  prefix doesn't need
+    to be in the table, the listing starts with the next prefix that is."""
+    try:
+        return prefix_key(ip_network(prefix, strict=False)), (0, 0), ""
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"invalid start prefix: {prefix}")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        prefix, next_hop, source = json.loads(base64.urlsafe_b64decode(cursor))
+        after = tuple(prefix), tuple(next_hop), source
+        if not (
+            len(after[0]) == 3
+            and len(after[1]) == 2
+            and all(isinstance(v, int) for v in after[0] + after[1])
+            and isinstance(source, str)
+        ):
+            raise ValueError(cursor)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail=f"invalid cursor: {cursor}")
+    return after
+
+
+class RouteQuery:
+    """RouteQuery is the FastAPI dependency that parses the listing parameters: `query: RouteQuery = Depends()`"""
+
+    def __init__(
+        self,
+        prefix: Optional[str] = None,
+        match: PrefixMatch = "exact",
+        next_hop: Optional[str] = None,
+        source: Optional[SourceCode] = None,
+        status: Optional[RouteStatus] = None,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        start: Optional[str] = None,
+    ):
+        try:
+            self.filter = RouteFilter(prefix, match, next_hop, source, status)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        self.limit = limit
+        # a cursor carries on from a page that itself started somewhere, so it takes precedence
+        if cursor:
+            self.after = decode_cursor(cursor)
+        elif start:
+            self.after = start_at(start)
+        else:
+            self.after = None
+
+    def select(self, routes: RIB_Base | Iterable[Route]) -> tuple[Iterable[Route], Optional[str]]:
+        """select will return the routes for this query and the cursor of the next page.  routes is a RIB, which is
+        searched through its index, or any other routes, which are scanned."""
+        if isinstance(routes, RIB_Base):
+            selected = routes.select(self.filter, self.after)
+        else:
+            selected = self.filter.select(routes, self.after)
+        if self.limit is None:
+            return selected, None
+
+        page = list(itertools.islice(selected, self.limit + 1))
+        if len(page) <= self.limit:
+            return page, None
+        del page[self.limit:]
+        return page, encode_cursor(page[-1])
+
+    def etag(self, request: Request, *versions) -> str:
+        """etag will return the ETag of this listing of a table at versions.  The JSON and NDJSON listings of the
+        same table are different bodies, so each has its own."""
+        if wants_ndjson(request):
+            return make_etag(*versions, "ndjson")
+        return make_etag(*versions)
+
+    def respond(
+        self,
+        request: Request,
+        response: Response,
+        routes: RIB_Base | Iterable[Route],
+        etag: Optional[str] = None,
+    ):
+        """respond will return the listing as JSON (a list, or a RoutePage with limit), or as NDJSON if it was
+        asked for"""
+        selected, next_cursor = self.select(routes)
+        headers = {"Vary": VARY}
+        if etag is not None:
+            headers["ETag"] = etag
+        if next_cursor is not None:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
+
+        if wants_ndjson(request):
+            return ndjson_response(selected, headers=headers)
+        response.headers.update(headers)
+        rslt = [route.as_json for route in selected]
+        if self.limit is None:
+            return rslt
+        return {"routes": rslt, "next_cursor": next_cursor}
@@ -0,0 +1,320 @@
+"""
+On-demand profiling of a running service.
+
+Three tools, each started and stopped over HTTP (see router) so a slow service can be looked at without a restart:
+
+* a sampling profiler: a background thread that snapshots every thread's stack at a fixed interval.  Results come out
+  as collapsed stacks ("frame;frame;frame count" lines), the input format of flamegraph.pl and speedscope.
+* cProfile, for exact call counts over a window.  Results come out as a pstats file, or as text.
+* tracemalloc snapshots, optionally compared to the previous snapshot to see what grew.
+
+Nothing is installed until a tool is started: no thread, no profile hook and no allocation tracing, so when profiling
+is off it costs nothing.
+"""
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Response
+from starlette.responses import PlainTextResponse
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.stacks.clear()
+        self.samples = 0
+        self.started, self.stopped = time.time(), None
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pyrp-stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.time()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """collapsed will return the samples as collapsed stacks, one "frame;frame;frame count" line per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """Profiler holds the state of all three tools for a process.  The module level PROFILER is the one the router uses."""
+
+    def __init__(self):
+        self.sampler: Optional[StackSampler] = None
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.cprofile_running = False
+        self.tracemalloc_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+
+    def _stop_after(self, tool: str, seconds: Optional[float], stop):
+        if seconds is not None:
+            self._timers[tool] = asyncio.get_running_loop().call_later(seconds, stop)
+
+    def _cancel_timer(self, tool: str):
+        timer = self._timers.pop(tool, None)
+        if timer is not None:
+            timer.cancel()
+
+    def start_sampling(self, interval: float, seconds: Optional[float] = None):
+        if self.sampler is not None and self.sampler.running:
+            raise RuntimeError("sampling profiler already running")
+        self.sampler = StackSampler(interval)
+        self.sampler.start()
+        self._stop_after("sample", seconds, self.stop_sampling)
+
+    def stop_sampling(self):
+        self._cancel_timer("sample")
+        if self.sampler is None or not self.sampler.running:
+            raise RuntimeError("sampling profiler not running")
+        self.sampler.stop()
+
+    def start_cprofile(self, seconds: Optional[float] = None):
+        if self.cprofile_running:
+            raise RuntimeError("cProfile already running")
+        profile = cProfile.Profile()
+        # raises ValueError if some other profiler is active in this process
+        profile.enable()
+        self.cprofile, self.cprofile_running = profile, True
+        self._stop_after("cprofile", seconds, self.stop_cprofile)
+
+    def stop_cprofile(self):
+        self._cancel_timer("cprofile")
+        if not self.cprofile_running:
+            raise RuntimeError("cProfile not running")
+        self.cprofile.disable()
+        self.cprofile_running = False
+
+    def cprofile_stats(self) -> pstats.Stats:
+        if self.cprofile is None or self.cprofile_running:
+            raise RuntimeError("no finished cProfile run")
+        return pstats.Stats(self.cprofile)
+
+    def cprofile_pstats(self) -> bytes:
+        """cprofile_pstats will return the last cProfile run in the format pstats.Stats (and snakeviz etc) load from a file"""
+        self.cprofile.create_stats()
+        return marshal.dumps(self.cprofile.stats)
+
+    @staticmethod
+    def start_tracemalloc(frames: int):
+        if tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc already tracing")
+        tracemalloc.start(frames)
+
+    def stop_tracemalloc(self):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc not tracing")
+        tracemalloc.stop()
+        self.tracemalloc_snapshot = None
+
+    def take_snapshot(
+        self,
+        key_type: str = "lineno",
+        limit: int = 50,
+        compare: bool = False,
+    ) -> str:
+        """take_snapshot will return the top allocations as text.  With compare, it returns the biggest changes
+        since the previous snapshot instead."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc not tracing")
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        previous, self.tracemalloc_snapshot = self.tracemalloc_snapshot, snapshot
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced memory: current {current} B, peak {peak} B"]
+        if compare and previous is not None:
+            lines.extend(str(stat) for stat in snapshot.compare_to(previous, key_type)[:limit])
+        else:
+            lines.extend(str(stat) for stat in snapshot.statistics(key_type)[:limit])
+        return "\n".join(lines) + "\n"
+
+    @property
+    def as_json(self) -> dict:
+        sampler = self.sampler
+        return {
+            "sampling": {
+                "running": sampler is not None and sampler.running,
+                "samples": sampler.samples if sampler is not None else 0,
+                "interval": sampler.interval if sampler is not None else None,
+                "started": sampler.started if sampler is not None else None,
+                "stopped": sampler.stopped if sampler is not None else None,
+            },
+            "cprofile": {
+                "running": self.cprofile_running,
+                "has_results": self.cprofile is not None and not self.cprofile_running,
+            },
+            "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+        }
+
+
+PROFILER = Profiler()
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+def _conflict(e: Exception):
+    return HTTPException(status_code=409, detail=str(e))
+
+
+def _attachment(content: str | bytes, filename: str, media_type: str) -> Response:
+    return Response(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# all of these are async on purpose: they run on the event loop thread, which is what cProfile needs to be enabled on
+# to see the request handlers, and what the auto-stop timers are scheduled on
+
+
+@router.get("/profile")
+async def get_profile_status():
+    return PROFILER.as_json
+
+
+@router.post("/profile/sample/start")
+async def start_sampling(interval_ms: float = 5, seconds: Optional[float] = None):
+    try:
+        PROFILER.start_sampling(interval_ms / 1000, seconds)
+    except RuntimeError as e:
+        raise _conflict(e)
+    return PROFILER.as_json
+
+
+@router.post("/profile/sample/stop")
+async def stop_sampling():
+    try:
+        PROFILER.stop_sampling()
+    except RuntimeError as e:
+        raise _conflict(e)
+    return PROFILER.as_json
+
+
+@router.get("/profile/sample")
+async def get_sampling_results():
+    if PROFILER.sampler is None:
+        raise HTTPException(status_code=404, detail="no sampling profile taken")
+    return _attachment(PROFILER.sampler.collapsed(), "profile.collapsed", "text/plain")
+
+
+@router.post("/profile/cprofile/start")
+async def start_cprofile(seconds: Optional[float] = None):
+    try:
+        PROFILER.start_cprofile(seconds)
+    except (RuntimeError, ValueError) as e:
+        raise _conflict(e)
+    return PROFILER.as_json
+
+
+@router.post("/profile/cprofile/stop")
+async def stop_cprofile():
+    try:
+        PROFILER.stop_cprofile()
+    except RuntimeError as e:
+        raise _conflict(e)
+    return PROFILER.as_json
+
+
+@router.get("/profile/cprofile")
+async def get_cprofile_results(
+    format: Literal["pstats", "text"] = "pstats",
+    sort: str = "cumulative",
+    limit: int = 50,
+):
+    try:
+        stats = PROFILER.cprofile_stats()
+    except RuntimeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    if format == "pstats":
+        return _attachment(
+            PROFILER.cprofile_pstats(), "profile.pstats", "application/octet-stream"
+        )
+
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(limit)
+    return PlainTextResponse(stream.getvalue())
+
+
+@router.post("/tracemalloc/start")
+async def start_tracemalloc(frames: int = 1):
+    try:
+        PROFILER.start_tracemalloc(frames)
+    except RuntimeError as e:
+        raise _conflict(e)
+    return PROFILER.as_json
+
+
+@router.post("/tracemalloc/stop")
+async def stop_tracemalloc():
+    try:
+        PROFILER.stop_tracemalloc()
+    except RuntimeError as e:
+        raise _conflict(e)
+    return PROFILER.as_json
+
+
+@router.get("/tracemalloc/snapshot")
+async def get_tracemalloc_snapshot(
+    key_type: Literal["lineno", "filename", "traceback"] = "lineno",
+    limit: int = 50,
+    compare: bool = False,
+):
+    try:
+        rslt = PROFILER.take_snapshot(key_type, limit, compare)
+    except RuntimeError as e:
+        raise _conflict(e)
+    return PlainTextResponse(rslt)
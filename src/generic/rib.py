@@ -1,6 +1,13 @@
 import abc
+import asyncio
+import bisect
+import ipaddress
+import itertools
 import time
-from typing import Type, Optional
+from collections import deque
+from contextlib import contextmanager
+from enum import Enum
+from typing import Type, Optional, Iterable, Iterator, Callable, Any, TypeVar, Literal
 from typing_extensions import TypedDict
 
 from src.system import IPNetwork, IPAddress, SourceCode, RouteStatus
@@ -222,7 +229,12 @@ class Route:
         }
 
     def __hash__(self):
-        return hash(self._value)
+        # a route is hashed for its table and for each of the table's indexes, and _value is only ever set in __init__
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(self._value)
+            return self._hash
 
     def __eq__(self, other):
         try:
@@ -230,6 +242,16 @@ class Route:
         except TypeError:
             return False
 
+    @property
+    def next_hop_key(self) -> tuple[int, int]:
+        """next_hop_key is the next hop as (ip version, address), for ordering.  Routes built from config or json
+        carry strings, so it is parsed the first time it's asked for and kept."""
+        try:
+            return self._next_hop_key
+        except AttributeError:
+            self._next_hop_key = _address_key(self.next_hop)
+            return self._next_hop_key
+
 
 class RedistributeOutRoute(Route):
     intrinsic_fields = [
@@ -276,9 +298,427 @@ class RedistributeOutRoute(Route):
         }
 
 
+PrefixMatch = Literal["exact", "longer", "lpm"]
+
+# a next hop or source filter is answered from its index when it matches fewer than 1 in this many routes, otherwise
+# by walking the table in order and skipping non-matches, which finds a page's worth sooner than sorting them all
+SPARSE_FILTER_RATIO = 8
+
+
+def prefix_key(prefix: IPNetwork | str) -> tuple[int, int, int]:
+    """prefix_key will return (ip version, network address, prefix length), which sorts prefixes by address, less
+    specific first"""
+    if isinstance(prefix, str):
+        prefix = ipaddress.ip_network(prefix)
+    return prefix.version, int(prefix.network_address), prefix.prefixlen
+
+
+def _address_key(address: IPAddress | str) -> tuple[int, int]:
+    if isinstance(address, str):
+        address = ipaddress.ip_address(address)
+    return address.version, int(address)
+
+
+def _source_key(source: SourceCode | str | None) -> str:
+    if isinstance(source, Enum):
+        return source.value
+    return source or ""
+
+
+def route_order(route: Route) -> tuple:
+    """route_order is the stable order routes are listed in: by prefix, then next hop, then source"""
+    return (
+        prefix_key(route.prefix),
+        route.next_hop_key,
+        _source_key(getattr(route, "route_source", None)),
+    )
+
+
+def _host_bits(key: tuple[int, int, int]) -> int:
+    version, _, prefixlen = key
+    return (32 if version == 4 else 128) - prefixlen
+
+
+def _covers(outer: tuple[int, int, int], inner: tuple[int, int, int]) -> bool:
+    host_bits = _host_bits(outer)
+    return (
+        outer[0] == inner[0]
+        and outer[2] <= inner[2]
+        and outer[1] >> host_bits == inner[1] >> host_bits
+    )
+
+
+def _covering_keys(key: tuple[int, int, int]) -> Iterator[tuple[int, int, int]]:
+    """_covering_keys will return the keys of key and every prefix that covers it, most specific first"""
+    version, address, prefixlen = key
+    bits = 32 if version == 4 else 128
+    for length in range(prefixlen, -1, -1):
+        host_bits = bits - length
+        yield version, address >> host_bits << host_bits, length
+
+
+def _ordered(routes: Iterable[Route], after: Optional[tuple] = None) -> list[Route]:
+    if after is None and len(routes := list(routes)) == 1:
+        return routes  # most prefixes have just the one route
+    rslt = sorted(routes, key=route_order)
+    if after is not None:
+        rslt = [route for route in rslt if route_order(route) > after]
+    return rslt
+
+
+class RouteIndex:
+    """RouteIndex finds a RIB's routes without scanning the table: by prefix, by next hop and by source.
+
+    The prefixes are also kept sorted, for listing in order.  Prefixes added or removed since the last listing are
+    merged in when the order is next needed, so a burst of updates costs one merge rather than an insert into the
+    middle of a large list each.  Status isn't indexed, it is changed in place on the routes.
+    """
+
+    def __init__(self):
+        self.prefixes: dict[tuple, set[Route]] = {}
+        self.next_hops: dict[tuple, set[Route]] = {}
+        self.sources: dict[str, set[Route]] = {}
+        self._sorted_keys: list[tuple] = []
+        self._added_keys: set[tuple] = set()
+        self._removed_keys: set[tuple] = set()
+
+    @staticmethod
+    def _add_to(index: dict, key, route: Route):
+        bucket = index.get(key)
+        if bucket is None:
+            bucket = index[key] = set()
+        bucket.add(route)
+
+    @staticmethod
+    def _discard_from(index: dict, key, route: Route):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.discard(route)
+            if not bucket:
+                del index[key]
+
+    def get(self, route: Route) -> Optional[Route]:
+        """get will return the stored route equal to route.  It can differ from route in the fields that aren't part
+        of its identity, like route_source."""
+        for stored in self.prefixes.get(prefix_key(route.prefix), ()):
+            if stored == route:
+                return stored
+        return None
+
+    def add(self, route: Route):
+        key = prefix_key(route.prefix)
+        if key not in self.prefixes:
+            if key in self._removed_keys:
+                self._removed_keys.discard(key)
+            else:
+                self._added_keys.add(key)
+        self._add_to(self.prefixes, key, route)
+        self._add_to(self.next_hops, route.next_hop_key, route)
+        self._add_to(self.sources, _source_key(getattr(route, "route_source", None)), route)
+
+    def discard(self, route: Route):
+        stored = self.get(route)
+        if stored is None:
+            return
+        key = prefix_key(stored.prefix)
+        self._discard_from(self.prefixes, key, stored)
+        if key not in self.prefixes:
+            if key in self._added_keys:
+                self._added_keys.discard(key)
+            else:
+                self._removed_keys.add(key)
+        self._discard_from(self.next_hops, stored.next_hop_key, stored)
+        self._discard_from(
+            self.sources, _source_key(getattr(stored, "route_source", None)), stored
+        )
+
+    @property
+    def sorted_keys(self) -> list[tuple]:
+        # always a new list, never changed in place, so a listing part way through its keys isn't disturbed
+        if self._removed_keys or self._added_keys:
+            keys = [k for k in self._sorted_keys if k not in self._removed_keys]
+            # one sorted run plus the new keys, which sort() merges in close to linear time
+            keys.extend(self._added_keys)
+            keys.sort()
+            self._sorted_keys = keys
+            self._removed_keys.clear()
+            self._added_keys.clear()
+        return self._sorted_keys
+
+    def keys_from(self, key: Optional[tuple] = None) -> Iterator[tuple]:
+        """keys_from will return the sorted prefix keys, starting at key"""
+        keys = self.sorted_keys
+        start = 0 if key is None else bisect.bisect_left(keys, key)
+        return itertools.islice(keys, start, None)
+
+    def longer_keys(self, key: tuple[int, int, int]) -> list[tuple]:
+        """longer_keys will return key, if it's in the table, and the keys of every more specific prefix inside it.
+        They are a contiguous run of the sorted keys."""
+        version, address, prefixlen = key
+        last = (version, address | ((1 << _host_bits(key)) - 1), 128)
+        keys = self.sorted_keys
+        return keys[bisect.bisect_left(keys, key):bisect.bisect_right(keys, last)]
+
+
+class RouteFilter:
+    """RouteFilter selects routes by prefix, next hop, source and status.  Each condition is optional.
+
+    prefix is matched according to match:
+    * exact: routes for prefix itself
+    * longer: routes for prefix and every more specific prefix inside it
+    * lpm: routes for the longest prefix covering prefix (an address or a prefix), among the routes that meet the
+      other conditions
+    """
+
+    def __init__(
+        self,
+        prefix: Optional[IPNetwork | str] = None,
+        match: PrefixMatch = "exact",
+        next_hop: Optional[IPAddress | str] = None,
+        source: Optional[SourceCode | str] = None,
+        status: Optional[RouteStatus | str] = None,
+    ):
+        if match not in ("exact", "longer", "lpm"):
+            raise ValueError(f"unknown prefix match: {match}")
+        self.prefix_key = None
+        if prefix is not None:
+            self.prefix_key = prefix_key(ipaddress.ip_network(prefix, strict=False))
+        self.match = match
+        self.next_hop_key = _address_key(next_hop) if next_hop is not None else None
+        self.source_key = _source_key(SourceCode(source)) if source is not None else None
+        self.status = RouteStatus(status) if status is not None else None
+
+    def matches(self, route: Route) -> bool:
+        """matches will check every condition except prefix"""
+        if self.next_hop_key is not None and route.next_hop_key != self.next_hop_key:
+            return False
+        if (
+            self.source_key is not None
+            and _source_key(getattr(route, "route_source", None)) != self.source_key
+        ):
+            return False
+        if self.status is not None and getattr(route, "status", None) != self.status:
+            return False
+        return True
+
+    def select(self, routes: Iterable[Route], after: Optional[tuple] = None) -> list[Route]:
+        """select will return the matching routes in route_order, starting after the route_order key after.
+        It scans routes, for lists that aren't in a RIB: a RIB's own select uses its index."""
+        routes = [route for route in routes if self.matches(route)]
+        if self.prefix_key is not None:
+            keys = {id(route): prefix_key(route.prefix) for route in routes}
+            if self.match == "exact":
+                routes = [r for r in routes if keys[id(r)] == self.prefix_key]
+            elif self.match == "longer":
+                routes = [r for r in routes if _covers(self.prefix_key, keys[id(r)])]
+            else:
+                covering = [k for k in keys.values() if _covers(k, self.prefix_key)]
+                longest = max(covering, key=lambda k: k[2], default=None)
+                routes = [r for r in routes if keys[id(r)] == longest]
+        return _ordered(routes, after)
+
+
+class RIBWatchers:
+    """RIBWatchers wakes the coroutines waiting for RIBs to change.  Any RIB changing wakes every watcher, which then
+    checks its own RIB: a process only has a few of each.  notify is safe to call from any thread, some endpoints
+    change RIBs from the threadpool."""
+
+    def __init__(self):
+        self._events: dict[asyncio.Event, asyncio.AbstractEventLoop] = {}
+
+    @contextmanager
+    def watch(self) -> Iterator[asyncio.Event]:
+        """watch will return an event that is set whenever a RIB changes.  Clear it before looking at the RIB."""
+        event = asyncio.Event()
+        self._events[event] = asyncio.get_running_loop()
+        try:
+            yield event
+        finally:
+            self._events.pop(event, None)
+
+    def notify(self):
+        if not self._events:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for event, loop in list(self._events.items()):
+            if loop is running:
+                event.set()
+            elif not event.is_set():
+                loop.call_soon_threadsafe(event.set)
+
+
+RIB_WATCHERS = RIBWatchers()
+
+
+def _route_state(route: Route) -> dict:
+    # a route that was only heard again, with nothing else about it changed, isn't a change worth logging
+    state = route.as_json
+    state.pop("last_updated", None)
+    return state
+
+
+# one counter shared by every RIB in the process, so a rebuilt RIB never reuses the version of the one it replaced
+_versions = itertools.count(1)
+_lineages = itertools.count(1)
+# changes each RIB keeps for its watchers.  A watcher that falls further behind than this needs a new snapshot.
+CHANGE_LOG_SIZE = 10000
+
+
 class RIB_Base(metaclass=abc.ABCMeta):
+    # 0 until the first change, an empty table
+    version = 0
+
     def __init__(self):
         self._table = set()
+        self._index = RouteIndex()
+        # the change log: (position, op, route), op being add, remove or update.  A RIB built to replace another
+        # takes over its log (see continue_from), and the lineage tells the logs of unrelated RIBs apart.
+        self.lineage = next(_lineages)
+        self.changes_total = 0
+        self._changes: deque[tuple[int, str, Route]] = deque(maxlen=CHANGE_LOG_SIZE)
+
+    def touch(self, *routes: Route):
+        """touch will give the RIB a new version and wake its watchers.  add, remove and import_routes do this
+        already: after changing routes in the table in place, call it with those routes."""
+        for route in routes:
+            self._log_change("update", route)
+        self.version = next(_versions)
+        RIB_WATCHERS.notify()
+
+    def _log_change(self, op: str, route: Route):
+        self._changes.append((self.changes_total, op, route))
+        self.changes_total += 1
+
+    def _table_add(self, route: Route):
+        # like set.add, a route already in the table is left as it is
+        if route in self._table:
+            return
+        self._log_change("add", route)
+        self._table.add(route)
+        self._index.add(route)
+
+    def _table_discard(self, route: Route):
+        if route not in self._table:
+            return
+        self._log_change("remove", self._index.get(route))
+        self._table.discard(route)
+        self._index.discard(route)
+
+    def changes_since(
+        self, lineage: int, position: int
+    ) -> Optional[tuple[list[tuple[str, Route]], int]]:
+        """changes_since will return the routes changed since position in the change log of lineage, as (op, route)
+        pairs with one per route, along with the position to ask from next time.  A route that was added and then
+        updated is reported as added, and one added and then removed isn't reported at all.
+
+        It returns None if the changes aren't known: the RIB isn't of that lineage, or the log has moved on past
+        position."""
+        # a copy, in case another thread changes the RIB meanwhile
+        changes = list(self._changes)
+        if lineage != self.lineage or position > self.changes_total:
+            return None
+        if changes and changes[0][0] > position:
+            return None
+
+        ops: dict[Route, tuple[str, Route]] = {}
+        for seq, op, route in changes:
+            if seq < position:
+                continue
+            first_op = ops[route][0] if route in ops else op
+            if op == "remove" and first_op == "update":
+                first_op = "remove"
+            ops[route] = first_op, route
+            position = seq + 1
+
+        rslt = []
+        for first_op, route in ops.values():
+            current = self._index.get(route)
+            if current is not None:
+                rslt.append(("add" if first_op == "add" else "update", current))
+            elif first_op == "remove":
+                rslt.append(("remove", route))
+        return rslt, position
+
+    def continue_from(self, previous: "RIB_Base"):
+        """continue_from will make this RIB, built to replace previous, carry on with previous's change log.
+        The differences between the two are logged, so watchers get a rebuild as changes rather than a new table.
+        A rebuild that changes nothing keeps previous's version, so its ETags stay good.
+
+        The log is handed over rather than shared: previous is left with an empty log of a new lineage, so anything
+        still holding it can neither add to this RIB's log nor be given changes from it."""
+        self.lineage, previous.lineage = previous.lineage, next(_lineages)
+        self._changes, previous._changes = previous._changes, deque(maxlen=CHANGE_LOG_SIZE)
+        self.changes_total = changes_before = previous.changes_total
+        for route in previous._table:
+            if route not in self._table:
+                self._log_change("remove", route)
+        for route in self._table:
+            old = previous._index.get(route)
+            if old is None:
+                self._log_change("add", route)
+            elif _route_state(old) != _route_state(route):
+                self._log_change("update", route)
+        if self.changes_total == changes_before:
+            self.version = previous.version
+            return
+        self.version = next(_versions)
+        RIB_WATCHERS.notify()
+
+    def select(
+        self, route_filter: Optional[RouteFilter] = None, after: Optional[tuple] = None
+    ) -> Iterator[Route]:
+        """select will return the routes matching route_filter in route_order, starting after the route_order key
+        after.  The conditions are looked up in the index, and routes are produced as they're iterated, so taking a
+        page from a large table costs about the size of the page."""
+        if route_filter is None:
+            route_filter = RouteFilter()
+        index = self._index
+        start = after[0] if after is not None else None
+
+        if route_filter.prefix_key is not None:
+            if route_filter.match == "exact":
+                keys = [route_filter.prefix_key]
+            elif route_filter.match == "longer":
+                keys = index.longer_keys(route_filter.prefix_key)
+            else:
+                keys = [
+                    next(
+                        (
+                            key
+                            for key in _covering_keys(route_filter.prefix_key)
+                            if any(map(route_filter.matches, index.prefixes.get(key, ())))
+                        ),
+                        None,
+                    )
+                ]
+            return self._select_prefixes(
+                (k for k in keys if k is not None and (start is None or k >= start)),
+                route_filter,
+                after,
+            )
+
+        buckets = []
+        if route_filter.next_hop_key is not None:
+            buckets.append(index.next_hops.get(route_filter.next_hop_key, set()))
+        if route_filter.source_key is not None:
+            buckets.append(index.sources.get(route_filter.source_key, set()))
+        if buckets:
+            smallest = min(buckets, key=len)
+            if len(smallest) * SPARSE_FILTER_RATIO < len(self._table):
+                return iter(_ordered(filter(route_filter.matches, smallest), after))
+
+        return self._select_prefixes(index.keys_from(start), route_filter, after)
+
+    def _select_prefixes(
+        self, keys: Iterable[tuple], route_filter: RouteFilter, after: Optional[tuple]
+    ) -> Iterator[Route]:
+        for key in keys:
+            routes = self._index.prefixes.get(key)
+            if routes:
+                yield from _ordered(filter(route_filter.matches, routes), after)
 
     @property
     @abc.abstractmethod
@@ -325,11 +765,61 @@ class RIB_Base(metaclass=abc.ABCMeta):
         self._check_for_intrinsic_values(**kwargs)
         self._check_for_invalid_fields(**kwargs)
 
+    def __len__(self):
+        return len(self._table)
+
+    def get(self, route: Route) -> Optional[Route]:
+        """get will return the route in the table equal to route (same prefix and next hop), or None"""
+        return self._index.get(route)
+
     def export_routes(self) -> list[RouteSpec]:
         result = [route.as_json for route in self._table]
         return result
 
     def import_routes(self, routes: list[RouteSpec]):
-        self._table = self._table.union(
-            {self.route_type(strict=False, **route) for route in routes}
-        )
+        changes_before = self.changes_total
+        for route in routes:
+            # routes already in the table are kept as they are
+            self._table_add(self.route_type(strict=False, **route))
+        if self.changes_total != changes_before:
+            self.touch()
+
+
+R = TypeVar("R", bound=Route)
+
+
+def select_best_paths(
+    routes: Iterable[R], key: Callable[[R], Any], max_paths: int = 1
+) -> dict[IPNetwork, list[R]]:
+    """select_best_paths will return the equal-best routes for each prefix, in one pass over routes.
+    The lowest key wins.  Equal-best routes are ordered by next hop so the result doesn't depend on
+    iteration order, and only the first max_paths of them are kept.  Prefixes are in the order they first appear
+    in routes."""
+    if max_paths < 1:
+        raise ValueError(f"max_paths must be at least 1, got {max_paths}")
+
+    best_keys: dict[IPNetwork, Any] = {}
+    best_paths: dict[IPNetwork, list[R]] = {}
+    for route in routes:
+        route_key = key(route)
+        prefix = route.prefix
+        if prefix not in best_keys or route_key < best_keys[prefix]:
+            best_keys[prefix] = route_key
+            best_paths[prefix] = [route]
+        elif route_key == best_keys[prefix]:
+            best_paths[prefix].append(route)
+
+    for prefix, paths in best_paths.items():
+        if len(paths) > 1:
+            paths.sort(key=Route.next_hop_key.fget)
+            del paths[max_paths:]
+
+    return best_paths
+
+
+def flatten_best_paths(best_paths: dict[IPNetwork, list[R]], in_order: bool = False) -> list[R]:
+    """flatten_best_paths will return the routes from select_best_paths as a single list, ordered by prefix.
+    in_order says the routes they were selected from were already ordered by prefix (as a RIB's select returns
+    them), so there's nothing to sort."""
+    prefixes = best_paths if in_order else sorted(best_paths, key=prefix_key)
+    return [route for prefix in prefixes for route in best_paths[prefix]]
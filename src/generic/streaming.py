@@ -0,0 +1,125 @@
+"""
+Streaming routes: listings as NDJSON, and a RIB's changes as server-sent events.
+
+NDJSON (one JSON object per line, https://github.com/ndjson/ndjson-spec): a listing normally builds every route's
+as_json dict, then one JSON array out of all of them, before the first byte is sent.  Streamed, routes are serialized
+a chunk at a time as the response is written, so memory use doesn't grow with the table.  Clients opt in with
+"Accept: application/x-ndjson".
+
+Server-sent events (https://html.spec.whatwg.org/multipage/server-sent-events.html): instead of polling a listing, a
+client can follow a RIB.  It gets a "snapshot" event with the whole table, then a "delta" event with the routes that
+were added, removed or updated each time it changes.
+"""
+import asyncio
+import json
+from enum import Enum
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from src.generic.rib import RIB_Base, RIB_WATCHERS
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+# routes serialized per chunk written: large enough to amortize each write, small enough to keep chunks to a few KB
+CHUNK_SIZE = 64
+# how long an idle event stream goes before a keepalive comment, so clients and proxies can tell it's still open
+KEEPALIVE_SECONDS = 15.0
+# how long to let a burst of changes settle, so it goes out as one delta
+COALESCE_SECONDS = 0.05
+
+
+def _json_default(value):
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def ndjson_chunks(routes: Iterable, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """ndjson_chunks will serialize routes chunk_size at a time, as NDJSON"""
+    lines = []
+    for route in routes:
+        lines.append(json.dumps(route.as_json, default=_json_default))
+        if len(lines) >= chunk_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines.clear()
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def ndjson_response(routes: Iterable, headers: Optional[dict] = None) -> StreamingResponse:
+    """ndjson_response will stream routes, which can be a generator: it is only iterated as the response is written"""
+    return StreamingResponse(
+        ndjson_chunks(routes), media_type=NDJSON_MEDIA_TYPE, headers=headers
+    )
+
+
+def _event(event: str, data, event_id: str) -> bytes:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n".encode()
+
+
+def _parse_event_id(event_id: Optional[str]) -> Optional[tuple[int, int]]:
+    try:
+        lineage, position = event_id.split("-")
+        return int(lineage), int(position)
+    except (AttributeError, ValueError):
+        return None
+
+
+async def route_events(
+    get_rib: Callable[[], RIB_Base],
+    last_event_id: Optional[str] = None,
+    keepalive: float = KEEPALIVE_SECONDS,
+) -> AsyncIterator[bytes]:
+    """route_events will stream a RIB's changes as server-sent events: a snapshot, then a delta per batch of changes.
+
+    get_rib is called again for every batch, so the stream follows an instance's RIB when it is rebuilt.  An event's
+    id is its place in the RIB's change log.  Given the last id a client saw, the stream starts with the changes since
+    instead of a snapshot, if the RIB still has them.  The stream ends when get_rib raises an HTTPException, e.g. when
+    the instance is deleted.
+    """
+    seen = _parse_event_id(last_event_id)
+    with RIB_WATCHERS.watch() as changed:
+        while True:
+            changed.clear()
+            try:
+                rib = get_rib()
+            except HTTPException:
+                return
+
+            known = rib.changes_since(*seen) if seen is not None else None
+            if known is None:
+                # changes made while the snapshot is taken are sent again in the next delta, which is harmless
+                seen = rib.lineage, rib.changes_total
+                routes = [route.as_json for route in rib.select()]
+                yield _event("snapshot", {"version": rib.version, "routes": routes}, "%d-%d" % seen)
+            else:
+                changes, position = known
+                seen = rib.lineage, position
+                if changes:
+                    data = {
+                        "version": rib.version,
+                        "changes": [{"op": op, "route": route.as_json} for op, route in changes],
+                    }
+                    yield _event("delta", data, "%d-%d" % seen)
+
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+            else:
+                await asyncio.sleep(COALESCE_SECONDS)
+
+
+def route_events_response(get_rib: Callable[[], RIB_Base], request: Request) -> StreamingResponse:
+    return StreamingResponse(
+        route_events(get_rib, request.headers.get("last-event-id")),
+        media_type=EVENT_STREAM_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache"},
+    )
@@ -0,0 +1,141 @@
+"""
+Timers: a hashed timer wheel, for deadlines that are far more often pushed back than reached, such as route timeouts,
+and a periodic timer for jobs that repeat on a schedule, such as regular updates.
+
+Deadlines are rounded up to a tick and dropped into the slot for that tick.  Arming a key that already has a deadline
+only records the new one and drops the key into its new slot; the entry left in the old slot is stale, and is thrown
+away when that slot comes round.  Advancing the wheel visits only the slots for the ticks that have passed, so the
+cost follows the number of timers that come due (and the stale entries they left), not the number of timers.
+
+A wheel with at least as many slots as the longest deadline is in ticks never passes over an entry that isn't due:
+longer deadlines still work, but wait in their slot for as many turns of the wheel as they need.
+
+A PeriodicTimer keeps a job to its schedule on the event loop's clock, without ever blocking the loop: each run is
+due an interval after the previous one was due, so the time the job takes doesn't add up into drift.
+"""
+import asyncio
+import math
+import random
+import time
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+
+
+class TimerWheel(Generic[K]):
+    def __init__(self, tick: float, slots: int, clock: Callable[[], float] = time.time):
+        if tick <= 0 or slots <= 0:
+            raise ValueError("tick and slots must be positive")
+        self.tick = tick
+        self.clock = clock
+        self._slots: list[list[tuple[int, K]]] = [[] for _ in range(slots)]
+        # the tick each key is due on; slot entries that don't match it are stale
+        self._due: dict[K, int] = {}
+        # the next tick to look at
+        self._tick = self._tick_of(clock())
+
+    def _tick_of(self, at: float) -> int:
+        return math.ceil(at / self.tick)
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._due
+
+    def arm(self, key: K, deadline: float):
+        """arm will set key to come due at deadline (on the clock), replacing any deadline it already had"""
+        due = max(self._tick_of(deadline), self._tick)
+        if self._due.get(key) == due:
+            return
+        self._due[key] = due
+        self._slots[due % len(self._slots)].append((due, key))
+
+    def cancel(self, key: K):
+        """cancel will forget key's deadline, if it has one"""
+        self._due.pop(key, None)
+
+    def deadline(self, key: K) -> Optional[float]:
+        """deadline will return when key comes due, rounded up to a tick, or None if it isn't armed"""
+        due = self._due.get(key)
+        return None if due is None else due * self.tick
+
+    def expired(self, now: Optional[float] = None) -> list[K]:
+        """expired will advance the wheel to now, and return (and forget) the keys that came due on the way"""
+        if now is None:
+            now = self.clock()
+        end = math.floor(now / self.tick)
+        rslt = []
+        # past a whole turn of the wheel, every slot has been visited
+        last = min(end, self._tick + len(self._slots) - 1)
+        while self._tick <= last:
+            slot = self._slots[self._tick % len(self._slots)]
+            waiting = []
+            for due, key in slot:
+                if self._due.get(key) != due:
+                    continue  # re-armed or cancelled since
+                if due <= end:
+                    del self._due[key]
+                    rslt.append(key)
+                else:
+                    waiting.append((due, key))
+            slot[:] = waiting
+            self._tick += 1
+        self._tick = max(self._tick, end + 1)
+        return rslt
+
+
+class PeriodicTimer:
+    """PeriodicTimer paces a job that repeats every interval seconds (a number, or a function returning one, so a
+    changed setting is picked up on the next run).  Call wait before each run.
+
+    Each interval is offset at random by up to jitter times itself either way, so that routers that started together
+    don't stay in step (RFC 2453 3.8).  A run that comes round a whole interval late skips the runs it
+    missed rather than making them up back to back, and the schedule carries on from then.  How late each run was is
+    passed to on_late, if given: it shows how busy the event loop is."""
+
+    def __init__(
+        self,
+        interval: float | Callable[[], float],
+        jitter: float = 0.0,
+        on_late: Optional[Callable[[float], None]] = None,
+    ):
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be at least 0 and less than 1")
+        self._interval = interval if callable(interval) else lambda: interval
+        self.jitter = jitter
+        self.on_late = on_late
+        # when the next run is due, on the loop's clock; None until the first wait
+        self.next_due: Optional[float] = None
+
+    @property
+    def interval(self) -> float:
+        return self._interval()
+
+    def _jittered(self) -> float:
+        interval = self.interval
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return interval
+
+    def reset(self):
+        """reset will make the next run due straight away"""
+        self.next_due = None
+
+    async def wait(self) -> float:
+        """wait will sleep until the next run is due (the first is due straight away), and return how late it woke,
+        in seconds"""
+        loop = asyncio.get_running_loop()
+        if self.next_due is None:
+            self.next_due = loop.time()
+        due = self.next_due
+        await asyncio.sleep(max(due - loop.time(), 0))
+        now = loop.time()
+        # the loop can run a callback up to its clock resolution early
+        lateness = max(now - due, 0.0)
+        if self.on_late is not None:
+            self.on_late(lateness)
+        interval = self._jittered()
+        self.next_due = (due if lateness < interval else now) + interval
+        return lateness
@@ -0,0 +1,255 @@
+"""
+Lightweight tracing across the PyRP services.
+
+A trace is identified by a trace id that travels between services in HTTP headers (see BaseClient and
+tracing_middleware).  Inside a service, the current span lives in a contextvar, so anything started from inside a span,
+including tasks created with asyncio.create_task, becomes its child without passing anything around.
+
+Finished spans go to a local exporter: always an in-memory ring buffer that the /traces endpoints query, and optionally
+a JSONL file as well.  Nothing is sampled away, so keep spans to operations worth timing.
+"""
+import contextvars
+import json
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from typing_extensions import TypedDict
+
+TRACE_ID_HEADER = "X-PyRP-Trace-Id"
+PARENT_SPAN_ID_HEADER = "X-PyRP-Parent-Span-Id"
+
+
+class SpanSpec(TypedDict):
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    service: str
+    name: str
+    start: float
+    duration_ms: float
+    attributes: dict
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "service",
+        "name",
+        "start",
+        "duration",
+        "attributes",
+        "_perf_start",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        service: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        attributes: Optional[dict] = None,
+    ):
+        self.trace_id = trace_id or _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.service = service
+        self.name = name
+        self.start = time.time()
+        self.duration = 0.0
+        self.attributes = attributes or {}
+        self._perf_start = time.perf_counter()
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._perf_start
+
+    @property
+    def as_json(self) -> SpanSpec:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.service,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+class RingBufferExporter:
+    def __init__(self, maxlen: int = 10000):
+        self._spans: deque[Span] = deque(maxlen=maxlen)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def query(
+        self,
+        trace_id: Optional[str] = None,
+        name: Optional[str] = None,
+        limit: int = 100,
+    ) -> list[SpanSpec]:
+        """query will return the most recent spans matching trace_id and name (if given), oldest first"""
+        rslt = []
+        for span in reversed(self._spans):
+            if trace_id and span.trace_id != trace_id:
+                continue
+            if name and not span.name.startswith(name):
+                continue
+            rslt.append(span.as_json)
+            if len(rslt) >= limit:
+                break
+        rslt.reverse()
+        return rslt
+
+
+class JSONLExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, span: Span):
+        self._file.write(json.dumps(span.as_json) + "\n")
+
+
+class Tracer:
+    def __init__(self, service: str = "pyrp", buffer_size: int = 10000):
+        self.service = service
+        self.buffer = RingBufferExporter(buffer_size)
+        self.exporters: list = [self.buffer]
+
+    def configure(
+        self,
+        service: str,
+        buffer_size: Optional[int] = None,
+        jsonl_path: Optional[str] = None,
+    ):
+        self.service = service
+        if buffer_size is not None:
+            self.buffer = RingBufferExporter(buffer_size)
+        self.exporters = [self.buffer]
+        if jsonl_path:
+            self.exporters.append(JSONLExporter(jsonl_path))
+
+    def export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+
+TRACER = Tracer()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "pyrp_current_span", default=None
+)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class _SpanContext:
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, span: Span):
+        self._span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self._span.finish()
+        if exc_type is not None:
+            self._span.attributes["error"] = repr(exc)
+        TRACER.export(self._span)
+        return False
+
+    async def __aenter__(self) -> Span:
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def span(
+    name: str,
+    trace_id: Optional[str] = None,
+    parent_id: Optional[str] = None,
+    **attributes,
+) -> _SpanContext:
+    """span will return a context manager (sync or async) for a new span.
+    Without trace_id/parent_id it becomes a child of the current span, or the root of a new trace."""
+    if trace_id is None:
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id = parent.trace_id
+            parent_id = parent.span_id
+    return _SpanContext(
+        Span(name, TRACER.service, trace_id, parent_id, attributes or None)
+    )
+
+
+def trace_headers() -> dict[str, str]:
+    """trace_headers will return the headers that carry the current span to another service"""
+    current = _current_span.get()
+    if current is None:
+        return {}
+    return {TRACE_ID_HEADER: current.trace_id, PARENT_SPAN_ID_HEADER: current.span_id}
+
+
+async def tracing_middleware(request, call_next):
+    """tracing_middleware wraps every request in a span, continuing the caller's trace if it sent one.
+    The trace id is echoed back in the response headers.  Register it with app.middleware("http")."""
+    with span(
+        f"{request.method} {request.url.path}",
+        trace_id=request.headers.get(TRACE_ID_HEADER),
+        parent_id=request.headers.get(PARENT_SPAN_ID_HEADER),
+    ) as server_span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            server_span.name = f"{request.method} {route.path}"
+        server_span.attributes["status"] = response.status_code
+        response.headers[TRACE_ID_HEADER] = server_span.trace_id
+        return response
+
+
+def breakdown(spans: list[SpanSpec]) -> list[dict]:
+    """breakdown will order the spans of one trace as a tree, depth first, with each span's depth and the time
+    it spent on its own (not in its children).  Spans whose parent is missing are treated as roots."""
+    by_id = {span_spec["span_id"]: span_spec for span_spec in spans}
+    children: dict[Optional[str], list[SpanSpec]] = {}
+    for span_spec in spans:
+        parent_id = span_spec["parent_id"] if span_spec["parent_id"] in by_id else None
+        children.setdefault(parent_id, []).append(span_spec)
+    for siblings in children.values():
+        siblings.sort(key=lambda s: s["start"])
+
+    rslt = []
+
+    def walk(parent_id: Optional[str], depth: int):
+        for span_spec in children.get(parent_id, []):
+            child_ms = sum(c["duration_ms"] for c in children.get(span_spec["span_id"], []))
+            rslt.append(
+                {
+                    "depth": depth,
+                    "service": span_spec["service"],
+                    "name": span_spec["name"],
+                    "start": span_spec["start"],
+                    "duration_ms": span_spec["duration_ms"],
+                    "self_ms": round(max(span_spec["duration_ms"] - child_ms, 0), 3),
+                    "span_id": span_spec["span_id"],
+                }
+            )
+            walk(span_spec["span_id"], depth + 1)
+
+    walk(None, 0)
+    return rslt
@@ -0,0 +1,231 @@
+"""
+RIPv1 packets (RFC 1058 3.1), read and written with struct rather than through dpkt.
+
+Incoming packets are read in place: decode unpacks the route entries straight out of the datagram as plain integers,
+and the classful network of an address is worked out by masking, without building any ipaddress objects on the way.
+Outgoing responses are packed into a buffer allocated once (RIP1_ResponsePacker).
+"""
+import enum
+import functools
+import ipaddress
+import socket
+import struct
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+RIP_VERSION = 1
+RIP_MAX_METRIC = 16
+# RFC 1058 3.1: a response carries at most 25 routes, which keeps it within a 512 byte datagram
+RIP_MAX_RTES = 25
+RIP_HEADER = struct.Struct("!BBH")  # command, version, must be zero
+RIP_RTE = struct.Struct("!HHIIII")  # address family, zero, address, zero, zero (next hop in RIPv2), metric
+
+
+class RIP_Command(enum.IntEnum):
+    REQUEST = 1
+    RESPONSE = 2
+
+
+class RIP1_RTE(NamedTuple):
+    family: int
+    address: int
+    next_hop: int
+    metric: int
+
+
+class RIP1_Packet(NamedTuple):
+    cmd: int
+    version: int
+    rtes: list[RIP1_RTE]
+
+
+def decode(data: bytes | memoryview) -> RIP1_Packet:
+    """decode will read a RIP packet.  A partial route entry at the end is ignored; a packet too short for its header
+    raises ValueError."""
+    if len(data) < RIP_HEADER.size:
+        raise ValueError(f"RIP packet too short: {len(data)} bytes")
+    view = memoryview(data)
+    cmd, version, _ = RIP_HEADER.unpack_from(view)
+    end = len(view) - (len(view) - RIP_HEADER.size) % RIP_RTE.size
+    rtes = [
+        RIP1_RTE(family, address, next_hop, metric)
+        for family, _, address, _, next_hop, metric in RIP_RTE.iter_unpack(view[RIP_HEADER.size : end])
+    ]
+    return RIP1_Packet(cmd, version, rtes)
+
+
+def classful_prefixlen(address: int) -> Optional[int]:
+    """classful_prefixlen will return the prefix length of an IPv4 address's class (A, B or C), or None for class D
+    and E addresses, which can't be routes"""
+    if address < 0x80000000:  # 0.0.0.0/1
+        return 8
+    if address < 0xC0000000:  # 128.0.0.0/2
+        return 16
+    if address < 0xE0000000:  # 192.0.0.0/3
+        return 24
+    return None
+
+
+def classful_network(address: int) -> Optional[tuple[int, int]]:
+    """classful_network will return the classful network holding address, as (network address, prefix length)"""
+    prefixlen = classful_prefixlen(address)
+    if prefixlen is None:
+        return None
+    return address & (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF, prefixlen
+
+
+# routes from the same neighbors name the same networks and next hops over and over
+@functools.lru_cache(maxsize=65536)
+def ipv4_network(address: int, prefixlen: int) -> ipaddress.IPv4Network:
+    return ipaddress.IPv4Network((address, prefixlen))
+
+
+@functools.lru_cache(maxsize=4096)
+def ipv4_address(address: int) -> ipaddress.IPv4Address:
+    return ipaddress.IPv4Address(address)
+
+
+def encode_request() -> bytes:
+    """encode_request will build a request for the whole table: a single entry, of address family 0 and metric 16"""
+    return RIP_HEADER.pack(RIP_Command.REQUEST, RIP_VERSION, 0) + RIP_RTE.pack(0, 0, 0, 0, 0, RIP_MAX_METRIC)
+
+
+class RIP1_ResponsePacker:
+    """RIP1_ResponsePacker serializes routes into RIPv1 response packets of up to RIP_MAX_RTES routes each.
+
+    Every packet is packed into the same buffer, and is a view of it that is only good until the next one is packed:
+    send each packet before asking for the next, without awaiting in between."""
+
+    def __init__(self):
+        self._buffer = bytearray(RIP_HEADER.size + RIP_MAX_RTES * RIP_RTE.size)
+        RIP_HEADER.pack_into(self._buffer, 0, RIP_Command.RESPONSE, RIP_VERSION, 0)
+        self._view = memoryview(self._buffer)
+
+    @staticmethod
+    def _address(route) -> int:
+        try:
+            return int(route.prefix.network_address)
+        except AttributeError:
+            return int(ipaddress.ip_network(route.prefix).network_address)
+
+    def packets(self, routes: Iterable) -> Iterator[memoryview]:
+        offset = RIP_HEADER.size
+        for route in routes:
+            # we are always the next hop, and we're assuming link cost is always 1
+            RIP_RTE.pack_into(
+                self._buffer,
+                offset,
+                socket.AF_INET,
+                0,
+                self._address(route),
+                0,
+                0,
+                min(route.metric + 1, RIP_MAX_METRIC),
+            )
+            offset += RIP_RTE.size
+            if offset == len(self._buffer):
+                yield self._view[:offset]
+                offset = RIP_HEADER.size
+        if offset > RIP_HEADER.size:
+            yield self._view[:offset]
+
+
+class RIP1_Advertisement:
+    """RIP1_Advertisement holds a whole table's response packets, already serialized, so sending them again is a
+    matter of handing over the buffers.
+
+    Routes are added, updated and removed one at a time, each by rewriting its entry in place.  A removed entry is
+    filled with the last entry of the last packet, so the packets stay full (in no particular order) and every change
+    costs the same whatever the size of the table."""
+
+    def __init__(self):
+        self._buffers: list[bytearray] = []
+        self._counts: list[int] = []
+        # each packet's entries, by slot, and where each prefix's entry is: (packet, slot)
+        self._prefixes: list[list] = []
+        self._slots: dict = {}
+        self._metrics: dict = {}
+        # each packet as bytes, None once it's been changed
+        self._frozen: list[Optional[bytes]] = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, prefix) -> bool:
+        return prefix in self._slots
+
+    def metric(self, prefix) -> Optional[int]:
+        """metric will return the metric prefix is advertised with (before the hop to us is added), or None"""
+        return self._metrics.get(prefix)
+
+    def metrics(self) -> dict:
+        return dict(self._metrics)
+
+    def clear(self):
+        self.__init__()
+
+    @staticmethod
+    def _offset(slot: int) -> int:
+        return RIP_HEADER.size + slot * RIP_RTE.size
+
+    def set(self, route):
+        """set will advertise route, or update the metric of its prefix if that is already advertised"""
+        slot = self._slots.get(route.prefix)
+        if slot is None:
+            if not self._counts or self._counts[-1] == RIP_MAX_RTES:
+                buffer = bytearray(RIP_HEADER.size + RIP_MAX_RTES * RIP_RTE.size)
+                RIP_HEADER.pack_into(buffer, 0, RIP_Command.RESPONSE, RIP_VERSION, 0)
+                self._buffers.append(buffer)
+                self._counts.append(0)
+                self._prefixes.append([])
+                self._frozen.append(None)
+            slot = len(self._buffers) - 1, self._counts[-1]
+            self._counts[-1] += 1
+            self._prefixes[-1].append(route.prefix)
+            self._slots[route.prefix] = slot
+        packet, index = slot
+        RIP_RTE.pack_into(
+            self._buffers[packet],
+            self._offset(index),
+            socket.AF_INET,
+            0,
+            RIP1_ResponsePacker._address(route),
+            0,
+            0,
+            min(route.metric + 1, RIP_MAX_METRIC),
+        )
+        self._metrics[route.prefix] = route.metric
+        self._frozen[packet] = None
+
+    def remove(self, prefix):
+        """remove will stop advertising prefix"""
+        slot = self._slots.pop(prefix, None)
+        if slot is None:
+            return
+        del self._metrics[prefix]
+        packet, index = slot
+        last_packet, last_index = len(self._buffers) - 1, self._counts[-1] - 1
+        if slot != (last_packet, last_index):
+            moved = self._prefixes[last_packet][last_index]
+            start = self._offset(last_index)
+            self._buffers[packet][self._offset(index) : self._offset(index + 1)] = self._buffers[last_packet][
+                start : start + RIP_RTE.size
+            ]
+            self._prefixes[packet][index] = moved
+            self._slots[moved] = slot
+            self._frozen[packet] = None
+        self._prefixes[last_packet].pop()
+        self._counts[-1] -= 1
+        self._frozen[-1] = None
+        if self._counts[-1] == 0:
+            self._buffers.pop()
+            self._counts.pop()
+            self._prefixes.pop()
+            self._frozen.pop()
+
+    def packets(self) -> list[bytes]:
+        """packets will return the response packets.  They are copies, which stay as they are while the routes
+        change, and are only copied again once a route in them has changed."""
+        for packet, frozen in enumerate(self._frozen):
+            if frozen is None:
+                self._frozen[packet] = bytes(memoryview(self._buffers[packet])[: self._offset(self._counts[packet])])
+        return list(self._frozen)
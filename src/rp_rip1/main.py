@@ -8,37 +8,96 @@ We're going to ignore both of them for now, and truncate all redistibuted routes
 
 """
 import asyncio
+import functools
+import itertools
 import ipaddress
 import logging
 import random
+import socket
 import time
-from typing import Literal, Optional, Type
+from typing import Iterable, Literal, Optional, Type
 
-import dpkt
 from typing_extensions import TypedDict
 
 from src.control_plane.clients.client_control_plane import RpCpClient
 from src.fp_interface import ForwardingPlane
-from src.config import Config
+from src.generic.metrics import Histogram, Counter
+from src.generic.damping import FlapDamper, DampingSpec, damping_key
+from src.generic.timers import PeriodicTimer, TimerWheel
+from src.generic.tracing import span
+from src.config import Config, diff_settings
 from src.generic.rib import (
     RouteSpec,
     Route,
     RIB_Base,
+    RouteFilter,
+    prefix_key,
     RedistributeInRouteSpec,
     RedistributeOutRouteSpec,
     RedistributeOutRoute,
+    select_best_paths,
+    flatten_best_paths,
 )
 from src.system import SourceCode, RouteStatus, IPNetwork, IPAddress
+from .codec import (
+    RIP_MAX_METRIC,
+    RIP_MAX_RTES,
+    RIP_Command,
+    RIP1_RTE,
+    RIP1_Advertisement,
+    RIP1_ResponsePacker,
+    classful_network,
+    decode,
+    encode_request,
+    ipv4_address,
+    ipv4_network,
+)
 
 log = logging.getLogger(__name__)
 
-RIP_MAX_METRIC = 16
 RIP_ROUTE_TIMEOUT = 180
 RIP_ROUTE_GARBAGE_TIMER = 120
 # RIP_ROUTE_TIMEOUT = 10
 # RIP_ROUTE_GARBAGE_TIMER = 60
 RIP_ROUTE_GARBAGE_TIMEOUT = RIP_ROUTE_TIMEOUT + RIP_ROUTE_GARBAGE_TIMER
 RIP_HOUSEKEEPING_INTERVAL = 1
+# RFC 1058 3.5: after a triggered update, the next one waits a random 1 to 5 seconds
+RIP_TRIGGERED_UPDATE_HOLDOFF = (1, 5)
+# RFC 2453 3.8: the 30 second update timer is offset at random by up to 5 seconds either way, each time it is set,
+# which is a sixth of the interval; requests get the same
+RIP_TIMER_JITTER = 1 / 6
+
+PACKETS = Counter(
+    "pyrp_rip_packets_total", "RIP packets sent and received", ["direction", "command"]
+)
+PACKETS_RX_REQUEST = PACKETS.labels("rx", "request")
+PACKETS_RX_RESPONSE = PACKETS.labels("rx", "response")
+PACKETS_RX_OTHER = PACKETS.labels("rx", "other")
+PACKETS_TX_REQUEST = PACKETS.labels("tx", "request")
+PACKETS_TX_RESPONSE = PACKETS.labels("tx", "response")
+ROUTE_CHANGES = Counter(
+    "pyrp_rip_route_changes_total", "Learned RIP route changes", ["event"]
+)
+ROUTE_UPDATES = ROUTE_CHANGES.labels("update")
+ROUTE_TIMEOUTS = ROUTE_CHANGES.labels("timeout")
+ROUTE_GARBAGE = ROUTE_CHANGES.labels("garbage")
+REFRESH_RIB_SECONDS = Histogram(
+    "pyrp_rip_refresh_rib_seconds", "Time spent in RP_RIP1_Interface.refresh_rib"
+)
+TRIGGERED_UPDATES = Counter(
+    "pyrp_rip_triggered_updates_total", "RIP triggered updates, by outcome", ["result"]
+)
+TRIGGERED_UPDATES_SENT = TRIGGERED_UPDATES.labels("sent")
+TRIGGERED_UPDATES_SUPPRESSED = TRIGGERED_UPDATES.labels("suppressed")
+TIMER_LATENESS = Histogram(
+    "pyrp_rip_timer_lateness_seconds",
+    "How late RIP's periodic timers fired, by timer",
+    ["timer"],
+)
+REDISTRIBUTE_IN_SECONDS = Histogram(
+    "pyrp_rip_redistribute_in_seconds",
+    "Time spent in RP_RIP1_Interface.redistribute_in",
+)
 
 
 class RIP1_RouteSpec(RouteSpec):
@@ -60,6 +119,8 @@ class RIP1_Route(Route):
         metric: int,
         *args,
         route_source: SourceCode | str = None,
+        status: Optional[RouteStatus | str] = None,
+        last_updated: Optional[float] = None,
         strict: bool = True,
         **kwargs,
     ):
@@ -78,8 +139,9 @@ class RIP1_Route(Route):
 
         self.route_source = route_source
         self.metric = metric
-        self.status = RouteStatus.UNKNOWN
-        self.last_updated = time.time()
+        # a route rebuilt from its json (see RP_RIP1_Interface.refresh_rib) keeps its status and age
+        self.status = RouteStatus(status) if status is not None else RouteStatus.UNKNOWN
+        self.last_updated = last_updated if last_updated is not None else time.time()
         self._value = (self.prefix, self.next_hop)
 
     @property
@@ -136,17 +198,27 @@ class RIP1_RPSpec(TypedDict):
     cp_id: Optional[str]
 
 
+class RIP1_LinkSpec(TypedDict, total=False):
+    name: Optional[str]
+    broadcast: Optional[str]
+    port: int
+    split_horizon: bool
+    poison_reverse: bool
+
+
 class RIP1_FullRPSpec(RIP1_RPSpec):
     rib: list[RIP1_RouteSpec]
     redistributed_routes: list[RIP1_RouteSpec]
     learned_routes: list[RIP1_RouteSpec]
+    links: list[dict]
 
 
 class RIP1_RIB(RIB_Base):
     route_type: Type[Route] = RIP1_Route
 
     def __init__(self):
-        self._table: set[RIP1_Route] = set()
+        super().__init__()
+        self._table: set[RIP1_Route]
 
     @property
     def items(self) -> set[RIP1_Route]:
@@ -157,15 +229,17 @@ class RIP1_RIB(RIB_Base):
             self._validate_fields(**route)
             route = self.route_type(**route)
 
-        self._table.discard(route)  # required to update routes?
-        self._table.add(route)
+        self._table_discard(route)  # required to update routes?
+        self._table_add(route)
+        self.touch()
 
     def remove(self, route: RIP1_RouteSpec | route_type):
         if isinstance(route, dict):
             self._validate_fields(**route)
             route = self.route_type(**route)
 
-        self._table.discard(route)
+        self._table_discard(route)
+        self.touch()
 
     discard = remove
 
@@ -179,111 +253,128 @@ class RP_RIP1:
         """This is the inner class for the protocol itself, responsible primarily for message passing to/from the FP"""
         self.fp = fp
         self.rp_interface = rp_interface
+        self._packer = RIP1_ResponsePacker()
 
-    @staticmethod
-    def _rte_from_route(route: RIP1_Route) -> dpkt.rip.RTE:
-        rte = dpkt.rip.RTE()
-        rte.family = 2
-        try:
-            rte.addr = int(route.prefix.network_address)
-        except AttributeError:
-            rte.addr = int(ipaddress.ip_network(route.prefix).network_address)
-        # rte.next_hop = int(route.next_hop)
-        rte.next_hop = int(
-            ipaddress.ip_address("0.0.0.0")
-        )  # we are always the next hop
-        rte.metric = min(
-            route.metric + 1, RIP_MAX_METRIC
-        )  # we're assuming link cost is always 1
-
-        return rte
-
-    def send_response(
-        self, dst_ip: Optional[str] = None, dst_port: Optional[int] = None
+    async def send_response(
+        self,
+        dst_ip: Optional[str] = None,
+        dst_port: Optional[int] = None,
+        routes: Optional[list[RIP1_Route]] = None,
+        link: Optional["RIP1_Link"] = None,
     ) -> int:
+        """send_response will advertise routes (by default, the whole table, from the link's advertisement) on link,
+        RIP_MAX_RTES to a packet, pausing between packets so receivers aren't flooded (see
+        RP_RIP1_Interface.response_packet_gap).  It returns the number of packets sent."""
+        if link is None:
+            link = self.rp_interface.links[0]
+
         if dst_ip is None:
-            dst_ip = str(self.default_dst_ip)
+            dst_ip = self.rp_interface.link_destination(link)
 
         if dst_port is None:
-            dst_port = self.default_dst_port
-
-        log.info(f"sending response msg")
-        rtes = [
-            self._rte_from_route(route) for route in self.rp_interface.export_routes()
-        ]
-
-        rip = dpkt.rip.RIP()
-        rip.cmd = dpkt.rip.RESPONSE
-        rip.v = 1
-        rip.rsvd = 0
-        rip.auth = None
-        rip.rtes = rtes
-
-        return self.fp.send_udp(bytes(rip), dst_ip, dst_port, self.default_src_port)
-
-    def send_request(self) -> int:
-        log.info(f"sending request message")
-        rip = dpkt.rip.RIP()
-        rip.cmd = dpkt.rip.REQUEST
-        rip.v = 1
-        rip.rsvd = 0
-        rip.auth = None
-
-        request_rte = dpkt.rip.RTE()
-        request_rte.family = 0
-        request_rte.addr = 0
-        request_rte.metric = RIP_MAX_METRIC
-
-        rip.rtes = [request_rte]
+            dst_port = link.port
+
+        log.info(f"sending response msg on {link.name or 'the default link'}")
+        if routes is None:
+            advertisement = self.rp_interface.advertisement(link)
+            packets = advertisement.packets()
+            route_count = len(advertisement)
+            gap = self.rp_interface.response_packet_gap(route_count)
+        else:
+            route_count = len(routes)
+            gap = self.rp_interface.response_packet_gap(route_count)
+            # a paced response awaits between packets, so it packs into a buffer of its own rather than the shared
+            # one, which another send could repack in the meantime
+            packer = RIP1_ResponsePacker() if gap > 0 else self._packer
+            packets = packer.packets(routes)
+        if gap > 0:
+            # one packet per gap; the next is packed when the loop comes back around, after the pause
+            sent = 0
+            for packet in packets:
+                sent += self._send_packets([packet], dst_ip, dst_port, link)
+                await asyncio.sleep(gap)
+        else:
+            # unpaced, the whole response goes out together
+            sent = self._send_packets(packets, dst_ip, dst_port, link)
+        log.info(f"sent {route_count} routes in {sent} response packets")
+        return sent
 
+    def _send_packets(
+        self, packets: Iterable[bytes | memoryview], dst_ip: str, dst_port: int, link: "RIP1_Link"
+    ) -> int:
+        # send_udp_batch copies each packet into its datagram before taking the next, so packed packets (views of a
+        # buffer that's reused for the next one) are passed through as they are
+        sent = 0
+
+        def counted():
+            nonlocal sent
+            for packet in packets:
+                sent += 1
+                yield packet
+
+        packets = iter(packets)
+        first = next(packets, None)
+        if first is None:
+            return 0
+        packets = itertools.chain([first], packets)
+        self.fp.send_udp_batch(counted(), dst_ip, dst_port, link.port, link.name)
+        PACKETS_TX_RESPONSE.inc(sent)
+        return sent
+
+    def send_request(self, link: Optional["RIP1_Link"] = None) -> int:
+        if link is None:
+            link = self.rp_interface.links[0]
+        log.info(f"sending request message on {link.name or 'the default link'}")
+        PACKETS_TX_REQUEST.inc()
+        # from a random port, which the responses to it come back to
         return self.fp.send_udp(
-            bytes(rip),
-            str(self.default_dst_ip),
-            self.default_dst_port,
-            # self.default_src_port,
+            encode_request(),
+            self.rp_interface.link_destination(link),
+            link.port,
+            None,
+            link.name,
         )
 
     @staticmethod
-    def handle_response(
-        rip_pkt: dpkt.rip.RIP, src_tuple: tuple[str, int]
-    ) -> list[RIP1_Route]:
-        """In RIPv1 a 'Response' is always and exclusively the message that contains route entries"""
+    def handle_response(rtes: list[RIP1_RTE], src_tuple: tuple[str, int]) -> list[RIP1_Route]:
+        """In RIPv1 a 'Response' is always and exclusively the message that contains route entries.  Each entry is
+        truncated to its classful network, and one with a next hop of 0.0.0.0 is routed via the sender."""
         src_ip, src_port = src_tuple
+        src_address = ipaddress.ip_address(src_ip)
         routes: list[RIP1_Route] = []
-        for rte in rip_pkt.rtes:
-            try:
-                route = RIP1_Route(
-                    prefix=ipaddress.ip_network(ipaddress.ip_address(rte.addr)),
-                    next_hop=ipaddress.ip_address(rte.next_hop),
-                    metric=rte.metric,
-                )
-                classful_route = route.classful
-                if classful_route.metric >= RIP_MAX_METRIC:
-                    log.warning(f"poisoning route with metric >= {RIP_MAX_METRIC}")
-                    classful_route.metric = RIP_MAX_METRIC
-                    classful_route.status = RouteStatus.DOWN
-                else:
-                    classful_route.status = RouteStatus.UP
-
-                if classful_route.next_hop == ipaddress.ip_address("0.0.0.0"):
-                    log.debug(f"updating next_hop of 0.0.0.0 to {src_ip}")
-                    classful_route.next_hop = ipaddress.ip_address(src_ip)
-
-                log.info(f"classful route: {classful_route.as_json}")
-                routes.append(classful_route)
-            except ValueError:
-                log.info(
-                    f"received invalid route: {rte.addr=}, {rte.next_hop=}, {rte.metric=}"
-                )
+        for rte in rtes:
+            network = classful_network(rte.address)
+            if rte.family != socket.AF_INET or network is None:
+                log.info(f"received invalid route: {rte}")
                 continue
+            route = RIP1_Route(
+                prefix=ipv4_network(*network),
+                next_hop=ipv4_address(rte.next_hop) if rte.next_hop else src_address,
+                metric=min(rte.metric, RIP_MAX_METRIC),
+            )
+            if route.metric == RIP_MAX_METRIC:
+                log.warning(f"poisoning route with metric >= {RIP_MAX_METRIC}")
+                route.status = RouteStatus.DOWN
+            else:
+                route.status = RouteStatus.UP
+            routes.append(route)
+        log.debug(f"classful routes: {len(routes)} of {len(rtes)} entries")
         return routes
 
-    async def handle_udp_bytes(self, data: bytes, src_tuple: tuple[str, int]):
+    async def handle_udp_bytes(
+        self, data: bytes, src_tuple: tuple[str, int], link: Optional["RIP1_Link"] = None
+    ):
+        if link is None:
+            link = self.rp_interface.links[0]
         src_ip, src_port = src_tuple
         log.debug(f"handling_udp_bytes: {data=}, {src_tuple=}")
-        rip_pkt = dpkt.rip.RIP(data)
-        log.debug(f"received RIP packet: {rip_pkt.auth=}, {rip_pkt.data=}")
-        if src_ip == self.fp.get_local_ip():
+        try:
+            rip_pkt = decode(data)
+        except ValueError as e:
+            PACKETS_RX_OTHER.inc()
+            log.warning(f"received invalid RIP packet: {e}")
+            return
+        if self.fp.interfaces.is_local(src_ip):
             if self.rp_interface.reject_own_messages:
                 log.debug(f"ignoring own message!")
                 return
@@ -291,52 +382,115 @@ class RP_RIP1:
             log.debug(f"processing message from self!!!")
 
         match rip_pkt.cmd:
-            case dpkt.rip.REQUEST:  # this type of message is requesting route advertisements
-                log.debug(f"received RIP request: {rip_pkt.data=}")
-                self.send_response(dst_ip=src_ip, dst_port=src_port)
+            case RIP_Command.REQUEST:  # this type of message is requesting route advertisements
+                PACKETS_RX_REQUEST.inc()
+                log.debug(f"received RIP request: {rip_pkt.rtes=}")
+                # a paced response takes a while, so it goes out alongside the packets still arriving
+                asyncio.create_task(
+                    self.rp_interface.send_response(dst_ip=src_ip, dst_port=src_port, link=link)
+                )
 
-            case dpkt.rip.RESPONSE:  # this type of message is always for route advertisements (even event triggered ones)
-                log.debug(f"received RIP response: {rip_pkt.data=}")
-                routes = self.handle_response(rip_pkt, src_tuple)
+            case RIP_Command.RESPONSE:  # this type of message is always for route advertisements (even event triggered ones)
+                PACKETS_RX_RESPONSE.inc()
+                log.debug(f"received RIP response: {len(rip_pkt.rtes)} entries")
+                routes = self.handle_response(rip_pkt.rtes, src_tuple)
                 if not routes:
                     log.debug(f"no routes to add")
                     return
 
-                for route in routes:
-                    self.rp_interface._learned_routes.add(route)
+                # the root of the trace for a convergence event: refresh_rib, and the redistribution it triggers
+                # in the CP and the other protocols, are all children of this span
+                with span("rip.handle_response", src=src_ip, routes=len(routes)):
+                    # split horizon keeps the routes through src_ip off the link they were heard on
+                    self.rp_interface.heard_from(src_ip, link)
+                    route_change = False
+                    for route in routes:
+                        self.rp_interface.learn_route(route)
+                        route_change |= self.rp_interface.damp_route(route)
+                    ROUTE_UPDATES.inc(len(routes))
 
-                await self.rp_interface.refresh_rib(route_change=len(routes) > 0)
+                    await self.rp_interface.refresh_rib(route_change=route_change)
 
+                # poisoned routes that change what we advertise go out in the triggered update refresh_rib asks for
                 if any(route.metric == RIP_MAX_METRIC for route in routes):
                     log.warning(
                         f"received poisoned route(s): {[route.as_json for route in routes]}"
                     )
-                    self.send_response(
-                        dst_ip=str(self.default_dst_ip), dst_port=self.default_dst_port
-                    )
             case _:
+                PACKETS_RX_OTHER.inc()
                 log.warning(
                     f"received RIP packet with unexpected command: {rip_pkt.cmd}"
                 )
 
         return
 
-    async def listen(self, src_port: Optional[int] = None):
+    async def listen(self, src_port: Optional[int] = None, link: Optional["RIP1_Link"] = None):
+        if link is None:
+            link = self.rp_interface.links[0]
         if src_port is None:
-            src_port = self.default_src_port
-        await self.fp.listen_udp(src_port, self.handle_udp_bytes)
+            src_port = link.port
+        await self.fp.listen_udp(src_port, functools.partial(self.handle_udp_bytes, link=link), link.name)
 
     async def listen_timed(
-        self, src_port: Optional[int] = None, timeout_seconds: int = 0
+        self, src_port: Optional[int] = None, timeout_seconds: int = 0, link: Optional["RIP1_Link"] = None
     ):
         if timeout_seconds == 0:
-            await self.listen(src_port)  # no timeout
+            await self.listen(src_port, link)  # no timeout
         else:
+            if link is None:
+                link = self.rp_interface.links[0]
             await self.fp.listen_udp_timed(
-                src_port, self.handle_udp_bytes, timeout_seconds
+                src_port, functools.partial(self.handle_udp_bytes, link=link), timeout_seconds, link.name
             )
 
 
+class RIP1_Link:
+    """RIP1_Link is one network RIP runs on: the interface its packets are sent and heard on (every interface, if
+    name is None), the address its updates are broadcast to, and what is advertised there.  Each link keeps its own
+    advertisement, since split horizon leaves out (or, with poison reverse, poisons) different routes on each."""
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        broadcast: Optional[str] = None,
+        port: int = RP_RIP1.default_dst_port,
+        split_horizon: bool = True,
+        poison_reverse: bool = False,
+    ):
+        self.name = name
+        self.broadcast = broadcast
+        self.port = port
+        self.split_horizon = split_horizon
+        self.poison_reverse = poison_reverse
+        # the link's whole table as response packets, kept up to date with the RIB as routes change (see
+        # RP_RIP1_Interface.changed_exports), along with the versions and the position in the RIB's change log it is
+        # up to date with
+        self.advertisement = RIP1_Advertisement()
+        self.advertised_version: Optional[tuple] = None
+        self.advertised_position: Optional[tuple] = None
+
+    @classmethod
+    def from_spec(cls, spec: RIP1_LinkSpec, split_horizon: bool, poison_reverse: bool) -> "RIP1_Link":
+        return cls(
+            name=spec.get("name"),
+            broadcast=spec.get("broadcast"),
+            port=spec.get("port", RP_RIP1.default_dst_port),
+            split_horizon=spec.get("split_horizon", split_horizon),
+            poison_reverse=spec.get("poison_reverse", poison_reverse),
+        )
+
+    @property
+    def as_json(self) -> dict:
+        return {
+            "name": self.name,
+            "broadcast": self.broadcast,
+            "port": self.port,
+            "split_horizon": self.split_horizon,
+            "poison_reverse": self.poison_reverse,
+            "advertised_routes": len(self.advertisement),
+        }
+
+
 class RP_RIP1_Interface:
     """This is the outer interface for the routing protocol"""
 
@@ -351,19 +505,34 @@ class RP_RIP1_Interface:
         redistribute_sla_metric: int = 1,
         advertisement_interval: int = 5,
         request_interval: int = 30,
+        response_pacing_ms: int = 10,
         reject_own_messages: bool = False,
         cp_id: str = None,
         trigger_redistribution: bool = False,
         cp_client: RpCpClient = None,
+        max_paths: int = 4,
+        damper: Optional[FlapDamper] = None,
+        interfaces: Optional[list[RIP1_LinkSpec]] = None,
+        split_horizon: bool = True,
+        poison_reverse: bool = False,
     ):
         self.fp = fp
         self._rib = RIP1_RIB()
         self._learned_routes = RIP1_RIB()
+        # the next timer of each learned route: its timeout, then once it has timed out, its garbage collection
+        self._route_timers: TimerWheel[RIP1_Route] = TimerWheel(
+            RIP_HOUSEKEEPING_INTERVAL, RIP_ROUTE_GARBAGE_TIMEOUT // RIP_HOUSEKEEPING_INTERVAL + 1
+        )
         self._redistributed_routes = RIP1_RIB()
         self.admin_distance = admin_distance
         self.default_metric = default_metric
         self.advertisement_interval = advertisement_interval
         self.request_interval = request_interval
+        self.response_pacing_ms = response_pacing_ms
+        self.max_paths = max_paths
+        if damper is None:
+            damper = FlapDamper()
+        self.damper = damper
         self.redistribute_in_sources = []
         self.redistribute_in_metrics = {
             SourceCode.STATIC: redistribute_static_metric,
@@ -374,19 +543,34 @@ class RP_RIP1_Interface:
         if redistribute_sla_in:
             self.redistribute_in_sources.append(SourceCode.SLA)
 
-        self.small_rand_sleeps = True
         self.reject_own_messages = reject_own_messages
         self.trigger_redistribution = trigger_redistribution
         self._rp = RP_RIP1(self.fp, self)
         self.cp_id = cp_id
         self._cp = cp_client
         self._lock = asyncio.Lock()
-
-    @staticmethod
-    def small_sleep():
-        duration_ms = random.randint(0, 300) / 1000
-        log.info(f"sleeping for {duration_ms} ms")
-        time.sleep(duration_ms)
+        # the links RIP runs on, as configured (split_horizon and poison_reverse are their defaults), and the link
+        # each neighbor was last heard on; _neighbors_version changes along with it
+        self.interfaces: list[RIP1_LinkSpec] = list(interfaces or [])
+        self.split_horizon = split_horizon
+        self.poison_reverse = poison_reverse
+        self.links = self._build_links()
+        self._neighbor_links: dict[str, RIP1_Link] = {}
+        self._neighbors_version = 0
+        self._listeners: list[asyncio.Task] = []
+        self._triggered_update = asyncio.Event()
+        # the periodic jobs' schedules, which pick up changed intervals from the settings on their next run
+        self._advertisement_timer = PeriodicTimer(
+            lambda: self.advertisement_interval,
+            RIP_TIMER_JITTER,
+            TIMER_LATENESS.labels("advertisement").observe,
+        )
+        self._request_timer = PeriodicTimer(
+            lambda: self.request_interval, RIP_TIMER_JITTER, TIMER_LATENESS.labels("request").observe
+        )
+        self._housekeeping_timer = PeriodicTimer(
+            RIP_HOUSEKEEPING_INTERVAL, on_late=TIMER_LATENESS.labels("housekeeping").observe
+        )
 
     @classmethod
     def from_config(cls, config: Config, fp: ForwardingPlane, cp_id: str):
@@ -400,13 +584,125 @@ class RP_RIP1_Interface:
             redistribute_sla_metric=config.rp_rip1["redistribute_sla_metric"],
             advertisement_interval=config.rp_rip1["advertisement_interval"],
             request_interval=config.rp_rip1["request_interval"],
+            response_pacing_ms=config.rp_rip1["response_pacing_ms"],
             reject_own_messages=config.rp_rip1["reject_own_messages"],
             cp_client=RpCpClient(config.rp_rip1["cp_base_url"]),
             cp_id=cp_id,
             trigger_redistribution=config.rp_rip1["trigger_redistribution"],
+            max_paths=config.rp_rip1["max_paths"],
+            damper=FlapDamper.from_config(config.rp_rip1),
+            interfaces=config.rp_rip1["interfaces"],
+            split_horizon=config.rp_rip1["split_horizon"],
+            poison_reverse=config.rp_rip1["poison_reverse"],
         )
         return rslt
 
+    async def close(self):
+        """close will release the connections held by the CP client, and the forwarding plane's sockets"""
+        if self._cp is not None:
+            await self._cp.close()
+        self.fp.close()
+
+    @property
+    def settings(self) -> dict:
+        return {
+            "admin_distance": self.admin_distance,
+            "default_metric": self.default_metric,
+            "redistribute_static_in": SourceCode.STATIC in self.redistribute_in_sources,
+            "redistribute_static_metric": self.redistribute_in_metrics[SourceCode.STATIC],
+            "redistribute_sla_in": SourceCode.SLA in self.redistribute_in_sources,
+            "redistribute_sla_metric": self.redistribute_in_metrics[SourceCode.SLA],
+            "advertisement_interval": self.advertisement_interval,
+            "request_interval": self.request_interval,
+            "response_pacing_ms": self.response_pacing_ms,
+            "reject_own_messages": self.reject_own_messages,
+            "trigger_redistribution": self.trigger_redistribution,
+            "cp_base_url": self._cp.base_url if self._cp is not None else None,
+            "max_paths": self.max_paths,
+            "interfaces": self.interfaces,
+            "split_horizon": self.split_horizon,
+            "poison_reverse": self.poison_reverse,
+            **self.damper.settings,
+        }
+
+    def reload(self, config: Config) -> dict:
+        """reload will apply only the settings that changed.  Learned routes are kept, and the running timers pick
+        up new intervals on their next tick.  Redistribution settings take effect on the next redistribute_in.  A
+        change to the links replaces them, and restarts listening if it is running."""
+        settings = diff_settings(self.settings, config.rp_rip1)
+        relink = False
+        for key, value in settings.items():
+            match key:
+                case "redistribute_static_in" | "redistribute_sla_in":
+                    source = (
+                        SourceCode.STATIC
+                        if key == "redistribute_static_in"
+                        else SourceCode.SLA
+                    )
+                    if value and source not in self.redistribute_in_sources:
+                        self.redistribute_in_sources.append(source)
+                    elif not value and source in self.redistribute_in_sources:
+                        self.redistribute_in_sources.remove(source)
+                case "redistribute_static_metric":
+                    self.redistribute_in_metrics[SourceCode.STATIC] = value
+                case "redistribute_sla_metric":
+                    self.redistribute_in_metrics[SourceCode.SLA] = value
+                case "cp_base_url":
+                    if self._cp is not None:
+                        self._cp.close_soon()
+                    self._cp = RpCpClient(value)
+                case "interfaces" | "split_horizon" | "poison_reverse":
+                    setattr(self, key, list(value) if key == "interfaces" else value)
+                    relink = True
+                case _ if key.startswith("damping_"):
+                    pass  # handled by the damper below
+                case _:
+                    setattr(self, key, value)
+        self.damper.reconfigure(config.rp_rip1)
+        if relink:
+            self.relink()
+
+        return {"settings": settings}
+
+    def _build_links(self) -> list[RIP1_Link]:
+        # with no interfaces configured, RIP runs on a single link: every interface, broadcasting to default_dst_ip
+        return [
+            RIP1_Link.from_spec(spec, self.split_horizon, self.poison_reverse) for spec in self.interfaces or [{}]
+        ]
+
+    def relink(self):
+        """relink will replace the links with ones built from the configured interfaces.  Neighbors stay on the link
+        of the same name, and each new link's advertisement is built from scratch on its next update."""
+        self.links = self._build_links()
+        by_name = {link.name: link for link in self.links}
+        self._neighbor_links = {
+            neighbor: by_name[link.name] for neighbor, link in self._neighbor_links.items() if link.name in by_name
+        }
+        self._neighbors_version += 1
+        if self._listeners:
+            for task in self._listeners:
+                task.cancel()
+            self._start_listeners()
+
+    def link_destination(self, link: RIP1_Link) -> str:
+        """link_destination will return where link's updates are broadcast: its configured broadcast address, or
+        else the broadcast address of its interface, or default_dst_ip"""
+        if link.broadcast is not None:
+            return str(link.broadcast)
+        if link.name is not None:
+            for address in self.fp.interfaces.addresses:
+                if address.interface == link.name and address.broadcast is not None:
+                    return str(address.broadcast)
+        return str(self._rp.default_dst_ip)
+
+    def heard_from(self, neighbor: str | IPAddress, link: RIP1_Link):
+        """heard_from will record that neighbor was heard on link, which split horizon keeps its routes off"""
+        # RIB routes are rebuilt from json, so next hops are compared as strings
+        neighbor = str(neighbor)
+        if self._neighbor_links.get(neighbor) is not link:
+            self._neighbor_links[neighbor] = link
+            self._neighbors_version += 1
+
     @property
     def as_json(self) -> RIP1_RPSpec:
         return {
@@ -426,36 +722,153 @@ class RP_RIP1_Interface:
             ],
             "learned_routes": [route.as_json for route in self._learned_routes.items],
             "cp_id": self.cp_id,
+            "links": [link.as_json for link in self.links],
+        }
+
+    @property
+    def table_sizes(self) -> dict[str, int]:
+        return {
+            "rib": len(self._rib),
+            "learned": len(self._learned_routes),
+            "redistributed": len(self._redistributed_routes),
         }
 
+    @property
+    def rib_version(self) -> int:
+        return self._rib.version
+
+    @property
+    def best_routes_version(self) -> tuple:
+        """best_routes_version changes whenever best_routes might return something different, including when a
+        suppressed route becomes reusable.  It leaves the damper alone (see FlapDamper.current_version)."""
+        return self._rib.version, self.damper.current_version(), self.max_paths
+
     @property
     def rib_routes(self):
         return self._rib.items
 
-    def export_routes(self) -> set[RIP1_Route]:
-        routes = self._rib.items
-        best_routes: dict[IPNetwork, RIP1_Route] = dict()
-        for route in routes:
-            if route.prefix not in best_routes:
-                best_routes[route.prefix] = route
-            elif route.metric < best_routes[route.prefix].metric:
-                best_routes[route.prefix] = route
-        return set(best_routes.values())
+    @property
+    def rib(self) -> RIP1_RIB:
+        return self._rib
+
+    @property
+    def damping(self) -> list[DampingSpec]:
+        return self.damper.as_json
+
+    def damp_route(self, route: RIP1_Route) -> bool:
+        """damp_route will record the status of a learned route, and return whether the update should be propagated.
+        Without damping every update is propagated, otherwise only real changes to routes that aren't suppressed."""
+        key = damping_key(route)
+        changed = self.damper.update(key, route.status)
+        if not self.damper.enabled:
+            return True
+        return changed and not self.damper.is_suppressed(key)
+
+    def best_routes(
+        self, max_paths: Optional[int] = None, prefixes: Optional[Iterable[IPNetwork]] = None
+    ) -> list[RIP1_Route]:
+        """best_routes will return the ECMP set of best routes (lowest metric) for each prefix, or for each of
+        prefixes, which are looked up in the RIB's index."""
+        if max_paths is None:
+            max_paths = self.max_paths
+        # in prefix order from the RIB's index, so there's nothing to sort afterwards
+        if prefixes is None:
+            routes = self._rib.select()
+        else:
+            routes = (
+                route
+                for prefix in sorted(prefixes, key=prefix_key)
+                for route in self._rib.select(RouteFilter(prefix))
+            )
+        best_paths = select_best_paths(
+            self.damper.unsuppressed(routes),
+            key=lambda route: route.metric,
+            max_paths=max_paths,
+        )
+        return flatten_best_paths(best_paths, in_order=True)
+
+    def response_packet_gap(self, routes: int) -> float:
+        """response_packet_gap will return how long to pause between the packets of a response with this many routes,
+        in seconds: response_pacing_ms, or less if that would take a response over half the advertisement interval"""
+        gap = self.response_pacing_ms / 1000
+        packets = -(-routes // RIP_MAX_RTES)
+        if packets > 1 and self.advertisement_interval > 0:
+            gap = min(gap, self.advertisement_interval / 2 / packets)
+        return gap
+
+    def export_routes(self, prefixes: Optional[Iterable[IPNetwork]] = None) -> list[RIP1_Route]:
+        """RIPv1 advertises one route per prefix, so only the first of any equal-cost paths is exported."""
+        return self.best_routes(max_paths=1, prefixes=prefixes)
+
+    def link_export(self, link: RIP1_Link, route: RIP1_Route) -> Optional[RIP1_Route]:
+        """link_export will return route as it is advertised on link.  With split horizon (RFC 1058 2.2.1), a route
+        through a neighbor on link is left out, or advertised as unreachable with poison reverse."""
+        if not link.split_horizon or self._neighbor_links.get(str(route.next_hop)) is not link:
+            return route
+        if link.poison_reverse:
+            return RIP1_Route(route.prefix, route.next_hop, RIP_MAX_METRIC)
+        return None
+
+    def changed_exports(self, link: RIP1_Link) -> list[RIP1_Route]:
+        """changed_exports will bring link's advertisement up to date, and return the routes whose metric there
+        changed, along with an unreachable (metric RIP_MAX_METRIC) route for each prefix it no longer advertises.
+        Only the prefixes in the RIB's change log since the link's last update are looked at, unless the log doesn't
+        go back that far, or the damper has changed which routes are suppressed, or a neighbor has been heard on a
+        new link: then the whole table is compared."""
+        version = self._rib.version, self.damper.version, self._neighbors_version
+        if version == link.advertised_version:
+            return []
+        known = None
+        if link.advertised_version is not None and version[1:] == link.advertised_version[1:]:
+            known = self._rib.changes_since(*link.advertised_position)
+        link.advertised_version = version
+        link.advertised_position = self._rib.lineage, self._rib.changes_total
+
+        advertisement = link.advertisement
+        if known is None:
+            exported = {route.prefix: route for route in self.export_routes()}
+            prefixes = exported.keys() | advertisement.metrics().keys()
+        else:
+            changes, _ = known
+            prefixes = {route.prefix for _, route in changes}
+            exported = {route.prefix: route for route in self.export_routes(prefixes)}
+        rslt = []
+        for prefix in prefixes:
+            route = exported.get(prefix)
+            if route is not None:
+                route = self.link_export(link, route)
+            if route is None:
+                if prefix in advertisement:
+                    advertisement.remove(prefix)
+                    rslt.append(
+                        RIP1_Route(prefix, ipaddress.ip_address("0.0.0.0"), RIP_MAX_METRIC)
+                    )
+            elif advertisement.metric(prefix) != route.metric:
+                advertisement.set(route)
+                rslt.append(route)
+        return rslt
+
+    def advertisement(self, link: Optional[RIP1_Link] = None) -> RIP1_Advertisement:
+        """advertisement will return the whole table as link's response packets (by default, the first link's),
+        brought up to date with the RIB"""
+        if link is None:
+            link = self.links[0]
+        self.changed_exports(link)
+        return link.advertisement
 
     def redistribute_out(self) -> list[RedistributeOutRoute]:
         routes = (
             route
-            for route in self._rib.items
-            if route.route_source == SourceCode.RIP1 and route.metric < RIP_MAX_METRIC
+            for route in self._rib.select(RouteFilter(source=SourceCode.RIP1))
+            if route.metric < RIP_MAX_METRIC
+        )
+        best_paths = select_best_paths(
+            self.damper.unsuppressed(routes),
+            key=lambda route: route.metric,
+            max_paths=self.max_paths,
         )
-        best_routes: dict[IPNetwork, RIP1_Route] = dict()
-        for route in routes:
-            if route.prefix not in best_routes:
-                best_routes[route.prefix] = route
-            elif route.metric < best_routes[route.prefix].metric:
-                best_routes[route.prefix] = route
         rslt = []
-        for route in best_routes.values():
+        for route in flatten_best_paths(best_paths, in_order=True):
             json_route = route.as_json
             json_route.update(
                 {
@@ -469,7 +882,9 @@ class RP_RIP1_Interface:
     async def redistribute_in(
         self, route_specs: list[RedistributeInRouteSpec | RIP1_RouteSpec]
     ):
-        async with self._lock:
+        async with span(
+            "rip.redistribute_in", routes=len(route_specs)
+        ), self._lock, REDISTRIBUTE_IN_SECONDS.time():
             self._redistributed_routes = RIP1_RIB()
             for route_spec in route_specs:
                 if "metric" not in route_spec:
@@ -490,73 +905,146 @@ class RP_RIP1_Interface:
         await self.refresh_rib(route_change=False)
 
     async def refresh_rib(self, route_change: bool = False):
-        async with self._lock:
-            self._rib = RIP1_RIB()
-            self._rib.import_routes(self._redistributed_routes.export_routes())
-            self._rib.import_routes(self._learned_routes.export_routes())
+        async with span(
+            "rip.refresh_rib", route_change=route_change
+        ), self._lock, REFRESH_RIB_SECONDS.time():
+            rib = RIP1_RIB()
+            rib.import_routes(self._redistributed_routes.export_routes())
+            rib.import_routes(self._learned_routes.export_routes())
+            rib.continue_from(self._rib)
+            previous, self._rib = self._rib, rib
+            if rib.changes_total != previous.changes_total:
+                self._triggered_update.set()
 
             if route_change and self.trigger_redistribution:
                 asyncio.create_task(self._cp.redistribute(self.cp_id))
 
-    async def send_response(self):
-        self._rp.send_response()
+    async def send_response(
+        self, dst_ip: Optional[str] = None, dst_port: Optional[int] = None, link: Optional[RIP1_Link] = None
+    ) -> int:
+        """send_response will advertise the whole table: a regular update on every link, or the response to a request
+        on the link it was heard on"""
+        if dst_ip is None and link is None:
+            return sum(await asyncio.gather(*(self._rp.send_response(link=link) for link in self.links)))
+        return await self._rp.send_response(dst_ip=dst_ip, dst_port=dst_port, link=link)
+
+    async def send_triggered_update(self) -> int:
+        """send_triggered_update will advertise on each link just the routes that changed there since its last
+        update"""
+        sent = 0
+        for link in self.links:
+            routes = self.changed_exports(link)
+            if not routes:
+                continue
+            log.info(f"sending triggered update for {len(routes)} routes on {link.name or 'the default link'}")
+            sent += await self._rp.send_response(routes=routes, link=link)
+        return sent
+
+    async def send_request(self, link: Optional[RIP1_Link] = None) -> int:
+        return self._rp.send_request(link)
 
-    async def send_request(self) -> int:
-        return self._rp.send_request()
+    def _start_listeners(self):
+        self._listeners = [asyncio.create_task(self._rp.listen(link=link)) for link in self.links]
 
     async def listen(self):
-        await self._rp.listen()
+        await asyncio.gather(*(self._rp.listen(link=link) for link in self.links))
 
     async def run_advertisements(self):
         log.info(f"in async def run_advertisements")
         while True:
+            await self._advertisement_timer.wait()
             await self.send_response()
-            await asyncio.sleep(self.advertisement_interval)
+
+    async def run_triggered_updates(self):
+        """run_triggered_updates will send a triggered update when the RIB changes (RFC 1058 3.5).  After each one,
+        changes are held for a random RIP_TRIGGERED_UPDATE_HOLDOFF seconds and then go out together.  A triggered
+        update is skipped if a regular update is due by the time the shortest holdoff would have ended."""
+        log.info(f"in async def run_triggered_updates")
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._triggered_update.wait()
+            self._triggered_update.clear()
+            next_regular_update = self._advertisement_timer.next_due
+            if (
+                next_regular_update is not None
+                and next_regular_update - loop.time() <= RIP_TRIGGERED_UPDATE_HOLDOFF[0]
+            ):
+                TRIGGERED_UPDATES_SUPPRESSED.inc()
+                continue
+            if await self.send_triggered_update():
+                TRIGGERED_UPDATES_SENT.inc()
+                await asyncio.sleep(random.uniform(*RIP_TRIGGERED_UPDATE_HOLDOFF))
 
     async def run_requests(self):
         log.info(f"in async def run_requests")
+        loop = asyncio.get_running_loop()
         while True:
-            port = await self.send_request()
-            log.info(f"request sent on port {port}")
-            log.info(f"listening on port {port}")
-            await self._rp.listen_timed(port, self.request_interval - 1)
-            await asyncio.sleep(1)  # finish out the request_interval
+            await self._request_timer.wait()
+            # each link's responses come back to the port its request was sent from, until the next request
+            requests = [(link, await self.send_request(link)) for link in self.links]
+            log.info(f"requests sent on ports {[port for _, port in requests]}, listening")
+            timeout = self._request_timer.next_due - loop.time()
+            if timeout > 0:
+                await asyncio.gather(*(self._rp.listen_timed(port, timeout, link) for link, port in requests))
+
+    def learn_route(self, route: RIP1_Route):
+        """learn_route will add (or refresh) a route heard from a neighbor, and restart its timeout"""
+        self._learned_routes.add(route)
+        self._route_timers.arm(route, route.last_updated + RIP_ROUTE_TIMEOUT)
+
+    def expire_routes(self, now: Optional[float] = None) -> tuple[bool, bool]:
+        """expire_routes will mark the learned routes whose timeout has passed as down, and remove those whose garbage
+        collection has passed.  Only the routes whose timers came due are looked at.  It returns whether any routes
+        changed, and whether any of those changes should be redistributed."""
+        if now is None:
+            now = self._route_timers.clock()
+        changed = route_change = False
+        for key in self._route_timers.expired(now):
+            route = self._learned_routes.get(key)
+            if route is None:
+                continue
+            if route.last_updated + RIP_ROUTE_GARBAGE_TIMEOUT <= now:
+                log.info(f"removing route {route.as_json}")
+                self._learned_routes.remove(route)
+                self.damper.discard(damping_key(route), now)
+                ROUTE_GARBAGE.inc()
+                changed = route_change = True
+                continue
+
+            self._route_timers.arm(route, route.last_updated + RIP_ROUTE_GARBAGE_TIMEOUT)
+            if route.metric >= RIP_MAX_METRIC:
+                continue  # don't bother with routes that are already maxed out
+            log.info(f"marking route {route.as_json} as down")
+            route.status = RouteStatus.DOWN
+            route.metric = RIP_MAX_METRIC
+            self._learned_routes.touch(route)
+            ROUTE_TIMEOUTS.inc()
+            changed = True
+            route_change |= self.damp_route(route)
+        return changed, route_change
 
     async def check_routes(self):
         log.info(f"in async def check_routes")
-        route_change = False
         while True:
-            # check learned routes for expiration
-            for route in self._learned_routes.items:
-                if route.last_updated + RIP_ROUTE_GARBAGE_TIMEOUT < time.time():
-                    log.info(f"removing route {route.as_json}")
-                    self._learned_routes.remove(route)
-                    route_change = True
-                elif route.last_updated + RIP_ROUTE_TIMEOUT < time.time():
-                    if route.metric >= RIP_MAX_METRIC:
-                        continue  # don't bother with routes that are already maxed out
-
-                    log.info(f"marking route {route.as_json} as down")
-                    route.status = RouteStatus.DOWN
-                    route.metric = RIP_MAX_METRIC
-                    route_change = True
-
-            self.refresh_rib(route_change)
-
-            if route_change and self.trigger_redistribution:
-                # await self._cp.redistribute(self.cp_id)
-                route_change = False
-                asyncio.create_task(self._cp.redistribute(self.cp_id))
+            await self._housekeeping_timer.wait()
+            changed, route_change = self.expire_routes()
+            if self.damper.release_reusable():
+                changed = route_change = True
 
-            await asyncio.sleep(RIP_HOUSEKEEPING_INTERVAL)
+            # refresh_rib asks the CP to redistribute, if route_change and trigger_redistribution
+            if changed:
+                await self.refresh_rib(route_change)
 
     def run_protocol(self):
         log.info("about to listen")
 
-        asyncio.create_task(self.listen())
+        # keeps the addresses used to recognize our own messages up to date
+        self.fp.interfaces.start()
+        self._start_listeners()
         if self.request_interval > 0:
             asyncio.create_task(self.run_requests())
         if self.advertisement_interval > 0:
             asyncio.create_task(self.run_advertisements())
+            asyncio.create_task(self.run_triggered_updates())
         if RIP_HOUSEKEEPING_INTERVAL > 0:
             asyncio.create_task(self.check_routes())
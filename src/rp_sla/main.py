@@ -18,19 +18,38 @@ routes will be handled as prefixes using the built-in ipaddress module.
 
 since this protocol does not have redistribution, it will only have configured routes.  Configured routes are the only routes that will be in the RIB.
 """
+import asyncio
 import time
 from typing import Type, Optional, Literal
 from typing_extensions import TypedDict
 
-from src.config import Config
+from src.config import Config, diff_routes, diff_settings, route_key
 from src.fp_interface import ForwardingPlane
+from src.generic.metrics import Histogram, Counter
+from src.generic.damping import FlapDamper, DampingKey, DampingSpec, damping_key
+from src.generic.tracing import span
 from src.system import RouteStatus, IPNetwork, IPAddress, SourceCode
 from src.generic.rib import (
     Route,
     RouteSpec,
     RIB_Base,
+    RouteFilter,
     RedistributeOutRouteSpec,
     RedistributeOutRoute,
+    select_best_paths,
+    flatten_best_paths,
+)
+
+
+PROBE_RTT_SECONDS = Histogram(
+    "pyrp_sla_probe_rtt_seconds", "Round trip time of successful SLA probes"
+)
+PROBES = Counter("pyrp_sla_probes_total", "SLA probes sent, by outcome", ["result"])
+PROBES_UP = PROBES.labels("up")
+PROBES_DOWN = PROBES.labels("down")
+PROBES_TIMEOUT = PROBES.labels("timeout")
+ROUTE_CHANGES = Counter(
+    "pyrp_sla_route_changes_total", "SLA route status changes after a probe"
 )
 
 
@@ -101,13 +120,15 @@ class SLA_RPSpec(TypedDict):
     configured_routes: list[SLA_RouteSpec]
     cp_id: Optional[str]
     trigger_redistribution: bool
+    max_paths: int
 
 
 class SLA_RIB(RIB_Base):
     route_type: Type[Route] = SLA_Route
 
     def __init__(self):
-        self._table: set[SLA_Route] = set()
+        super().__init__()
+        self._table: set[SLA_Route]
 
     @property
     def items(self) -> set[SLA_Route]:
@@ -118,14 +139,16 @@ class SLA_RIB(RIB_Base):
             self._validate_fields(**route)
             route = self.route_type(**route)
 
-        self._table.add(route)
+        self._table_add(route)
+        self.touch()
 
     def remove(self, route: SLA_RouteSpec | route_type):
         if isinstance(route, dict):
             self._validate_fields(**route)
             route = self.route_type(**route)
 
-        self._table.discard(route)
+        self._table_discard(route)
+        self.touch()
 
     discard = remove
 
@@ -138,6 +161,8 @@ class RP_SLA:
         admin_distance: int = 1,
         cp_id: Optional[str] = None,
         trigger_redistribution: bool = False,
+        max_paths: int = 4,
+        damper: Optional[FlapDamper] = None,
     ):
         self.fp = fp
         self._configured_routes = SLA_RIB()
@@ -146,6 +171,13 @@ class RP_SLA:
         self.admin_distance = admin_distance
         self.cp_id = cp_id
         self.trigger_redistribution = trigger_redistribution
+        self.max_paths = max_paths
+        if damper is None:
+            damper = FlapDamper()
+        self.damper = damper
+        # when each route was last probed; kept apart from the routes, so a probe that changes nothing leaves the RIB
+        # (and its version) alone
+        self._probed_at: dict[DampingKey, float] = {}
 
     @classmethod
     def from_config(cls, config: Config, fp: ForwardingPlane, cp_id: str):
@@ -155,6 +187,8 @@ class RP_SLA:
             config.rp_sla.get("admin_distance", 1),
             cp_id=cp_id,
             trigger_redistribution=config.rp_sla.get("trigger_redistribution", False),
+            max_paths=config.rp_sla.get("max_paths", 4),
+            damper=FlapDamper.from_config(config.rp_sla),
         )
         for route in config.rp_sla.get("routes", []):
             route: SLA_RouteSpec
@@ -172,16 +206,83 @@ class RP_SLA:
             ],
             "cp_id": self.cp_id,
             "trigger_redistribution": self.trigger_redistribution,
+            "max_paths": self.max_paths,
         }
 
+    @property
+    def settings(self) -> dict:
+        return {
+            "admin_distance": self.admin_distance,
+            "threshold_measure_interval": self._threshold_measure_interval,
+            "trigger_redistribution": self.trigger_redistribution,
+            "max_paths": self.max_paths,
+            **self.damper.settings,
+        }
+
+    def reload(self, config: Config) -> dict:
+        """reload will apply only what changed between the configured routes/settings and config.
+        Routes that are kept keep their status, so nothing has to be re-evaluated."""
+        configured = {
+            damping_key(route): route for route in self._configured_routes.items
+        }
+        routes_diff = diff_routes(
+            (route.as_json for route in configured.values()),
+            config.rp_sla.get("routes", []),
+        )
+        for route_spec in routes_diff.removed:
+            self.remove_configured_route(configured[route_key(route_spec)])
+
+        for route_spec in routes_diff.changed:
+            route = configured[route_key(route_spec)]
+            route.priority = route_spec.get("priority", route.priority)
+            route.threshold_ms = route_spec.get("threshold_ms", route.threshold_ms)
+            self._configured_routes.touch(route)
+            self._rib.touch(route)
+
+        for route in routes_diff.added:
+            route: SLA_RouteSpec
+            route["route_source"] = SourceCode.SLA
+            self.add_configured_route(route)
+
+        settings = diff_settings(self.settings, config.rp_sla)
+        if "admin_distance" in settings:
+            self.admin_distance = settings["admin_distance"]
+        if "threshold_measure_interval" in settings:
+            self._threshold_measure_interval = settings["threshold_measure_interval"]
+        if "trigger_redistribution" in settings:
+            self.trigger_redistribution = settings["trigger_redistribution"]
+        if "max_paths" in settings:
+            self.max_paths = settings["max_paths"]
+        self.damper.reconfigure(config.rp_sla)
+
+        return {"routes": routes_diff.as_json, "settings": settings}
+
+    @property
+    def table_sizes(self) -> dict[str, int]:
+        return {"rib": len(self._rib), "configured": len(self._configured_routes)}
+
     @property
     def configured_routes(self):
         return self._configured_routes.items
 
+    @property
+    def rib_version(self) -> int:
+        return self._rib.version
+
+    @property
+    def best_routes_version(self) -> tuple:
+        """best_routes_version changes whenever best_routes might return something different, including when a
+        suppressed route becomes reusable.  It leaves the damper alone (see FlapDamper.current_version)."""
+        return self._rib.version, self.damper.current_version(), self.max_paths
+
     @property
     def rib_routes(self):
         return self._rib.items
 
+    @property
+    def rib(self) -> SLA_RIB:
+        return self._rib
+
     @property
     def up_routes(self):
         return [route for route in self.rib_routes if route.status == RouteStatus.UP]
@@ -195,52 +296,94 @@ class RP_SLA:
     def remove_configured_route(self, route: SLA_RouteSpec | SLA_Route):
         self._configured_routes.discard(route)
         self._rib.discard(route)
+        self.damper.forget(damping_key(route))
+        self._probed_at.pop(damping_key(route), None)
 
-    def evaluate_route(self, sla_route: SLA_Route):
-        """evaluate_route will evaluate the given route in the RIB."""
-        if (
-            sla_route.status == RouteStatus.UNKNOWN
-            or (time.time() - sla_route.last_updated) > self._threshold_measure_interval
-        ):
-            try:
-                rtt_ms = (
-                    self.fp.ping(
-                        sla_route.next_hop,
-                        timeout_seconds=int(sla_route.threshold_ms / 1000),
-                    )
-                    * 1000
-                )
-                if rtt_ms <= sla_route.threshold_ms:
-                    sla_route.status = RouteStatus.UP
-                else:
-                    sla_route.status = RouteStatus.DOWN
-            except TimeoutError:
-                sla_route.status = RouteStatus.DOWN
-
-            sla_route.last_updated = time.time()
-
-    def evaluate_routes(self):
-        """evaluate_routes will evaluate all routes in the configured_routes."""
-        for sla_route in self._rib.items:
-            self.evaluate_route(sla_route)
+    @property
+    def damping(self) -> list[DampingSpec]:
+        return self.damper.as_json
 
-    def redistribute_out(self) -> set[RedistributeOutRoute]:
-        """redistribute_out will return a set of only best routes (up, highest priority)."""
-        up_routes = (
-            route for route in self.up_routes if route.route_source == SourceCode.SLA
+    def _probe_due(self, sla_route: SLA_Route) -> bool:
+        return (
+            sla_route.status == RouteStatus.UNKNOWN
+            or (time.time() - self._probed_at.get(damping_key(sla_route), sla_route.last_updated))
+            > self._threshold_measure_interval
         )
 
-        best_routes: dict[IPNetwork, SLA_Route] = dict()
-        for route in up_routes:
-            if route.prefix not in best_routes:
-                best_routes[route.prefix] = route
+    def _record_probe(self, sla_route: SLA_Route, rtt: Optional[float]):
+        """_record_probe will update the route's status from a probe's round trip time, None if it timed out.  The
+        route, and so the RIB, is only touched when its status changes."""
+        if rtt is None:
+            status = RouteStatus.DOWN
+            PROBES_TIMEOUT.inc()
+        else:
+            PROBE_RTT_SECONDS.observe(rtt)
+            rtt_ms = rtt * 1000
+            if rtt_ms <= sla_route.threshold_ms:
+                status = RouteStatus.UP
+                PROBES_UP.inc()
             else:
-                if route.priority > best_routes[route.prefix].priority:
-                    best_routes[route.prefix] = route
-        result = set(
-            RedistributeOutRoute(
-                admin_distance=self.admin_distance, strict=False, **route.as_json
+                status = RouteStatus.DOWN
+                PROBES_DOWN.inc()
+
+        now = time.time()
+        self._probed_at[damping_key(sla_route)] = now
+        if RouteStatus(sla_route.status) != status:
+            sla_route.status = status
+            sla_route.last_updated = now
+            self._rib.touch(sla_route)
+        if self.damper.update(damping_key(sla_route), sla_route.status):
+            ROUTE_CHANGES.inc()
+
+    async def evaluate_route(self, sla_route: SLA_Route):
+        """evaluate_route will evaluate the given route in the RIB.  The ping waits on its socket in a thread, so the
+        event loop isn't held up meanwhile."""
+        if self._probe_due(sla_route):
+            try:
+                rtt = await asyncio.to_thread(
+                    self.fp.ping,
+                    sla_route.next_hop,
+                    timeout_seconds=int(sla_route.threshold_ms / 1000),
+                )
+            except TimeoutError:
+                rtt = None
+            self._record_probe(sla_route, rtt)
+
+    async def evaluate_routes(self):
+        """evaluate_routes will evaluate all routes in the configured_routes.  The next hops due a probe are all
+        pinged at once (each next hop once), and wait for as long as the most patient of their routes.  That wait is
+        in a thread, so the event loop isn't held up meanwhile; the results are recorded back on the loop."""
+        with span("sla.evaluate_routes", routes=len(self._rib)):
+            self.damper.release_reusable()
+            due = [sla_route for sla_route in self._rib.items if self._probe_due(sla_route)]
+            if not due:
+                return
+            rtts = await asyncio.to_thread(
+                self.fp.ping_many,
+                [sla_route.next_hop for sla_route in due],
+                timeout_seconds=max(int(sla_route.threshold_ms / 1000) for sla_route in due),
             )
-            for route in best_routes.values()
+            for sla_route in due:
+                self._record_probe(sla_route, rtts.get(str(sla_route.next_hop)))
+
+    def best_routes(self) -> list[SLA_Route]:
+        """best_routes will return the ECMP set of best routes (up, highest priority) for each prefix.
+        Routes suppressed by flap damping are left out."""
+        # in prefix order from the RIB's index, so there's nothing to sort afterwards
+        up_routes = self.damper.unsuppressed(
+            self._rib.select(RouteFilter(source=SourceCode.SLA, status=RouteStatus.UP))
         )
-        return result
+        best_paths = select_best_paths(
+            up_routes, key=lambda route: -route.priority, max_paths=self.max_paths
+        )
+        return flatten_best_paths(best_paths, in_order=True)
+
+    def redistribute_out(self) -> list[RedistributeOutRoute]:
+        """redistribute_out will return only best routes (up, highest priority), including equal-cost paths."""
+        with span("sla.redistribute_out"):
+            return [
+                RedistributeOutRoute(
+                    admin_distance=self.admin_distance, strict=False, **route.as_json
+                )
+                for route in self.best_routes()
+            ]
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+
+from src.control_plane.clients.base import BatchOperationError
+from src.control_plane.clients.client_control_plane import RpCpClient
+from src.generic.batch import call_app, router, run_batch
+
+app = FastAPI()
+app.include_router(router)
+redistributions = []
+
+
+@app.post("/instances/{instance_id}/redistribute")
+async def redistribute(instance_id: str):
+    if instance_id != "latest":
+        raise HTTPException(status_code=404, detail=f"instance {instance_id} not found")
+    redistributions.append(instance_id)
+    return None
+
+
+@app.get("/instances/{instance_id}/routes")
+async def get_routes(instance_id: str):
+    return [{"prefix": "10.0.0.0/8", "redistributions": len(redistributions)}]
+
+
+@app.get("/instances/{instance_id}/routes/events")
+async def get_route_events(instance_id: str):
+    async def events():
+        while True:
+            yield b": keepalive\n\n"
+            await asyncio.sleep(0.01)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/slow")
+async def slow():
+    await asyncio.sleep(10)
+
+
+class InProcessCpClient(RpCpClient):
+    """sends /batch straight to the app, instead of over HTTP"""
+
+    async def apost(self, url, params=None, data=None, json=None, timeout=None):
+        assert url == "/batch"
+        return await run_batch(app, json, params["stop_on_error"] == "true")
+
+    async def get_rib_routes_later(self, instance_id):
+        # awaits something else before its request
+        await asyncio.sleep(0.01)
+        return await self.aget(f"/instances/{instance_id}/routes")
+
+
+def test_batch():
+    redistributions.clear()
+
+    async def run():
+        client = InProcessCpClient("http://cp")
+        batch = client.batch()
+        rslt = await batch.run(
+            batch.redistribute("latest"), batch.get_rib_routes("latest")
+        )
+
+        failing = client.batch(stop_on_error=True)
+        errors = await failing.run(
+            failing.redistribute("other"),
+            failing.get_rib_routes("latest"),
+            return_exceptions=True,
+        )
+        return rslt, errors
+
+    (redistributed, routes), errors = asyncio.run(run())
+    assert redistributed is None
+    assert routes == [{"prefix": "10.0.0.0/8", "redistributions": 1}]
+
+    assert [type(e) for e in errors] == [BatchOperationError, BatchOperationError]
+    assert [e.status for e in errors] == [404, 424]
+
+
+def test_batch_not_nested():
+    rslt = asyncio.run(
+        run_batch(app, [{"method": "POST", "path": "/batch", "json": []}])
+    )
+    assert rslt[0]["status"] == 400
+
+
+def test_batch_calls_that_await_first():
+    redistributions.clear()
+
+    async def run():
+        batch = InProcessCpClient("http://cp").batch()
+        return await asyncio.wait_for(
+            batch.run(batch.get_rib_routes_later("latest"), batch.redistribute("latest")), 1
+        )
+
+    # recorded after the redistribute, but sent first, in the order the calls were passed
+    routes, redistributed = asyncio.run(run())
+    assert routes == [{"prefix": "10.0.0.0/8", "redistributions": 0}]
+    assert redistributions == ["latest"]
+
+
+def test_batch_no_streams():
+    async def run():
+        streamed = await asyncio.wait_for(
+            run_batch(app, [{"method": "GET", "path": "/instances/latest/routes/events"}]), 1
+        )
+        slow = await call_app(app, {"method": "GET", "path": "/slow"}, timeout=0.05)
+        return streamed, slow
+
+    streamed, slow = asyncio.run(run())
+    assert streamed[0]["status"] == 400
+    assert slow["status"] == 504
@@ -0,0 +1,205 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from src.control_plane.clients.base import BaseClient, CircuitBreaker, CircuitOpenError
+
+
+def test_circuit_breaker(mocker):
+    now = mocker.patch("src.control_plane.clients.base.time.monotonic", return_value=0)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.before_request("peer")
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request("peer")
+
+    now.return_value = 10
+    breaker.before_request("peer")  # the one trial request
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request("peer")
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_cancelled_trial():
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow(request):
+        started.set()
+        await release.wait()
+        return web.json_response({"ok": True})
+
+    async def fast(request):
+        return web.json_response({"ok": True})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/slow", slow)
+        app.router.add_get("/fast", fast)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        client = BaseClient(f"http://127.0.0.1:{port}")
+        breaker = client.breaker
+        try:
+            breaker.opened_at = time.monotonic() - breaker.reset_timeout
+            trial = asyncio.create_task(client.aget("/slow"))
+            await started.wait()
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            # the cancelled trial doesn't hold the breaker open: the next request is the new trial
+            assert breaker.state == "half-open"
+            assert await client.aget("/fast") == {"ok": True}
+            assert breaker.state == "closed"
+        finally:
+            release.set()
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_client_pooling_and_retries():
+    calls = []
+
+    async def flaky(request):
+        calls.append(request.method)
+        if len(calls) == 1:
+            return web.Response(status=503)
+        return web.json_response({"ok": True})
+
+    async def run():
+        app = web.Application()
+        app.router.add_route("*", "/flaky", flaky)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        client = BaseClient(f"http://127.0.0.1:{port}", backoff=0)
+        try:
+            assert await client.aget("/flaky") == {"ok": True}
+            session = client._get_session()
+            assert await client.aget("/flaky") == {"ok": True}
+            assert client._get_session() is session
+
+            # a POST isn't retried on a 5xx
+            calls.clear()
+            with pytest.raises(aiohttp.ClientResponseError):
+                await client.apost("/flaky")
+            assert calls == ["POST"]
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_client_etag_revalidation():
+    statuses = []
+
+    async def routes(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            statuses.append(304)
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        statuses.append(200)
+        return web.json_response([{"prefix": "10.0.0.0/8"}], headers={"ETag": '"v1"'})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/routes", routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        client = BaseClient(f"http://127.0.0.1:{port}")
+        try:
+            first = await client.aget("/routes")
+            first[0]["prefix"] = "changed by the caller"
+            second = await client.aget("/routes")
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return second
+
+    assert asyncio.run(run()) == [{"prefix": "10.0.0.0/8"}]
+    assert statuses == [200, 304]
+
+
+def test_client_ndjson_stream():
+    async def routes(request):
+        assert request.headers["Accept"] == "application/x-ndjson"
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for i in range(3):
+            await response.write(f'{{"prefix": "10.{i}.0.0/16"}}\n'.encode())
+        await response.write_eof()
+        return response
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/routes", routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        client = BaseClient(f"http://127.0.0.1:{port}")
+        try:
+            return [route async for route in client.aiter_ndjson("/routes")]
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == [{"prefix": f"10.{i}.0.0/16"} for i in range(3)]
+
+
+def test_client_event_stream_reconnects():
+    last_event_ids = []
+
+    async def events(request):
+        last_event_ids.append(request.headers.get("Last-Event-ID"))
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        n = len(last_event_ids)
+        await response.write(f'id: 1-{n}\nevent: delta\ndata: {{"n": {n}}}\n\n: keepalive\n\n'.encode())
+        await response.write_eof()
+        return response
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/events", events)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        client = BaseClient(f"http://127.0.0.1:{port}", backoff=0)
+        seen = []
+        try:
+            async for event in client.aiter_events("/events"):
+                seen.append(event)
+                if len(seen) == 2:
+                    break
+            return seen
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == [("delta", {"n": 1}), ("delta", {"n": 2})]
+    # the stream closed after each event, and was picked up again from the last one
+    assert last_event_ids == [None, "1-1"]
@@ -3,7 +3,7 @@ from pprint import pprint
 
 import pytest
 
-from src.config import Config
+from src.config import Config, diff_routes, diff_settings
 
 
 def get_path_to_config(filename: str):
@@ -20,3 +20,25 @@ def test_config_load():
     assert cfg.rp_sla["admin_distance"] == 1
     assert cfg.rp_sla["threshold_measure_interval"] == 60
     assert len(cfg.rp_sla["routes"]) == 5
+
+
+def test_diff_routes():
+    old_routes = [
+        {"prefix": "10.0.0.0/8", "next_hop": "1.1.1.1", "priority": 1},
+        {"prefix": "0.0.0.0/0", "next_hop": "1.1.1.1", "priority": 1},
+    ]
+    new_routes = [
+        {"prefix": "10.0.0.0/8", "next_hop": "1.1.1.1", "priority": 2},
+        {"prefix": "0.0.0.0/0", "next_hop": "1.1.1.2", "priority": 1},
+    ]
+    diff = diff_routes(old_routes, new_routes)
+    assert diff.added == [new_routes[1]]
+    assert diff.removed == [old_routes[1]]
+    assert diff.changed == [new_routes[0]]
+    assert not diff_routes(old_routes, old_routes)
+
+
+def test_diff_settings():
+    old_settings = {"admin_distance": 1, "max_paths": 4}
+    new_settings = {"admin_distance": 1, "max_paths": 2, "routes": []}
+    assert diff_settings(old_settings, new_settings) == {"max_paths": 2}
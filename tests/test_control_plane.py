@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api_control_plane
+from src.control_plane.main import ControlPlane
+from src.generic.damping import FlapDamper, damping_key
+from src.system import RouteStatus, SourceCode
+
+
+class FakeRpSlaClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def redistribute_out(self, instance_id):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return [
+            {
+                "prefix": "0.0.0.0/0",
+                "next_hop": f"1.1.1.{self.calls % 2 + 1}",
+                "route_source": SourceCode.SLA.value,
+                "admin_distance": 1,
+                "last_updated": None,
+            }
+        ]
+
+
+@pytest.fixture
+def control_plane():
+    cp = ControlPlane("router", FakeRpSlaClient(), None)
+    cp.add_static_route(
+        {
+            "prefix": "10.0.0.0/8",
+            "next_hop": "192.168.1.1",
+            "admin_distance": 1,
+            "route_source": SourceCode.STATIC,
+        }
+    )
+    return cp
+
+
+def test_control_plane_concurrent_redistribute(control_plane):
+    async def run():
+        await asyncio.gather(*(control_plane.redistribute() for _ in range(100)))
+
+    asyncio.run(run())
+    assert control_plane.rp_sla_client.calls == 100
+    # every rebuild is whole, so the RIB always holds the static route and exactly one SLA route
+    assert len(control_plane.rib_routes) == 2
+    assert {route.route_source for route in control_plane.rib_routes} == {
+        SourceCode.STATIC,
+        SourceCode.SLA,
+    }
+
+
+def test_control_plane_reusable_route_etag(control_plane, mocker):
+    clock = mocker.patch("src.generic.damping.time")
+    clock.time.return_value = 1000.0
+    control_plane.damper = FlapDamper(enabled=True, half_life=60)
+    asyncio.run(control_plane.redistribute())
+    sla_route = next(route for route in control_plane.rib_routes if route.route_source == SourceCode.SLA)
+    for _ in range(2):
+        control_plane.damper.update(damping_key(sla_route), RouteStatus.DOWN)
+        control_plane.damper.update(damping_key(sla_route), RouteStatus.UP)
+    api_control_plane.protocol_instances["reusable"] = control_plane
+    try:
+        client = TestClient(api_control_plane.app)
+        response = client.get("/instances/reusable/best_routes")
+        assert [route["prefix"] for route in response.json()] == ["10.0.0.0/8"]
+        etag = response.headers["ETag"]
+        assert client.get("/instances/reusable/best_routes", headers={"If-None-Match": etag}).status_code == 304
+
+        # once the penalty has decayed, the route is back, without anything having released it in between
+        clock.time.return_value = control_plane.damper.next_reuse() + 1
+        response = client.get("/instances/reusable/best_routes", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [route["prefix"] for route in response.json()] == ["0.0.0.0/0", "10.0.0.0/8"]
+    finally:
+        del api_control_plane.protocol_instances["reusable"]
+
+
+def test_control_plane_redistributes_reusable(control_plane, mocker):
+    clock = mocker.patch("src.generic.damping.time")
+    clock.time.return_value = 1000.0
+    mocker.patch("src.control_plane.main.REUSE_DELAY", 0)
+    control_plane.damper = FlapDamper(enabled=True, half_life=60)
+
+    async def run():
+        await control_plane.redistribute()
+        key = damping_key(next(route for route in control_plane.rib_routes if route.route_source == SourceCode.SLA))
+        for _ in range(2):
+            control_plane.damper.update(key, RouteStatus.DOWN)
+            control_plane.damper.update(key, RouteStatus.UP)
+        await control_plane.redistribute()
+        calls = control_plane.rp_sla_client.calls
+        # the reuse time has passed by the wall clock, so a redistribution is due straight away, and releases the route
+        clock.time.return_value = control_plane.damper.next_reuse() + 1
+        await asyncio.sleep(0.01)
+        assert control_plane.rp_sla_client.calls == calls + 1
+        assert control_plane.damper.next_reuse() is None
+
+    asyncio.run(run())
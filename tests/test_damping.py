@@ -0,0 +1,118 @@
+import pytest
+
+from src.generic.damping import FlapDamper
+from src.system import RouteStatus
+
+KEY = ("10.0.0.0/8", "1.1.1.1")
+
+
+@pytest.fixture
+def damper():
+    return FlapDamper(
+        enabled=True,
+        penalty=1000,
+        suppress_threshold=2000,
+        reuse_threshold=750,
+        half_life=60,
+        max_suppress_time=240,
+    )
+
+
+def flap(damper: FlapDamper, now: float):
+    damper.update(KEY, RouteStatus.DOWN, now=now)
+    damper.update(KEY, RouteStatus.UP, now=now)
+
+
+def test_damping_suppress_and_reuse(damper):
+    assert damper.update(KEY, RouteStatus.UP, now=0)
+    assert not damper.update(KEY, RouteStatus.UP, now=0)
+
+    flap(damper, now=0)
+    assert damper.penalty(KEY, now=0) == 1000
+    assert not damper.is_suppressed(KEY, now=0)
+
+    version = damper.version
+    flap(damper, now=0)
+    assert damper.is_suppressed(KEY, now=0)
+    assert damper.version > version
+
+    # one half-life later the penalty has decayed to 1000, still above reuse
+    assert damper.penalty(KEY, now=60) == pytest.approx(1000)
+    assert damper.is_suppressed(KEY, now=60)
+
+    # a second half-life brings it to 500, below reuse
+    version = damper.version
+    assert damper.release_reusable(now=120) == [KEY]
+    assert damper.version > version
+    assert not damper.is_suppressed(KEY, now=120)
+
+
+def test_damping_max_penalty(damper):
+    damper.update(KEY, RouteStatus.UP, now=0)
+    for _ in range(100):
+        flap(damper, now=0)
+
+    assert damper.penalty(KEY, now=0) == damper.max_penalty
+    assert damper.is_suppressed(KEY, now=0)
+    assert not damper.is_suppressed(KEY, now=damper.max_suppress_time + 1)
+
+
+def test_damping_disabled():
+    damper = FlapDamper()
+    damper.update(KEY, RouteStatus.UP, now=0)
+    for _ in range(10):
+        flap(damper, now=0)
+
+    assert not damper.is_suppressed(KEY, now=0)
+    assert list(damper.unsuppressed([1, 2, 3])) == [1, 2, 3]
+
+
+def test_damping_history_decays(damper):
+    damper.update(KEY, RouteStatus.UP, now=0)
+    flap(damper, now=0)
+    assert damper.release_reusable(now=60) == []
+    assert damper.as_json[0]["flaps"] == 1
+
+    # below half the reuse threshold, the flaps are forgotten, but not the route
+    damper.release_reusable(now=120)
+    assert damper.penalty(KEY, now=120) == 0
+    assert damper.as_json == []
+    assert not damper.update(KEY, RouteStatus.UP, now=120)
+
+
+def test_damping_discard(damper):
+    other = ("10.1.0.0/16", "1.1.1.1")
+    damper.update(other, RouteStatus.UP, now=0)
+    damper.discard(other, now=0)
+    # never penalized, so it goes straight away
+    assert damper.update(other, RouteStatus.UP, now=0)
+
+    damper.update(KEY, RouteStatus.UP, now=0)
+    flap(damper, now=0)
+    damper.update(KEY, RouteStatus.DOWN, now=0)
+    damper.discard(KEY, now=0)
+    # a withdrawn route is remembered while its penalty matters, then dropped
+    assert damper.penalty(KEY, now=0) == 2000
+    damper.release_reusable(now=100)
+    assert damper.penalty(KEY, now=100) > 375
+    damper.release_reusable(now=200)
+    assert damper.penalty(KEY, now=200) == 0
+    assert damper._states == {other: damper._states[other]}
+
+
+def test_damping_current_version(damper):
+    damper.update(KEY, RouteStatus.UP, now=0)
+    assert damper.next_reuse() is None
+    flap(damper, now=0)
+    flap(damper, now=0)
+    # 2000 takes a half-life and a log2(1000 / 750) more to decay to 750
+    assert damper.next_reuse() == pytest.approx(60 + 60 * 0.415, abs=0.1)
+    version = damper.current_version(now=0)
+    assert damper.current_version(now=80) == version
+    # past reuse the version has moved on without anything being released, and agrees once it is
+    reusable = damper.current_version(now=90)
+    assert reusable > version
+    assert damper.is_suppressed(KEY, now=0)
+    assert damper.release_reusable(now=120) == [KEY]
+    assert damper.current_version(now=120) == reusable
+    assert damper.next_reuse() is None
@@ -1,6 +1,28 @@
+import socket
+from ipaddress import ip_address, ip_network
+
+import dpkt
 import pytest
 
-from src.fp_interface.main import ForwardingPlane
+from src.fp_interface.interfaces import (
+    IFADDRMSG,
+    IFA_BROADCAST,
+    IFA_LOCAL,
+    NLMSG_DONE,
+    NLMSG_HEADER,
+    RTATTR,
+    RTM_NEWADDR,
+    InterfaceAddress,
+    InterfaceManager,
+    parse_addresses,
+)
+from src.fp_interface.main import ForwardingPlane, _c_buffer, send_datagrams
+
+ADDRESSES = [
+    InterfaceAddress("lo", 1, ip_address("127.0.0.1"), ip_network("127.0.0.0/8")),
+    InterfaceAddress("eth0", 2, ip_address("10.1.0.5"), ip_network("10.1.0.0/16"), ip_address("10.1.255.255")),
+    InterfaceAddress("eth1", 3, ip_address("10.1.2.1"), ip_network("10.1.2.0/24"), ip_address("10.1.2.255")),
+]
 
 
 @pytest.fixture
@@ -12,18 +34,123 @@ def mock_socket(mocker):
 @pytest.fixture
 def fp(mocker, mock_socket):
     mock_socket_lib = mocker.Mock(name="socketLib", return_value=mock_socket)
-    fp = ForwardingPlane(sock=mock_socket_lib)
+    fp = ForwardingPlane(sock=mock_socket_lib, interfaces=InterfaceManager(ADDRESSES))
     return fp
 
 
+def echo_replies(mock_socket, *, skip: int = 0):
+    """echo_replies will answer each echo request sent on mock_socket, after skip packets that aren't replies to it"""
+
+    def recvfrom(size):
+        for _ in range(skip):
+            yield bytes(dpkt.ip.IP(p=dpkt.ip.IP_PROTO_ICMP, data=dpkt.icmp.ICMP(type=dpkt.icmp.ICMP_ECHO))), ("9.9.9.9", 0)
+        for call in mock_socket.sendto.call_args_list:
+            data, (host, _) = call.args
+            request = dpkt.icmp.ICMP(data)
+            reply = dpkt.icmp.ICMP(type=dpkt.icmp.ICMP_ECHOREPLY, data=request.data)
+            yield bytes(dpkt.ip.IP(p=dpkt.ip.IP_PROTO_ICMP, data=reply)), (host, 0)
+        raise TimeoutError
+
+    replies = None
+
+    def side_effect(size):
+        nonlocal replies
+        if replies is None:
+            replies = recvfrom(size)
+        return next(replies)
+
+    mock_socket.recvfrom.side_effect = side_effect
+
+
 def test_fp_ping(fp, mock_socket):
+    echo_replies(mock_socket, skip=2)
     rtt = fp.ping("8.8.8.8")
-    mock_socket.connect.assert_called_once_with(("8.8.8.8", 1))
-    mock_socket.send.assert_called_once()
-    mock_socket.recv.assert_called_once()
+    assert rtt >= 0
+    mock_socket.sendto.assert_called_once()
+    assert mock_socket.sendto.call_args.args[1] == ("8.8.8.8", 1)
+    assert mock_socket.recvfrom.call_count == 3
 
 
 def test_fp_ping_no_response(fp, mock_socket):
-    mock_socket.recv.side_effect = TimeoutError
+    mock_socket.recvfrom.side_effect = TimeoutError
     with pytest.raises(TimeoutError):
         rtt = fp.ping("169.254.255.254")
+
+
+def test_fp_ping_many(fp, mock_socket, mocker):
+    echo_replies(mock_socket)
+    rtts = fp.ping_many(["1.1.1.1", "1.1.1.2", "1.1.1.1"])
+    assert set(rtts) == {"1.1.1.1", "1.1.1.2"}
+    assert all(rtt is not None for rtt in rtts.values())
+    # the socket is opened once, and kept for the next probes
+    fp.ping("1.1.1.3")
+    fp._sock.assert_called_once()
+    fp.close()
+    mock_socket.close.assert_called_once()
+
+
+def test_fp_send_udp_batch(fp, mock_socket):
+    src_port = fp.send_udp_batch([b"one", memoryview(b"two")], "10.0.0.255", 520, 520)
+    assert src_port == 520
+    sent = [(dpkt.udp.UDP(call.args[0]), call.args[1]) for call in mock_socket.sendto.call_args_list]
+    assert [(udp.sport, udp.dport, udp.ulen, udp.data, address) for udp, address in sent] == [
+        (520, 520, 11, b"one", ("10.0.0.255", 520)),
+        (520, 520, 11, b"two", ("10.0.0.255", 520)),
+    ]
+    fp.send_udp(b"three", "10.0.0.255", 520)
+    fp._sock.assert_called_once()
+
+
+def test_fp_c_buffer():
+    data = bytearray(b"header+payload")
+    # a writable view is shared rather than copied, a read-only one is copied
+    buffer = _c_buffer(memoryview(data)[7:])
+    data[7:] = b"PAYLOAD"
+    assert buffer.raw == b"PAYLOAD"
+    assert _c_buffer(memoryview(b"payload")).raw == b"payload"
+
+
+def test_fp_send_datagrams_none_sent(mocker):
+    # a system call that sends nothing is an error, rather than something to keep retrying
+    mocker.patch("src.fp_interface.main._sendmmsg", return_value=0)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        with pytest.raises(OSError):
+            send_datagrams(sock, [(b"data", ("127.0.0.1", 9))])
+
+
+def netlink_address(index: int, address: str, prefixlen: int, broadcast: str) -> bytes:
+    attrs = b""
+    for attr_type, value in ((IFA_LOCAL, address), (IFA_BROADCAST, broadcast)):
+        attrs += RTATTR.pack(RTATTR.size + 4, attr_type) + socket.inet_aton(value)
+    body = IFADDRMSG.pack(socket.AF_INET, prefixlen, 0, 0, index) + attrs
+    return NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), RTM_NEWADDR, 0, 1, 0) + body
+
+
+def test_interface_addresses():
+    dump = netlink_address(999, "10.1.0.5", 16, "10.1.255.255") + NLMSG_HEADER.pack(NLMSG_HEADER.size, NLMSG_DONE, 0, 1, 0)
+    addresses, done = parse_addresses(dump)
+    assert done
+    assert [(a.index, a.address, a.network, a.broadcast) for a in addresses] == [
+        (999, ip_address("10.1.0.5"), ip_network("10.1.0.0/16"), ip_address("10.1.255.255"))
+    ]
+
+    interfaces = InterfaceManager(ADDRESSES)
+    assert interfaces.is_local("10.1.2.1")
+    assert not interfaces.is_local("10.1.2.2")
+    # the longest match wins, and a broadcast address belongs to its network
+    assert interfaces.interface_for("10.1.2.9") == "eth1"
+    assert interfaces.interface_for("10.1.3.9") == "eth0"
+    assert interfaces.interface_for("10.1.2.255") == "eth1"
+    assert interfaces.interface_for("8.8.8.8") is None
+    assert interfaces.address_for("127.0.0.2").address == ip_address("127.0.0.1")
+
+
+def test_fp_interface_selection(fp, mock_socket):
+    echo_replies(mock_socket)
+    rtts = fp.ping_many(["10.1.2.9", "10.1.3.9", "8.8.8.8"])
+    assert all(rtt is not None for rtt in rtts.values())
+    fp.send_udp(b"update", "10.1.2.255", 520, 520)
+
+    bound = [call.args[2] for call in mock_socket.setsockopt.call_args_list if call.args[1] == socket.SO_BINDTODEVICE]
+    assert sorted(bound) == [b"eth0", b"eth1", b"eth1"]
+    assert fp.get_local_ip() == "10.1.0.5"
@@ -0,0 +1,52 @@
+from src.generic.metrics import Registry, Counter, Gauge, Histogram
+
+
+def test_metrics_render():
+    registry = Registry()
+    counter = Counter("test_total", "a counter", ["kind"], registry=registry)
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+    gauge = Gauge("test_size", "a gauge", registry=registry)
+    gauge.set_function(lambda: 7)
+    histogram = Histogram(
+        "test_seconds", "a histogram", buckets=(0.1, 1), registry=registry
+    )
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_total counter" in lines
+    assert 'test_total{kind="a"} 3' in lines
+    assert "test_size 7" in lines
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1"} 2' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_seconds_count 3" in lines
+    assert "test_seconds_sum 5.55" in lines
+
+
+def test_metrics_snapshot():
+    registry = Registry()
+    counter = Counter("test_total", "a counter", ["kind"], registry=registry)
+    counter.labels("a").inc(3)
+    gauge = Gauge("test_size", "a gauge", ["table"], registry=registry)
+    gauge.set_function(lambda: {("rib",): 7})
+    histogram = Histogram(
+        "test_seconds", "a histogram", buckets=(0.1, 1), registry=registry
+    )
+    histogram.observe(0.05)
+    histogram.observe(5)
+
+    snapshot = registry.snapshot()
+    assert snapshot["test_total"] == {
+        "type": "counter",
+        "samples": [{"labels": {"kind": "a"}, "value": 3}],
+        "bounds": None,
+    }
+    assert snapshot["test_size"]["samples"] == [{"labels": {"table": "rib"}, "value": 7}]
+    assert snapshot["test_seconds"] == {
+        "type": "histogram",
+        "samples": [{"labels": {}, "count": 2, "sum": 5.05, "buckets": [1, 0, 1]}],
+        "bounds": [0.1, 1],
+    }
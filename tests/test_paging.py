@@ -0,0 +1,92 @@
+import asyncio
+from ipaddress import ip_address, ip_network
+
+from fastapi import Depends, FastAPI, Request, Response
+
+from src.control_plane.route import CP_RIB
+from src.generic.batch import call_app
+from src.generic.paging import RouteQuery
+from src.system import SourceCode
+
+app = FastAPI()
+rib = CP_RIB()
+for i in range(100):
+    rib.add(
+        {
+            "prefix": ip_network(f"10.{i}.0.0/16"),
+            "next_hop": ip_address("1.1.1.1" if i % 10 else "2.2.2.2"),
+            "route_source": SourceCode.STATIC,
+            "admin_distance": 1,
+        }
+    )
+
+
+@app.get("/routes")
+async def get_routes(request: Request, response: Response, query: RouteQuery = Depends()):
+    return query.respond(request, response, rib)
+
+
+@app.get("/routes/scanned")
+async def get_scanned_routes(request: Request, response: Response, query: RouteQuery = Depends()):
+    return query.respond(request, response, rib.items)
+
+
+def _get(path, **params):
+    return asyncio.run(call_app(app, {"method": "GET", "path": path, "params": params}))
+
+
+def _pages(path, **params):
+    prefixes, cursor = [], None
+    while True:
+        rslt = _get(path, cursor=cursor, **params)
+        assert rslt["status"] == 200
+        prefixes.extend(route["prefix"] for route in rslt["body"]["routes"])
+        cursor = rslt["body"]["next_cursor"]
+        if cursor is None:
+            return prefixes
+
+
+def test_pagination():
+    everything = _get("/routes")["body"]
+    assert [route["prefix"] for route in everything] == [f"10.{i}.0.0/16" for i in range(100)]
+
+    for path in ("/routes", "/routes/scanned"):
+        assert _pages(path, limit=7) == [f"10.{i}.0.0/16" for i in range(100)]
+        # 10 routes via 2.2.2.2 is sparse enough to be served from the next hop index
+        assert _pages(path, limit=3, next_hop="2.2.2.2") == [
+            f"10.{i}.0.0/16" for i in range(0, 100, 10)
+        ]
+        assert _pages(path, limit=1, prefix="10.42.1.1", match="lpm") == ["10.42.0.0/16"]
+
+
+def test_pagination_errors():
+    assert _get("/routes", cursor="not a cursor")["status"] == 400
+    assert _get("/routes", prefix="not a prefix")["status"] == 422
+    assert _get("/routes", limit=0)["status"] == 422
+    assert _get("/routes", source="EIGRP")["status"] == 422
+
+
+def test_pagination_start():
+    for path in ("/routes", "/routes/scanned"):
+        # starting at a prefix that isn't in the table starts at the next one that is
+        assert _pages(path, limit=7, start="10.42.0.0/16") == [f"10.{i}.0.0/16" for i in range(42, 100)]
+        assert _pages(path, limit=7, start="10.42.1.1") == [f"10.{i}.0.0/16" for i in range(43, 100)]
+        assert _pages(path, limit=7, start="11.0.0.0") == []
+    assert _get("/routes", start="not a prefix")["status"] == 422
+
+
+def test_listing_etag():
+    def request(accept: str) -> Request:
+        return Request({"type": "http", "headers": [(b"accept", accept.encode())], "query_string": b""})
+
+    query = RouteQuery(limit=None)
+    json_etag = query.etag(request("application/json"), rib.version)
+    ndjson_etag = query.etag(request("application/x-ndjson"), rib.version)
+    # the same table as JSON and as NDJSON are different bodies, so a 304 for one mustn't stand for the other
+    assert json_etag != ndjson_etag
+
+    response = Response()
+    query.respond(request("application/json"), response, rib, json_etag)
+    assert (response.headers["ETag"], response.headers["Vary"]) == (json_etag, "Accept")
+    streamed = query.respond(request("application/x-ndjson"), Response(), rib, ndjson_etag)
+    assert (streamed.headers["ETag"], streamed.headers["Vary"]) == (ndjson_etag, "Accept")
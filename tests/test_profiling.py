@@ -0,0 +1,34 @@
+import marshal
+import time
+
+from src.generic.profiling import StackSampler, Profiler
+
+
+def busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_stack_sampler():
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    busy(0.1)
+    sampler.stop()
+
+    assert not sampler.running
+    assert sampler.samples > 0
+    lines = sampler.collapsed().splitlines()
+    assert any("busy (test_profiling.py" in line for line in lines)
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+
+
+def test_cprofile_window():
+    profiler = Profiler()
+    profiler.start_cprofile()
+    busy(0.01)
+    profiler.stop_cprofile()
+
+    stats = marshal.loads(profiler.cprofile_pstats())
+    assert any(function == "busy" for _, _, function in stats)
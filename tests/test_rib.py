@@ -2,7 +2,13 @@ from ipaddress import ip_network, ip_address
 
 import pytest
 from src.system import RouteStatus, SourceCode
-from generic.rib import RIBRouteEntry, RIB, Route
+from generic.rib import (
+    RIBRouteEntry,
+    RIB,
+    Route,
+    select_best_paths,
+    flatten_best_paths,
+)
 
 
 @pytest.fixture
@@ -38,3 +44,259 @@ def test_rib(default_route: Route):
     assert not rib._rib_entry_in_routes(rib_route_entry)
     assert not rib._rib_entry_in_next_hops(rib_route_entry)
     assert not rib._rib_entry_in_sources(rib_route_entry)
+
+
+def test_select_best_paths():
+    routes = [
+        Route(ip_network("10.0.0.0/8"), ip_address("1.1.1.2")),
+        Route(ip_network("10.0.0.0/8"), ip_address("1.1.1.1")),
+        Route(ip_network("10.0.0.0/8"), ip_address("1.1.1.3")),
+        Route(ip_network("0.0.0.0/0"), ip_address("1.1.1.9")),
+    ]
+    costs = {
+        ip_address("1.1.1.1"): 5,
+        ip_address("1.1.1.2"): 5,
+        ip_address("1.1.1.3"): 1,
+        ip_address("1.1.1.9"): 1,
+    }
+    best_paths = select_best_paths(routes, key=lambda route: costs[route.next_hop])
+    assert best_paths[ip_network("10.0.0.0/8")] == [routes[2]]
+
+    costs[ip_address("1.1.1.3")] = 5
+    best_paths = select_best_paths(
+        routes, key=lambda route: costs[route.next_hop], max_paths=2
+    )
+    assert best_paths[ip_network("10.0.0.0/8")] == [routes[1], routes[0]]
+    assert flatten_best_paths(best_paths) == [routes[3], routes[1], routes[0]]
+
+
+def test_rib_version():
+    from src.control_plane.route import CP_RIB
+
+    rib = CP_RIB()
+    assert rib.version == 0
+    route = {
+        "prefix": "10.0.0.0/8",
+        "next_hop": "1.1.1.1",
+        "route_source": SourceCode.STATIC,
+        "admin_distance": 1,
+    }
+    rib.add(route)
+    added = rib.version
+    assert added > 0
+
+    rib.remove(route)
+    assert rib.version > added
+
+    # a rebuilt RIB never goes back to a version an older RIB already used
+    rebuilt = CP_RIB()
+    rebuilt.import_routes([route])
+    assert rebuilt.version > rib.version
+
+    # importing routes that are already there, or rebuilding the same table, keeps the version
+    version = rebuilt.version
+    rebuilt.import_routes([route])
+    assert rebuilt.version == version
+    again = CP_RIB()
+    again.import_routes([route])
+    again.continue_from(rebuilt)
+    assert again.version == version
+
+
+@pytest.fixture
+def cp_rib():
+    from src.control_plane.route import CP_RIB
+
+    rib = CP_RIB()
+    for prefix, next_hop, source in [
+        ("10.0.0.0/8", "1.1.1.2", SourceCode.STATIC),
+        ("10.0.0.0/8", "1.1.1.1", SourceCode.RIP1),
+        ("10.1.0.0/16", "1.1.1.1", SourceCode.RIP1),
+        ("10.1.2.0/24", "2.2.2.2", SourceCode.SLA),
+        ("11.0.0.0/8", "1.1.1.1", SourceCode.STATIC),
+        ("9.0.0.0/8", "2.2.2.2", SourceCode.RIP1),
+    ]:
+        rib.add(
+            {
+                "prefix": ip_network(prefix),
+                "next_hop": ip_address(next_hop),
+                "route_source": source,
+                "admin_distance": 1,
+            }
+        )
+    return rib
+
+
+def _listed(routes):
+    return [(str(r.prefix), str(r.next_hop)) for r in routes]
+
+
+def test_rib_select(cp_rib):
+    from src.generic.rib import RouteFilter
+
+    assert _listed(cp_rib.select()) == [
+        ("9.0.0.0/8", "2.2.2.2"),
+        ("10.0.0.0/8", "1.1.1.1"),
+        ("10.0.0.0/8", "1.1.1.2"),
+        ("10.1.0.0/16", "1.1.1.1"),
+        ("10.1.2.0/24", "2.2.2.2"),
+        ("11.0.0.0/8", "1.1.1.1"),
+    ]
+
+    cases = {
+        RouteFilter("10.0.0.0/8"): [("10.0.0.0/8", "1.1.1.1"), ("10.0.0.0/8", "1.1.1.2")],
+        RouteFilter("10.1.0.0/16", "longer"): [("10.1.0.0/16", "1.1.1.1"), ("10.1.2.0/24", "2.2.2.2")],
+        RouteFilter("10.1.2.3", "lpm"): [("10.1.2.0/24", "2.2.2.2")],
+        # the longest match among the routes that meet the other conditions
+        RouteFilter("10.1.2.3", "lpm", next_hop="1.1.1.1"): [("10.1.0.0/16", "1.1.1.1")],
+        RouteFilter("12.0.0.1", "lpm"): [],
+        RouteFilter(next_hop="2.2.2.2"): [("9.0.0.0/8", "2.2.2.2"), ("10.1.2.0/24", "2.2.2.2")],
+        RouteFilter(source="STATIC"): [("10.0.0.0/8", "1.1.1.2"), ("11.0.0.0/8", "1.1.1.1")],
+        RouteFilter(source=SourceCode.RIP1, status="up"): [
+            ("9.0.0.0/8", "2.2.2.2"),
+            ("10.0.0.0/8", "1.1.1.1"),
+            ("10.1.0.0/16", "1.1.1.1"),
+        ],
+        RouteFilter(status="down"): [],
+    }
+    for route_filter, expected in cases.items():
+        assert _listed(cp_rib.select(route_filter)) == expected
+        # the scan gives the same answer as the index
+        assert _listed(route_filter.select(cp_rib.items)) == expected
+
+    with pytest.raises(ValueError):
+        RouteFilter("10.0.0.0/8", "shorter")
+
+
+def test_rib_select_after(cp_rib):
+    from src.generic.rib import route_order
+
+    listed = list(cp_rib.select())
+    for i, route in enumerate(listed):
+        assert list(cp_rib.select(after=route_order(route))) == listed[i + 1:]
+
+    # a removed route still marks its place
+    cp_rib.remove(listed[2])
+    assert list(cp_rib.select(after=route_order(listed[2]))) == listed[3:]
+
+    cp_rib.add(
+        {
+            "prefix": ip_network("10.0.0.0/9"),
+            "next_hop": ip_address("3.3.3.3"),
+            "route_source": SourceCode.STATIC,
+            "admin_distance": 1,
+        }
+    )
+    assert _listed(cp_rib.select(after=route_order(listed[2])))[0] == ("10.0.0.0/9", "3.3.3.3")
+
+
+def test_rib_index_replaced_route():
+    from src.rp_rip1.main import RIP1_RIB, RIP1_Route
+    from src.generic.rib import RouteFilter
+
+    rib = RIP1_RIB()
+    prefix, next_hop = ip_network("10.0.0.0/8"), ip_address("1.1.1.1")
+    rib.add(RIP1_Route(prefix, next_hop, 1, route_source=SourceCode.STATIC))
+    # the same route (prefix and next hop), learned from another source, replaces it
+    rib.add(RIP1_Route(prefix, next_hop, 2, route_source=SourceCode.RIP1))
+
+    assert list(rib.select(RouteFilter(source=SourceCode.STATIC))) == []
+    assert [r.metric for r in rib.select(RouteFilter(source=SourceCode.RIP1))] == [2]
+
+    rib.remove(RIP1_Route(prefix, next_hop, 2))
+    assert list(rib.select()) == []
+    assert rib._index.prefixes == rib._index.next_hops == rib._index.sources == {}
+
+
+def _changes(rib, since):
+    changes, position = rib.changes_since(*since)
+    return [(op, str(r.prefix), str(r.next_hop)) for op, r in changes], (rib.lineage, position)
+
+
+def test_rib_changes_since(cp_rib):
+    since = cp_rib.lineage, cp_rib.changes_total
+    assert _changes(cp_rib, since)[0] == []
+
+    listed = list(cp_rib.select())
+    cp_rib.remove(listed[0])
+    added = {
+        "prefix": ip_network("12.0.0.0/8"),
+        "next_hop": ip_address("3.3.3.3"),
+        "route_source": SourceCode.STATIC,
+        "admin_distance": 1,
+    }
+    cp_rib.add(added)
+    cp_rib.touch(listed[1])
+    cp_rib.touch(listed[1])
+    changes, since = _changes(cp_rib, since)
+    assert changes == [
+        ("remove", "9.0.0.0/8", "2.2.2.2"),
+        ("add", "12.0.0.0/8", "3.3.3.3"),
+        ("update", "10.0.0.0/8", "1.1.1.1"),
+    ]
+
+    # added and then removed since, so there's nothing to report
+    cp_rib.add({**added, "prefix": ip_network("13.0.0.0/8")})
+    cp_rib.remove(list(cp_rib.select())[-1])
+    assert _changes(cp_rib, since)[0] == []
+
+    # another RIB's position, or one the log no longer goes back to
+    assert cp_rib.changes_since(cp_rib.lineage + 1, 0) is None
+    assert cp_rib.changes_since(cp_rib.lineage, cp_rib.changes_total + 1) is None
+    cp_rib._changes.popleft()
+    assert cp_rib.changes_since(cp_rib.lineage, 0) is None
+
+
+def test_rib_continue_from(cp_rib):
+    from src.control_plane.route import CP_RIB
+
+    since = cp_rib.lineage, cp_rib.changes_total
+    rebuilt = CP_RIB()
+    for route in list(cp_rib.select())[1:]:
+        if str(route.prefix) == "11.0.0.0/8":
+            route = {
+                "prefix": route.prefix,
+                "next_hop": route.next_hop,
+                "route_source": route.route_source,
+                "admin_distance": 5,
+            }
+        rebuilt.add(route)
+    rebuilt.add(
+        {
+            "prefix": ip_network("12.0.0.0/8"),
+            "next_hop": ip_address("3.3.3.3"),
+            "route_source": SourceCode.STATIC,
+            "admin_distance": 1,
+        }
+    )
+    rebuilt.continue_from(cp_rib)
+
+    assert rebuilt.lineage == since[0]
+    changes, _ = _changes(rebuilt, since)
+    assert sorted(changes) == [
+        ("add", "12.0.0.0/8", "3.3.3.3"),
+        ("remove", "9.0.0.0/8", "2.2.2.2"),
+        ("update", "11.0.0.0/8", "1.1.1.1"),
+    ]
+
+    # the replaced RIB gives up its log: changes to it don't reach the new one, and it no longer answers for it
+    position = rebuilt.changes_total
+    cp_rib.remove(next(iter(cp_rib.select())))
+    assert rebuilt.changes_total == position
+    assert rebuilt.changes_since(since[0], position) == ([], position)
+    assert cp_rib.changes_since(*since) is None
+
+
+def test_best_paths_in_order(cp_rib):
+    # routes from a RIB's select are already in prefix order, so selecting from them needs no sorting
+    best_paths = select_best_paths(cp_rib.select(), key=lambda route: route.admin_distance, max_paths=2)
+    in_order = flatten_best_paths(best_paths, in_order=True)
+    assert in_order == flatten_best_paths(best_paths)
+    assert _listed(in_order) == [
+        ("9.0.0.0/8", "2.2.2.2"),
+        ("10.0.0.0/8", "1.1.1.1"),
+        ("10.0.0.0/8", "1.1.1.2"),
+        ("10.1.0.0/16", "1.1.1.1"),
+        ("10.1.2.0/24", "2.2.2.2"),
+        ("11.0.0.0/8", "1.1.1.1"),
+    ]
@@ -0,0 +1,345 @@
+import asyncio
+from ipaddress import ip_network, ip_address
+
+import dpkt
+import pytest
+
+from src.config import Config
+from src.rp_rip1.codec import (
+    RIP_HEADER,
+    RIP_RTE,
+    RIP1_Advertisement,
+    RIP_Command,
+    classful_network,
+    decode,
+    encode_request,
+)
+from src.rp_rip1.main import (
+    RIP1_Route,
+    RP_RIP1,
+    RP_RIP1_Interface,
+    RIP_MAX_METRIC,
+    RIP_MAX_RTES,
+    RIP_ROUTE_GARBAGE_TIMEOUT,
+    RIP_ROUTE_TIMEOUT,
+)
+from src.system import RouteStatus
+
+
+@pytest.fixture
+def mock_fp(mocker):
+    mock_fp = mocker.Mock(name="fp")
+    mock_fp.sent = []
+    # packets are views of a reused buffer, so they're copied as they're sent
+    mock_fp.send_udp.side_effect = lambda data, *args: mock_fp.sent.append(bytes(data))
+    mock_fp.batches = []
+
+    def send_udp_batch(datagrams, dst_ip, dst_port, src_port=None, interface=None):
+        # datagrams may be a generator of those views, which is only good while the call is made
+        packets = [bytes(data) for data in datagrams]
+        mock_fp.sent.extend(packets)
+        mock_fp.batches.append((dst_ip, interface, packets))
+
+    mock_fp.send_udp_batch.side_effect = send_udp_batch
+    return mock_fp
+
+
+def rip_interface(fp, routes: int, **kwargs) -> RP_RIP1_Interface:
+    rp = RP_RIP1_Interface(fp, **kwargs)
+    for i in range(routes):
+        route = RIP1_Route(ip_network(f"10.{i // 256}.{i % 256}.0/24"), ip_address("1.1.1.1"), 1 + i % 3)
+        route.status = RouteStatus.UP
+        rp.rib.add(route)
+    return rp
+
+
+def test_rip_response_packets(mock_fp):
+    rp = rip_interface(mock_fp, 1010, response_pacing_ms=0)
+    sent = asyncio.run(rp.send_response())
+
+    assert sent == len(mock_fp.sent) == 41
+    rtes = []
+    for data in mock_fp.sent:
+        assert len(data) <= 512
+        packet = dpkt.rip.RIP(data)
+        assert (packet.cmd, packet.v) == (dpkt.rip.RESPONSE, 1)
+        assert len(packet.rtes) <= RIP_MAX_RTES
+        rtes.extend(packet.rtes)
+
+    assert len(mock_fp.sent[-1]) == 4 + 10 * 20
+    assert {(rte.family, rte.addr, rte.next_hop, rte.metric) for rte in rtes} == {
+        (2, int(route.prefix.network_address), 0, route.metric + 1) for route in rp.export_routes()
+    }
+
+
+def test_rip_response_empty(mock_fp):
+    rp = rip_interface(mock_fp, 0)
+    assert asyncio.run(rp.send_response()) == 0
+    mock_fp.send_udp_batch.assert_not_called()
+
+
+def test_rip_response_pacing(mock_fp):
+    rp = rip_interface(mock_fp, 0, response_pacing_ms=10, advertisement_interval=30)
+    assert rp.response_packet_gap(100) == 0.01
+    # 10k routes is 400 packets, 4s at 10ms apart: well within a 30s interval, but not within half of a 5s one
+    assert rp.response_packet_gap(10000) == 0.01
+    rp.advertisement_interval = 5
+    assert rp.response_packet_gap(10000) == pytest.approx(2.5 / 400)
+
+
+def test_rip_response_paced(mock_fp):
+    rp = rip_interface(mock_fp, 100, response_pacing_ms=1)
+    # 4 packets, packed into the same buffer one after another, each sent on its own with a pause after it
+    assert asyncio.run(rp._rp.send_response(routes=rp.export_routes())) == 4
+    assert mock_fp.send_udp_batch.call_count == 4
+    assert len(mock_fp.sent) == 4
+    assert len({data[4:24] for data in mock_fp.sent}) == 4
+
+    # two paced responses going out at once each pack their own packets
+    mock_fp.sent.clear()
+    routes = rp.export_routes()
+
+    async def send_both():
+        return await asyncio.gather(rp._rp.send_response(routes=routes[:50]), rp._rp.send_response(routes=routes[50:]))
+
+    assert asyncio.run(send_both()) == [2, 2]
+    assert set(sent_rtes(mock_fp)) == {int(route.prefix.network_address) for route in routes}
+
+
+def sent_rtes(fp) -> dict[int, int]:
+    return {rte.addr: rte.metric for data in fp.sent for rte in dpkt.rip.RIP(data).rtes}
+
+
+def test_rip_triggered_update(mock_fp):
+    rp = rip_interface(mock_fp, 100, response_pacing_ms=0)
+    asyncio.run(rp.send_response())
+    mock_fp.sent.clear()
+    # nothing changed, nothing to send
+    assert asyncio.run(rp.send_triggered_update()) == 0
+
+    routes = {route.prefix: route for route in rp.rib.items}
+    gone = routes[ip_network("10.0.1.0/24")]
+    rp.rib.remove(gone)
+    worse = routes[ip_network("10.0.2.0/24")]
+    rp.rib.remove(worse)
+    worse = RIP1_Route(worse.prefix, worse.next_hop, worse.metric + 1)
+    worse.status = RouteStatus.UP
+    rp.rib.add(worse)
+    new = RIP1_Route(ip_network("192.168.0.0/24"), ip_address("1.1.1.1"), 2)
+    new.status = RouteStatus.UP
+    rp.rib.add(new)
+
+    assert asyncio.run(rp.send_triggered_update()) == 1
+    assert sent_rtes(mock_fp) == {
+        int(gone.prefix.network_address): RIP_MAX_METRIC,
+        int(worse.prefix.network_address): worse.metric + 1,
+        int(new.prefix.network_address): new.metric + 1,
+    }
+
+    # the changes have been advertised, so they aren't sent again
+    mock_fp.sent.clear()
+    assert asyncio.run(rp.send_triggered_update()) == 0
+
+
+def test_rip_triggered_update_suppressed(mock_fp):
+    rp = rip_interface(mock_fp, 10, response_pacing_ms=0)
+
+    async def run():
+        task = asyncio.create_task(rp.run_triggered_updates())
+        # a regular update is due within the holdoff, so it carries the change instead
+        rp._advertisement_timer.next_due = asyncio.get_running_loop().time() + 0.5
+        rp._triggered_update.set()
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(run())
+    mock_fp.send_udp_batch.assert_not_called()
+
+
+def test_rip_route_timers(mock_fp):
+    rp = rip_interface(mock_fp, 0)
+    routes = [RIP1_Route(ip_network(f"10.0.{i}.0/24"), ip_address("1.1.1.1"), 1) for i in range(3)]
+    for route in routes:
+        route.status = RouteStatus.UP
+        rp.learn_route(route)
+    start = routes[0].last_updated
+
+    assert rp.expire_routes(start + RIP_ROUTE_TIMEOUT - 1) == (False, False)
+    # an update restarts the timeout
+    refreshed = RIP1_Route(routes[1].prefix, routes[1].next_hop, 2)
+    refreshed.last_updated = start + 60
+    rp.learn_route(refreshed)
+
+    assert rp.expire_routes(start + RIP_ROUTE_TIMEOUT + 1) == (True, True)
+    down = {route.prefix for route in rp._learned_routes.items if route.metric == RIP_MAX_METRIC}
+    assert down == {routes[0].prefix, routes[2].prefix}
+
+    assert rp.expire_routes(start + RIP_ROUTE_GARBAGE_TIMEOUT + 1) == (True, True)
+    assert [route.prefix for route in rp._learned_routes.items] == [refreshed.prefix]
+    assert rp.expire_routes(start + 60 + RIP_ROUTE_GARBAGE_TIMEOUT + 1) == (True, True)
+    assert len(rp._learned_routes) == 0
+    assert len(rp._route_timers) == 0
+
+
+def test_rip_codec_decode():
+    rip = dpkt.rip.RIP(cmd=dpkt.rip.RESPONSE, v=1, auth=None)
+    rip.rtes = [
+        dpkt.rip.RTE(family=2, addr=int(ip_address("10.1.2.3")), next_hop=0, metric=2),
+        dpkt.rip.RTE(family=2, addr=int(ip_address("172.16.5.0")), next_hop=int(ip_address("2.2.2.2")), metric=16),
+        dpkt.rip.RTE(family=2, addr=int(ip_address("224.0.0.9")), next_hop=0, metric=1),
+        dpkt.rip.RTE(family=0, addr=int(ip_address("192.168.1.1")), next_hop=0, metric=1),
+    ]
+    # a truncated entry at the end is ignored
+    packet = decode(bytes(rip) + b"\x00\x02")
+    assert (packet.cmd, packet.version, len(packet.rtes)) == (dpkt.rip.RESPONSE, 1, 4)
+    assert packet.rtes[0] == (2, int(ip_address("10.1.2.3")), 0, 2)
+
+    routes = RP_RIP1.handle_response(packet.rtes, ("3.3.3.3", 520))
+    assert [(str(r.prefix), str(r.next_hop), r.metric, r.status) for r in routes] == [
+        ("10.0.0.0/8", "3.3.3.3", 2, RouteStatus.UP),
+        ("172.16.0.0/16", "2.2.2.2", 16, RouteStatus.DOWN),
+    ]
+
+    with pytest.raises(ValueError):
+        decode(b"\x02")
+
+
+def test_rip_codec_classful():
+    assert classful_network(int(ip_address("10.1.2.3"))) == (int(ip_address("10.0.0.0")), 8)
+    assert classful_network(int(ip_address("191.255.1.1"))) == (int(ip_address("191.255.0.0")), 16)
+    assert classful_network(int(ip_address("223.1.2.3"))) == (int(ip_address("223.1.2.0")), 24)
+    assert classful_network(int(ip_address("240.0.0.1"))) is None
+
+
+def test_rip_codec_request():
+    rip = dpkt.rip.RIP(encode_request())
+    assert (rip.cmd, rip.v) == (dpkt.rip.REQUEST, 1)
+    assert [(rte.family, rte.addr, rte.metric) for rte in rip.rtes] == [(0, 0, 16)]
+
+
+def test_rip_advertisement():
+    advertisement = RIP1_Advertisement()
+    routes = [RIP1_Route(ip_network(f"10.{i}.0.0/16"), ip_address("1.1.1.1"), 1) for i in range(60)]
+    for route in routes:
+        advertisement.set(route)
+    packets = advertisement.packets()
+    assert [len(decode(packet).rtes) for packet in packets] == [25, 25, 10]
+    # nothing changed, so the same packets come back
+    assert all(a is b for a, b in zip(advertisement.packets(), packets))
+
+    advertisement.set(RIP1_Route(routes[3].prefix, routes[3].next_hop, 5))
+    for route in routes[:30:2]:
+        advertisement.remove(route.prefix)
+    advertisement.remove(ip_network("192.168.0.0/24"))
+
+    expected = {int(route.prefix.network_address): 2 for route in routes[1:30:2] + routes[30:]}
+    expected[int(routes[3].prefix.network_address)] = 6
+    packets = advertisement.packets()
+    assert [len(decode(packet).rtes) for packet in packets] == [25, 20]
+    assert {rte.address: rte.metric for packet in packets for rte in decode(packet).rtes} == expected
+    assert len(advertisement) == len(expected)
+    assert advertisement.metric(routes[3].prefix) == 5
+
+
+def test_rip_response_cached(mock_fp, mocker):
+    rp = rip_interface(mock_fp, 100, response_pacing_ms=0)
+    asyncio.run(rp.send_response())
+    first = list(mock_fp.sent)
+    mock_fp.sent.clear()
+
+    export_routes = mocker.spy(rp, "export_routes")
+    asyncio.run(rp.send_response())
+    assert mock_fp.sent == first
+    export_routes.assert_not_called()
+
+    # a change patches the cached packets, looking at only the changed prefix
+    route = next(iter(rp.rib.items))
+    rp.rib.remove(route)
+    mock_fp.sent.clear()
+    asyncio.run(rp.send_response())
+    assert export_routes.call_args.args == ({route.prefix},)
+    assert len(sent_rtes(mock_fp)) == 99
+    assert int(route.prefix.network_address) not in sent_rtes(mock_fp)
+
+
+def rip_response(*rtes: tuple[str, int]) -> bytes:
+    return RIP_HEADER.pack(RIP_Command.RESPONSE, 1, 0) + b"".join(
+        RIP_RTE.pack(2, 0, int(ip_address(address)), 0, 0, metric) for address, metric in rtes
+    )
+
+
+def sent_by_link(fp) -> dict[tuple[str, str], dict[int, int]]:
+    rslt = {}
+    for dst_ip, interface, datagrams in fp.batches:
+        rtes = rslt.setdefault((dst_ip, interface), {})
+        rtes.update({rte.addr: rte.metric for data in datagrams for rte in dpkt.rip.RIP(bytes(data)).rtes})
+    return rslt
+
+
+def test_rip_split_horizon(mock_fp):
+    rp = RP_RIP1_Interface(
+        mock_fp,
+        response_pacing_ms=0,
+        interfaces=[
+            {"name": "eth0", "broadcast": "10.1.0.255"},
+            {"name": "eth1", "broadcast": "10.2.0.255", "poison_reverse": True},
+        ],
+    )
+    eth0, eth1 = rp.links
+
+    async def hear():
+        await rp._rp.handle_udp_bytes(rip_response(("20.0.0.0", 1)), ("10.1.0.2", 520), eth0)
+        await rp._rp.handle_udp_bytes(rip_response(("30.0.0.0", 2)), ("10.2.0.2", 520), eth1)
+        return await rp.send_response()
+
+    asyncio.run(hear())
+    net_20, net_30 = int(ip_address("20.0.0.0")), int(ip_address("30.0.0.0"))
+    # routes aren't advertised back where they came from, or are advertised there as unreachable
+    assert sent_by_link(mock_fp) == {
+        ("10.1.0.255", "eth0"): {net_30: 3},
+        ("10.2.0.255", "eth1"): {net_20: 2, net_30: RIP_MAX_METRIC},
+    }
+
+    # a route going away is news on eth0, but eth1 already had it as unreachable
+    mock_fp.batches.clear()
+    asyncio.run(rp._rp.handle_udp_bytes(rip_response(("30.0.0.0", RIP_MAX_METRIC)), ("10.2.0.2", 520), eth1))
+    assert asyncio.run(rp.send_triggered_update()) == 1
+    assert sent_by_link(mock_fp) == {("10.1.0.255", "eth0"): {net_30: RIP_MAX_METRIC}}
+
+
+def test_rip_links_reload(mock_fp):
+    rp = RP_RIP1_Interface(mock_fp)
+    assert [(link.name, rp.link_destination(link), link.port) for link in rp.links] == [(None, "172.24.0.255", 520)]
+
+    config = Config()
+    config.rp_rip1["interfaces"] = [{"name": "eth0", "broadcast": "10.1.0.255", "port": 5200}]
+    config.rp_rip1["poison_reverse"] = True
+    assert {"interfaces", "poison_reverse"} <= rp.reload(config)["settings"].keys()
+    (link,) = rp.links
+    assert (link.name, rp.link_destination(link), link.port, link.poison_reverse) == ("eth0", "10.1.0.255", 5200, True)
+    assert "interfaces" not in rp.reload(config)["settings"]
+
+
+def test_rip_refresh_unchanged(mock_fp):
+    rp = RP_RIP1_Interface(mock_fp)
+    for i in range(100):
+        route = RIP1_Route(ip_network(f"10.0.{i}.0/24"), ip_address("1.1.1.1"), 1)
+        route.status = RouteStatus.UP
+        rp.learn_route(route)
+    asyncio.run(rp.refresh_rib())
+    changes_total = rp.rib.changes_total
+    rp._triggered_update.clear()
+
+    # rebuilding the RIB from the same routes logs nothing, and has nothing to advertise
+    asyncio.run(rp.refresh_rib())
+    assert rp.rib.changes_total == changes_total
+    assert not rp._triggered_update.is_set()
+    assert {route.status for route in rp.rib.items} == {RouteStatus.UP}
+
+    # neither does a route only being heard again
+    route = next(iter(rp._learned_routes.items))
+    heard = RIP1_Route(route.prefix, route.next_hop, route.metric, status=RouteStatus.UP)
+    heard.last_updated = route.last_updated + 30
+    rp.learn_route(heard)
+    asyncio.run(rp.refresh_rib())
+    assert rp.rib.changes_total == changes_total
@@ -1,15 +1,23 @@
+import asyncio
 from ipaddress import ip_network, ip_address
 
 import pytest
 
 from rp_sla import SLA_Route
+from src.config import Config
 from src.rp_sla import RP_SLA
+from src.system import RouteStatus
 from generic.rib import Route
+from tests.test_config import get_path_to_config
 
 
 @pytest.fixture
 def mock_fp(mocker):
     mock_fp = mocker.Mock(name="fp")
+    # probes go out together, each answered as a single ping would be
+    mock_fp.ping_many.side_effect = lambda dest_ips, **kwargs: {
+        str(dest_ip): mock_fp.ping(dest_ip) for dest_ip in dest_ips
+    }
     return mock_fp
 
 
@@ -29,13 +37,30 @@ def test_rp_sla_evaluate(mock_rpb, mock_fp):
     mock_rpb.add_configured_route(route_a)
     mock_rpb.add_configured_route(route_b)
     mock_fp.ping.return_value = 0.075
-    mock_rpb.evaluate_routes()
+    asyncio.run(mock_rpb.evaluate_routes())
     configured_routes = mock_rpb.configured_routes
     assert len(configured_routes) == 2
     assert len(mock_rpb.up_routes) == 1
     assert mock_rpb.up_routes[0].next_hop == next_hop_a
 
 
+def test_rp_sla_probe_unchanged(mock_rpb, mock_fp):
+    route = SLA_Route(ip_network("0.0.0.0/0"), ip_address("1.1.1.1"), 1, 100)
+    mock_rpb.add_configured_route(route)
+    mock_fp.ping.return_value = 0.075
+    asyncio.run(mock_rpb.evaluate_routes())
+    version = mock_rpb.rib_version
+    # probed again with the same outcome, the RIB is left as it was
+    asyncio.run(mock_rpb.evaluate_routes())
+    assert mock_fp.ping.call_count == 2
+    assert mock_rpb.rib_version == version
+
+    mock_fp.ping.return_value = 0.5
+    asyncio.run(mock_rpb.evaluate_routes())
+    assert mock_rpb.rib_version > version
+    assert mock_rpb.up_routes == []
+
+
 def test_rp_sla_export(mock_rpb, mock_fp):
     prefix_a = ip_network("0.0.0.0/0")
     next_hop_a = ip_address("1.1.1.1")
@@ -59,10 +84,67 @@ def test_rp_sla_export(mock_rpb, mock_fp):
     mock_rpb.add_configured_route(route_c)
     mock_rpb.add_configured_route(route_d)
     mock_fp.ping.return_value = 0.075
-    mock_rpb.evaluate_routes()
+    asyncio.run(mock_rpb.evaluate_routes())
     assert len(mock_rpb.configured_routes) == 4
     assert len(mock_rpb.up_routes) == 2
 
     exported_routes = mock_rpb.redistribute_out()
     assert len(exported_routes) == 2
     # assert exported_routes == {route_a, route_d}
+
+
+def test_rp_sla_export_ecmp(mock_rpb, mock_fp):
+    prefix = ip_network("0.0.0.0/0")
+    route_a = SLA_Route(prefix, ip_address("1.1.1.3"), 2, 100)
+    route_b = SLA_Route(prefix, ip_address("1.1.1.1"), 2, 100)
+    route_c = SLA_Route(prefix, ip_address("1.1.1.2"), 2, 100)
+    route_d = SLA_Route(prefix, ip_address("1.1.1.4"), 1, 100)
+    for route in (route_a, route_b, route_c, route_d):
+        mock_rpb.add_configured_route(route)
+    mock_fp.ping.return_value = 0.075
+    asyncio.run(mock_rpb.evaluate_routes())
+
+    exported_routes = mock_rpb.redistribute_out()
+    assert [route.next_hop for route in exported_routes] == [
+        "1.1.1.1",
+        "1.1.1.2",
+        "1.1.1.3",
+    ]
+
+    mock_rpb.max_paths = 2
+    exported_routes = mock_rpb.redistribute_out()
+    assert [route.next_hop for route in exported_routes] == ["1.1.1.1", "1.1.1.2"]
+
+
+def test_rp_sla_reload(mock_fp):
+    config = Config()
+    config.load(get_path_to_config("integration_rp_sla.toml"))
+    rpb = RP_SLA.from_config(config, mock_fp, cp_id=None)
+    mock_fp.ping.return_value = 0.0001
+    asyncio.run(rpb.evaluate_routes())
+    kept_route = next(
+        route for route in rpb.configured_routes if route.next_hop == "1.1.1.2"
+    )
+
+    new_config = Config()
+    new_config.load(get_path_to_config("integration_rp_sla.toml"))
+    routes = new_config.rp_sla["routes"]
+    removed_route = routes.pop()
+    routes[0]["priority"] = 10
+    routes.append(
+        {"prefix": "10.0.0.0/8", "next_hop": "1.1.1.9", "priority": 1, "threshold_ms": 1}
+    )
+    new_config.rp_sla["admin_distance"] = 5
+
+    rslt = rpb.reload(new_config)
+    assert rslt["settings"] == {"admin_distance": 5}
+    assert rslt["routes"]["removed"] == [
+        [removed_route["prefix"], removed_route["next_hop"]]
+    ]
+    assert rslt["routes"]["added"] == [["10.0.0.0/8", "1.1.1.9"]]
+    assert rslt["routes"]["changed"] == [["0.0.0.0/0", "1.1.1.1"]]
+    assert len(rpb.configured_routes) == 5
+    assert rpb.admin_distance == 5
+    # routes that weren't touched keep their state
+    assert kept_route in rpb.configured_routes
+    assert kept_route.status == RouteStatus.UP
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from ipaddress import ip_address, ip_network
+
+from generic.rib import Route
+from generic.streaming import ndjson_response
+from rp_rip1.main import RIP1_Route
+from src.system import SourceCode
+
+
+async def _body(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_ndjson_response():
+    routes = [
+        Route(ip_network(f"10.{i}.0.0/16"), ip_address("192.0.2.1")) for i in range(200)
+    ]
+    response = ndjson_response(routes, headers={"ETag": '"v1"'})
+    assert response.media_type == "application/x-ndjson"
+    assert response.headers["ETag"] == '"v1"'
+
+    lines = asyncio.run(_body(response)).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [route.as_json for route in routes]
+
+
+def test_ndjson_response_enum_fields():
+    route = RIP1_Route(
+        ip_network("10.0.0.0/8"),
+        ip_address("192.0.2.1"),
+        metric=1,
+        route_source=SourceCode.RIP1,
+    )
+    body = asyncio.run(_body(ndjson_response([route])))
+    assert json.loads(body)["route_source"] == SourceCode.RIP1.value
+
+
+def test_route_events():
+    from src.control_plane.route import CP_RIB
+    from src.generic.streaming import route_events
+
+    def route(prefix):
+        return {
+            "prefix": ip_network(prefix),
+            "next_hop": ip_address("192.0.2.1"),
+            "route_source": SourceCode.STATIC,
+            "admin_distance": 1,
+        }
+
+    def parse(event: bytes):
+        fields = dict(line.split(": ", 1) for line in event.decode().strip().splitlines())
+        return fields["event"], fields["id"], json.loads(fields["data"])
+
+    rib = CP_RIB()
+    rib.add(route("10.0.0.0/8"))
+
+    async def run():
+        events = route_events(lambda: rib, keepalive=1)
+        name, event_id, data = parse(await anext(events))
+        assert name == "snapshot"
+        assert [r["prefix"] for r in data["routes"]] == ["10.0.0.0/8"]
+
+        # a burst of changes goes out as one delta
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0)
+        rib.add(route("11.0.0.0/8"))
+        rib.remove(rib.route_type(**route("10.0.0.0/8")))
+        name, event_id, data = parse(await pending)
+        assert name == "delta"
+        assert data["version"] == rib.version
+        assert [(c["op"], c["route"]["prefix"]) for c in data["changes"]] == [
+            ("add", "11.0.0.0/8"),
+            ("remove", "10.0.0.0/8"),
+        ]
+        assert await anext(events) == b": keepalive\n\n"
+        await events.aclose()
+
+        # resuming from the last event id picks up from there, without a snapshot
+        rib.add(route("12.0.0.0/8"))
+        resumed = route_events(lambda: rib, last_event_id=event_id)
+        name, _, data = parse(await anext(resumed))
+        assert name == "delta"
+        assert [c["route"]["prefix"] for c in data["changes"]] == ["12.0.0.0/8"]
+        await resumed.aclose()
+
+    asyncio.run(run())
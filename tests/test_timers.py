@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+from src.generic.timers import PeriodicTimer, TimerWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_timer_wheel():
+    clock = Clock()
+    wheel = TimerWheel(1, 10, clock=clock)
+    wheel.arm("a", 1003)
+    wheel.arm("b", 1005.5)
+    wheel.arm("c", 1005)
+    assert len(wheel) == 3
+    assert wheel.deadline("b") == 1006
+
+    assert wheel.expired(1002.9) == []
+    assert wheel.expired(1003) == ["a"]
+    assert "a" not in wheel
+    assert sorted(wheel.expired(1006)) == ["b", "c"]
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_rearm():
+    clock = Clock()
+    wheel = TimerWheel(1, 10, clock=clock)
+    wheel.arm("a", 1003)
+    wheel.arm("b", 1003)
+    # pushed back: the entry left in the old slot is skipped
+    wheel.arm("a", 1008)
+    wheel.cancel("b")
+    assert wheel.expired(1005) == []
+    assert wheel.expired(1008) == ["a"]
+    # armed in the past, it comes due on the next tick
+    wheel.arm("c", 900)
+    clock.now = 1009
+    assert wheel.expired() == ["c"]
+
+
+def test_timer_wheel_long_deadlines():
+    wheel = TimerWheel(1, 10, clock=Clock())
+    # longer than a turn of the wheel: it waits in its slot for a turn
+    wheel.arm("a", 1025)
+    wheel.arm("b", 1004)
+    assert wheel.expired(1015) == ["b"]
+    assert wheel.expired(1024) == []
+    # far past the deadline, the whole wheel is visited once
+    assert wheel.expired(5000) == ["a"]
+
+
+def test_timer_wheel_invalid():
+    with pytest.raises(ValueError):
+        TimerWheel(0, 10)
+
+
+def test_periodic_timer_drift():
+    lateness = []
+    timer = PeriodicTimer(0.05, on_late=lateness.append)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(5):
+            await timer.wait()
+            # the job's own time isn't added to the interval
+            await asyncio.sleep(0.02)
+        return loop.time() - start
+
+    # four intervals from the first run, plus the last job
+    assert asyncio.run(run()) == pytest.approx(0.22, abs=0.03)
+    assert len(lateness) == 5
+    assert all(0 <= late < 0.03 for late in lateness)
+
+
+def test_periodic_timer_late():
+    lateness = []
+    timer = PeriodicTimer(0.05, on_late=lateness.append)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        await timer.wait()
+        # a blocked loop makes the next run late: it runs as soon as it can, and the runs it missed are skipped
+        time.sleep(0.12)
+        await timer.wait()
+        woke = loop.time()
+        assert timer.next_due == pytest.approx(woke + 0.05)
+
+    asyncio.run(run())
+    assert lateness[1] == pytest.approx(0.07, abs=0.02)
+
+
+def test_periodic_timer_jitter(mocker):
+    uniform = mocker.patch("random.uniform", return_value=1.1)
+    timer = PeriodicTimer(lambda: 30, jitter=1 / 6)
+
+    async def run():
+        await timer.wait()
+        return asyncio.get_running_loop().time()
+
+    woke = asyncio.run(run())
+    uniform.assert_called_once_with(pytest.approx(5 / 6), pytest.approx(7 / 6))
+    assert timer.next_due == pytest.approx(woke + 33, abs=0.01)
+    with pytest.raises(ValueError):
+        PeriodicTimer(30, jitter=1)
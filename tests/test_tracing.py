@@ -0,0 +1,49 @@
+import asyncio
+
+from src.generic.tracing import (
+    TRACER,
+    TRACE_ID_HEADER,
+    PARENT_SPAN_ID_HEADER,
+    span,
+    trace_headers,
+    breakdown,
+)
+
+
+def test_tracing_propagation():
+    TRACER.configure("test", buffer_size=100)
+
+    async def child():
+        async with span("child"):
+            await asyncio.sleep(0)
+            return trace_headers()
+
+    async def run():
+        with span("root") as root:
+            headers = await asyncio.create_task(child())
+        return root, headers
+
+    root, headers = asyncio.run(run())
+    assert trace_headers() == {}
+    assert headers[TRACE_ID_HEADER] == root.trace_id
+
+    spans = TRACER.buffer.query(trace_id=root.trace_id)
+    assert [s["name"] for s in spans] == ["child", "root"]
+    assert spans[0]["parent_id"] == root.span_id
+    assert headers[PARENT_SPAN_ID_HEADER] == spans[0]["span_id"]
+
+    # a span from another service, continuing the trace from the headers
+    with span(
+        "remote",
+        trace_id=headers[TRACE_ID_HEADER],
+        parent_id=headers[PARENT_SPAN_ID_HEADER],
+    ):
+        pass
+
+    tree = breakdown(TRACER.buffer.query(trace_id=root.trace_id))
+    assert [(s["depth"], s["name"]) for s in tree] == [
+        (0, "root"),
+        (1, "child"),
+        (2, "remote"),
+    ]
+    assert TRACER.buffer.query(trace_id=root.trace_id, limit=1)[0]["name"] == "remote"